@@ -0,0 +1,340 @@
+# backtest.py
+# Offline hindcasts of the rain and temperature / wind category models against stored history.
+# Every day of every target year is forecast from the preceding ROLLING_YEARS (as /predict_all would
+# have on that day) and scored against what was observed; a whole grid of model presets is scored in
+# one vectorized pass per location, locations in parallel in a process pool.
+#   python backtest.py --region georgia                       # every ingested cell of a region store
+#   python backtest.py --locations 41.7,44.8 42.25,42.7 --start-year 2010 --end-year 2024
+#   python backtest.py --region georgia --smooth 7,10,13,20 --persistence none,0,0.2,0.4 --json bt.json
+# Scores: Brier score with its reliability / resolution / uncertainty decomposition and reliability
+# diagram bins (rain: P_rain_final vs wet day), multi-category Brier score (temperature / wind).
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import temp
+from history import FIRST_POWER_YEAR
+from region_store import REGIONS_DIR, RegionStore
+
+# =========================
+# === PRESETS (EDITABLE) ==
+# =========================
+DEFAULT_SMOOTH = (7, 10, 13, 16, 20)
+DEFAULT_TW = (5, 10, 15)
+DEFAULT_YESTERDAY = ("yday_climo", "prev_year_yesterday")
+DEFAULT_BLEND = ("equal", "sample_weighted")
+DEFAULT_PERSISTENCE = (None, 0.0, 0.1, 0.2, 0.3, 0.5)   # None: blend by BLEND_MODE instead of a fixed weight
+RELIABILITY_BINS = 10
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+# =========================
+# === CONFIG GRID =========
+# =========================
+def rain_configs(smooth, yesterday, blend, persistence):
+    """Rain presets in scoring order: smooth x yesterday x (blend modes when no weight, else each weight)."""
+    blend_specs = [(mode, None) for mode in blend if None in persistence] + [(None, w) for w in persistence if w is not None]
+    return [{"smooth_window_days": s, "yesterday_inference": y, "blend_mode": mode, "persistence_weight": w}
+            for s, y, (mode, w) in itertools.product(smooth, yesterday, blend_specs)]
+
+
+def current_rain_config():
+    w = temp.PERSISTENCE_WEIGHT
+    return {"smooth_window_days": temp.SMOOTH_WINDOW_DAYS, "yesterday_inference": temp.YESTERDAY_INFERENCE,
+            "blend_mode": temp.BLEND_MODE if w is None else None, "persistence_weight": w}
+
+
+# =========================
+# === ONE LOCATION ========
+# =========================
+def new_scores(n_rain, n_tw, bins=RELIABILITY_BINS):
+    """Additive score sums (merged across locations by adding)."""
+    return {
+        "n": np.zeros(n_rain, dtype=np.int64),
+        "sum_sq": np.zeros(n_rain),
+        "sum_obs": np.zeros(n_rain),
+        "bin_n": np.zeros((n_rain, bins), dtype=np.int64),
+        "bin_p": np.zeros((n_rain, bins)),
+        "bin_obs": np.zeros((n_rain, bins)),
+        "cat_n": np.zeros((n_tw, len(temp.CATEGORY_VARIABLES)), dtype=np.int64),
+        "cat_sum_sq": np.zeros((n_tw, len(temp.CATEGORY_VARIABLES))),
+    }
+
+
+def load_history(location, first_year, last_year, region_path=None):
+    lat, lon = location
+    if region_path is not None:
+        history = RegionStore(region_path).history(lat, lon, pd.Timestamp(first_year, 1, 1),
+                                                   pd.Timestamp(last_year, 12, 31))
+        if history is None:
+            raise RuntimeError(f"region store does not cover {first_year}..{last_year} here")
+        return history
+    return temp.load_history(lat, lon, f"{first_year}0101", f"{last_year}1231")
+
+
+def score_rain(scores, p, ok, wet, offset, bins):
+    """Accumulate forecasts p (configs, days) of configs offset.. against wet (days,), NaN = unobserved."""
+    use = ok[None, :] & ~np.isnan(p) & ~np.isnan(wet)[None, :]
+    obs = np.where(np.isnan(wet), 0.0, wet)[None, :]
+    p0 = np.where(use, p, 0.0)
+    rows = slice(offset, offset + p.shape[0])
+    scores["n"][rows] += use.sum(axis=1)
+    scores["sum_sq"][rows] += (np.where(use, (p0 - obs) ** 2, 0.0)).sum(axis=1)
+    scores["sum_obs"][rows] += (use * obs).sum(axis=1)
+    b = np.minimum((p0 * bins).astype(int), bins - 1)
+    flat = (np.arange(p.shape[0])[:, None] * bins + b)[use]
+    size = p.shape[0] * bins
+    scores["bin_n"][rows] += np.bincount(flat, minlength=size).reshape(p.shape[0], bins)
+    scores["bin_p"][rows] += np.bincount(flat, weights=p0[use], minlength=size).reshape(p.shape[0], bins)
+    scores["bin_obs"][rows] += np.bincount(flat, weights=np.broadcast_to(obs, p.shape)[use],
+                                           minlength=size).reshape(p.shape[0], bins)
+
+
+def backtest_location(location, target_years, grid, region_path=None, rolling_years=temp.ROLLING_YEARS,
+                      bins=RELIABILITY_BINS):
+    """Score sums of every config for one location over every day of target_years."""
+    smooth, tws, yesterday, blend, persistence = (grid[k] for k in ("smooth", "tw", "yesterday", "blend", "persistence"))
+    configs = rain_configs(smooth, yesterday, blend, persistence)
+    n_blend = len(configs) // (len(smooth) * len(yesterday))
+    modes = [mode for mode in blend if None in persistence]
+    weights = np.array([w for w in persistence if w is not None], dtype=float)
+    scores = new_scores(len(configs), len(tws), bins)
+
+    first_year = max(FIRST_POWER_YEAR, min(target_years) - rolling_years)
+    history = load_history(location, first_year, max(target_years), region_path)
+    stats = {tw: temp.HistoryStats(last_n_years=rolling_years, half_window_days=tw) for tw in tws}
+    base = stats[tws[0]]    # rain / markov sums do not depend on the category kernel
+
+    for year in sorted(target_years):
+        _, _, hist_start, hist_end = temp.compute_history_window(f"{year}-01-01", rolling_years=rolling_years)
+        for st in stats.values():
+            for y in [y for y in st.years if y < hist_start or y > hist_end]:
+                st.drop(y)
+        for y in range(hist_start, hist_end + 1):
+            if y in base.years:
+                continue
+            ys = temp.year_stats(history, y, half_window_days=tws[0])
+            if ys is None:
+                continue
+            for tw, st in stats.items():
+                if tw != tws[0]:
+                    ys = {**ys, "categories": {
+                        v: temp.year_category_probs(history, y, col, cats, fn, half_window_days=tw)
+                        for v, (col, cats, fn) in temp.CATEGORY_VARIABLES.items() if col in history}}
+                st.add(ys)
+        if not base.years:
+            continue
+
+        dates = pd.date_range(pd.Timestamp(year, 1, 1), pd.Timestamp(year, 12, 31), freq="D")
+        target = history.slice(dates[0], dates[-1])
+        if len(target) == 0:
+            continue
+        dates = target.dates
+        precip = target["PRECTOTCORR"].astype(float)
+        wet = np.where(np.isnan(precip), np.nan, (precip >= temp.NO_RAIN_THRESHOLD).astype(float))
+
+        # Rows shared by every config
+        i_target = np.minimum(dates.dayofyear.to_numpy(), 365) - 1
+        yday = dates - pd.Timedelta(days=1)
+        i_yday = np.minimum(yday.dayofyear.to_numpy(), 365) - 1
+        m = dates.month.to_numpy() - 1
+        markov = {k: v[m] for k, v in temp.markov_probs(base.markov).items()}
+        wet_prev = base.recent_wet(hist_end).reindex(yday - pd.DateOffset(years=1)).to_numpy(dtype=float)
+
+        for i_s, s in enumerate(smooth):
+            table = temp.rain_table(base.rain, half_width=s)
+            p_tab, n_tab = table["p_climo"].to_numpy(), table["n_climo"].to_numpy()
+            p_climo, n_climo, p_yday, n_yday = p_tab[i_target], n_tab[i_target], p_tab[i_yday], n_tab[i_yday]
+            for i_y, y_mode in enumerate(yesterday):
+                p_markov, n_den, use_climo = temp.yesterday_markov(p_climo, p_yday, markov, wet_prev, y_mode)
+                ok = (n_climo > 0) & ~(use_climo & (n_yday == 0))
+                rows = [temp.blend_probs_array(p_climo, p_markov, mode=mode, n_climo=n_climo, n_markov=n_den)
+                        for mode in modes]
+                if len(weights):
+                    rows.extend(temp.blend_probs_array(p_climo[None, :], p_markov[None, :],
+                                                       w_persist=weights[:, None]))
+                score_rain(scores, np.vstack(rows), ok, wet, (i_s * len(yesterday) + i_y) * n_blend, bins)
+
+        # Temperature / wind categories: multi-category Brier score per kernel half-width
+        md_rows = temp.MONTH_DAYS.get_indexer(dates.strftime("2000-%m-%d"))
+        for i_tw, tw in enumerate(tws):
+            for i_v, (variable, (column, categories, categorizer)) in enumerate(temp.CATEGORY_VARIABLES.items()):
+                mean = stats[tw].category_means(hist_end, variable)
+                if mean is None or column not in target:
+                    continue
+                p = mean[md_rows] / 100.0
+                codes = temp.category_codes(target[column], categories, categorizer)
+                use = (codes >= 0) & ~np.isnan(p).any(axis=1)
+                onehot = codes[:, None] == np.arange(len(categories))[None, :]
+                scores["cat_n"][i_tw, i_v] += int(use.sum())
+                scores["cat_sum_sq"][i_tw, i_v] += float(((p[use] - onehot[use]) ** 2).sum())
+    return scores
+
+
+def _worker(args):
+    location, target_years, grid, region_path, rolling_years, bins = args
+    t0 = time.perf_counter()
+    return backtest_location(location, target_years, grid, region_path, rolling_years, bins), time.perf_counter() - t0
+
+
+# =========================
+# === SUMMARY =============
+# =========================
+def summarize(scores, grid):
+    """Per-config metrics from merged score sums."""
+    configs = rain_configs(grid["smooth"], grid["yesterday"], grid["blend"], grid["persistence"])
+    rain = []
+    for c, config in enumerate(configs):
+        n = int(scores["n"][c])
+        if n == 0:
+            continue
+        base_rate = scores["sum_obs"][c] / n
+        bin_n = scores["bin_n"][c]
+        filled = bin_n > 0
+        p_mean = scores["bin_p"][c][filled] / bin_n[filled]
+        o_freq = scores["bin_obs"][c][filled] / bin_n[filled]
+        brier = scores["sum_sq"][c] / n
+        uncertainty = base_rate * (1.0 - base_rate)
+        rain.append({
+            **config,
+            "n": n,
+            "brier": float(brier),
+            "brier_skill": float(1.0 - brier / uncertainty) if uncertainty > 0 else None,
+            "reliability": float((bin_n[filled] * (p_mean - o_freq) ** 2).sum() / n),
+            "resolution": float((bin_n[filled] * (o_freq - base_rate) ** 2).sum() / n),
+            "uncertainty": float(uncertainty),
+            "bins": [{"p_lo": float(b / len(bin_n)), "p_mean": float(pm), "observed": float(of), "n": int(k)}
+                     for b, pm, of, k in zip(np.flatnonzero(filled), p_mean, o_freq, bin_n[filled])],
+        })
+    rain.sort(key=lambda r: r["brier"])
+    categories = []
+    for i_tw, tw in enumerate(grid["tw"]):
+        row = {"tw_half_window_days": tw}
+        for i_v, variable in enumerate(temp.CATEGORY_VARIABLES):
+            n = int(scores["cat_n"][i_tw, i_v])
+            row[variable] = {"n": n, "brier": float(scores["cat_sum_sq"][i_tw, i_v] / n) if n else None}
+        categories.append(row)
+    return {"rain": rain, "categories": categories}
+
+
+def report(summary, top):
+    current = current_rain_config()
+    rain = summary["rain"]
+    print(f"\nRain (P_rain_final vs wet day), best {min(top, len(rain))} of {len(rain)} configs by Brier score:")
+    print(f"  {'smooth':>6}  {'yesterday':<20} {'blend':<16} {'w':>5}  {'brier':>8} {'BSS':>7} {'rel':>8} {'res':>8}")
+    shown = rain[:top] + [r for r in rain[top:] if all(r[k] == v for k, v in current.items())]
+    for r in shown:
+        mark = "*" if all(r[k] == v for k, v in current.items()) else " "
+        w = "-" if r["persistence_weight"] is None else f"{r['persistence_weight']:.2f}"
+        bss = "-" if r["brier_skill"] is None else f"{r['brier_skill']:.4f}"
+        print(f"{mark} {r['smooth_window_days']:>6}  {r['yesterday_inference']:<20} {r['blend_mode'] or '-':<16} {w:>5}"
+              f"  {r['brier']:.5f} {bss:>7} {r['reliability']:.5f} {r['resolution']:.5f}")
+    print("  (* = current presets)")
+    print("\nTemperature / wind (multi-category Brier score):")
+    for row in summary["categories"]:
+        cells = "   ".join(f"{v} {row[v]['brier']:.5f} (n={row[v]['n']})" for v in temp.CATEGORY_VARIABLES
+                           if row[v]["brier"] is not None)
+        mark = "*" if row["tw_half_window_days"] == temp.TW_HALF_WINDOW_DAYS else " "
+        print(f"{mark} tw={row['tw_half_window_days']:<3} {cells}")
+
+
+# =========================
+# === MAIN ================
+# =========================
+def parse_list(text, cast):
+    return tuple(None if x.strip().lower() == "none" else cast(x) for x in text.split(",") if x.strip())
+
+
+def region_locations(name, root, max_locations, seed=0):
+    store = RegionStore(os.path.join(root, name))
+    cells = store.cells()[np.asarray(store.done, dtype=bool)]
+    if max_locations and len(cells) > max_locations:
+        cells = cells[np.sort(np.random.default_rng(seed).choice(len(cells), max_locations, replace=False))]
+    return [tuple(map(float, c)) for c in cells], store
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Hindcast scores of model presets over many locations and dates.")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--region", help="score every ingested cell of this region store (no network)")
+    src.add_argument("--locations", nargs="+", metavar="LAT,LON", help="points read via load_history")
+    ap.add_argument("--root", default=REGIONS_DIR, help="regions directory (WIR_REGIONS_DIR)")
+    ap.add_argument("--max-locations", type=int, default=0, help="random subset of region cells (0 = all)")
+    ap.add_argument("--start-year", type=int, help="first target year (default: first with a full history window)")
+    ap.add_argument("--end-year", type=int, help="last target year (default: last complete year)")
+    ap.add_argument("--smooth", default=",".join(map(str, DEFAULT_SMOOTH)), help="SMOOTH_WINDOW_DAYS values")
+    ap.add_argument("--tw", default=",".join(map(str, DEFAULT_TW)), help="TW_HALF_WINDOW_DAYS values")
+    ap.add_argument("--yesterday", default=",".join(DEFAULT_YESTERDAY), help="YESTERDAY_INFERENCE values")
+    ap.add_argument("--blend", default=",".join(DEFAULT_BLEND), help="BLEND_MODE values (used when weight is none)")
+    ap.add_argument("--persistence", default=",".join("none" if w is None else str(w) for w in DEFAULT_PERSISTENCE),
+                    help="PERSISTENCE_WEIGHT values ('none' = blend by BLEND_MODE)")
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="processes (locations run in parallel)")
+    ap.add_argument("--bins", type=int, default=RELIABILITY_BINS, help="reliability diagram bins")
+    ap.add_argument("--top", type=int, default=15, help="configs printed")
+    ap.add_argument("--json", metavar="PATH", help="write all scores and reliability bins as JSON")
+    args = ap.parse_args()
+
+    grid = {
+        "smooth": parse_list(args.smooth, int),
+        "tw": parse_list(args.tw, int),
+        "yesterday": parse_list(args.yesterday, str),
+        "blend": parse_list(args.blend, str),
+        "persistence": parse_list(args.persistence, float),
+    }
+    region_path = None
+    if args.region:
+        locations, store = region_locations(args.region, args.root, args.max_locations)
+        region_path = store.path
+        first_year, last_year = store.start_year + temp.ROLLING_YEARS, store.end_year
+    else:
+        locations = [tuple(float(v) for v in loc.split(",")) for loc in args.locations]
+        first_year, last_year = FIRST_POWER_YEAR + temp.ROLLING_YEARS, pd.Timestamp.today().year - 1
+    target_years = list(range(args.start_year or first_year, (args.end_year or last_year) + 1))
+    if not locations or not target_years:
+        sys.exit("Nothing to score: no locations or no target years.")
+
+    n_configs = len(rain_configs(grid["smooth"], grid["yesterday"], grid["blend"], grid["persistence"]))
+    print(f"{len(locations)} locations x {len(target_years)} years ({target_years[0]}..{target_years[-1]}), "
+          f"{n_configs} rain configs, {len(grid['tw'])} category kernels, {args.workers} workers")
+    t0 = time.perf_counter()
+    total = new_scores(n_configs, len(grid["tw"]), args.bins)
+    failures = {}
+    tasks = {loc: (loc, target_years, grid, region_path, temp.ROLLING_YEARS, args.bins) for loc in locations}
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(_worker, task): loc for loc, task in tasks.items()}
+        for n, fut in enumerate(as_completed(futures), 1):
+            lat, lon = futures[fut]
+            try:
+                scores, elapsed = fut.result()
+            except Exception as e:
+                failures[(lat, lon)] = str(e)
+                print(f"[{n}/{len(locations)}] FAIL  ({lat:.3f}, {lon:.3f})  {e}")
+                continue
+            for k in total:
+                total[k] += scores[k]
+            print(f"[{n}/{len(locations)}] ok    ({lat:.3f}, {lon:.3f})  {elapsed:6.2f} s")
+    elapsed = time.perf_counter() - t0
+
+    summary = summarize(total, grid)
+    report(summary, args.top)
+    hindcasts = int(total["n"].max()) if len(total["n"]) else 0
+    print(f"\n{hindcasts} scored hindcast days per config, {hindcasts * n_configs} forecasts in {elapsed:.1f} s"
+          + (f"; {len(failures)} locations failed" if failures else ""))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"grid": grid, "locations": len(locations) - len(failures), "target_years": target_years,
+                       "current": current_rain_config(), **summary,
+                       "failures": [{"lat": lat, "lon": lon, "error": e} for (lat, lon), e in failures.items()]},
+                      f, indent=1)
+    sys.exit(1 if failures and len(failures) == len(locations) else 0)
+
+
+if __name__ == "__main__":
+    main()
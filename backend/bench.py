@@ -0,0 +1,480 @@
+# bench.py
+# Offline benchmarks for temp.py: model microbenchmarks, /predict_all latency (cold / warm tiers) and
+# throughput under concurrent load. A local NASA POWER stand-in serves synthetic histories shaped like
+# the real API, so no network is needed and runs are reproducible.
+#   python bench.py                                  -> human-readable table (all suites)
+#   python bench.py --suites micro --repeat 50
+#   python bench.py --json results.json              -> machine-readable results
+#   python bench.py --compare baseline.json          -> exit 1 if anything is slower than the baseline
+#   python bench.py --serve-fake 8765                -> only run the stand-in (WIR_POWER_URL=http://127.0.0.1:8765)
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+import requests
+from werkzeug.serving import make_server
+
+import power_client
+import temp
+from power_cache import PowerCache
+from shared_store import SharedStore
+
+# =========================
+# === PRESETS (EDITABLE) ==
+# =========================
+SUITES = ("micro", "latency", "load")
+BENCH_DATE = "2025-06-10"
+FAKE_FIRST_YEAR = 1981              # POWER daily coverage starts in 1981
+LATENCY_LOCATIONS = 8               # distinct grid cells per cold / warm latency tier
+LOAD_LOCATIONS = 16
+LOAD_CONCURRENCY = (1, 4, 16)
+LOAD_REQUESTS = 400                 # per concurrency level
+REGRESSION_TOLERANCE = 0.25         # --compare: flag medians more than 25% above the baseline
+
+
+def synthetic_history(start_year=2005, end_year=2024, seed=0):
+    """Daily frame with the same columns / index as fetch_power (seasonal rain, temperature and wind)."""
+    idx = pd.date_range(f"{start_year}-01-01", f"{end_year}-12-31", freq="D")
+    rng = np.random.default_rng(seed)
+    season = np.sin(2 * np.pi * (idx.dayofyear.to_numpy() - 100) / 365.0)
+    wet = rng.random(len(idx)) < 0.30 + 0.15 * season
+    precip = np.where(wet, rng.gamma(0.8, 8.0, len(idx)), rng.random(len(idx)) * 0.4)
+    t_max = 12.0 + 14.0 * season + rng.normal(0.0, 4.0, len(idx))
+    wind = np.abs(rng.normal(5.0, 2.5, len(idx)))
+    return pd.DataFrame({
+        "PRECTOTCORR": precip.round(2),
+        "T2M": (t_max - 4.0).round(2),
+        "T2M_MAX": t_max.round(2),
+        "T2M_MIN": (t_max - 8.0).round(2),
+        "WS10M_MAX": wind.round(2),
+    }, index=idx)
+
+
+def timeit(fn, repeat):
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples)
+
+
+def summarize(samples):
+    samples = np.array(samples) * 1000.0
+    return {"median_ms": float(np.median(samples)), "p90_ms": float(np.percentile(samples, 90)), "n": len(samples)}
+
+
+# Pre-vectorization reference: one Python call per row
+def seasonal_window_apply(df, target_doy, half_width):
+    def dist(d1, d2):
+        raw = abs(d1 - d2)
+        return min(raw, 365 - raw)
+    return df[df["doy"].apply(lambda d: dist(d, target_doy) <= half_width)]
+
+
+def power_json(df):
+    keys = df.index.strftime("%Y%m%d")
+    return json.dumps({"properties": {"parameter": {c: dict(zip(keys, df[c].tolist())) for c in df.columns}}}).encode("utf-8")
+
+
+def power_csv(df):
+    rows = df.copy()
+    rows.insert(0, "DY", df.index.day)
+    rows.insert(0, "MO", df.index.month)
+    rows.insert(0, "YEAR", df.index.year)
+    return "-BEGIN HEADER-\nNASA/POWER synthetic\n-END HEADER-\n" + rows.to_csv(index=False)
+
+
+def power_payloads(df):
+    """The history as POWER would send it: JSON bytes and CSV text, plus the requested start / end."""
+    start, end = df.index[0].strftime("%Y%m%d"), df.index[-1].strftime("%Y%m%d")
+    return power_json(df), power_csv(df), start, end
+
+
+# Pre-fast-path reference: r.json(), DataFrame of dicts, 7,300 date strings, apply(to_numeric)
+def parse_power_reference(raw):
+    df = pd.DataFrame(json.loads(raw)["properties"]["parameter"])
+    df.index = pd.to_datetime(df.index)
+    df = df.apply(pd.to_numeric, errors="coerce").sort_index().astype(np.float32)
+    return df.mask(df == temp.POWER_FILL_VALUE)
+
+
+def bench_parse(df, repeat):
+    raw, csv_text, start, end = power_payloads(df)
+    return {
+        "parse_power[reference]": timeit(lambda: parse_power_reference(raw), repeat),
+        "parse_power[json]": timeit(lambda: temp.parse_power_json(power_client.decode_json(raw), start, end), repeat),
+        "parse_power[csv]": timeit(lambda: temp.parse_power_csv(csv_text, start, end), repeat),
+    }
+
+
+def bench_seasonal(df, repeat):
+    target_doy = 161
+    return {
+        "seasonal_window[apply]": timeit(lambda: seasonal_window_apply(df, target_doy, temp.SMOOTH_WINDOW_DAYS), repeat),
+        "seasonal_window[mask]": timeit(lambda: temp.seasonal_window(df, target_doy, temp.SMOOTH_WINDOW_DAYS), repeat),
+        "seasonal_probs": timeit(lambda: temp.seasonal_probs(df, "2025-06-10"), repeat),
+        "monthly_markov": timeit(lambda: temp.monthly_markov(df), repeat),
+    }
+
+
+def bench_categories(history, repeat):
+    return {
+        "category_probabilities[T2M_MAX]": timeit(lambda: temp.category_probabilities_weighted_days(
+            history, "2025-06-10", "T2M_MAX", temp.TEMP_CATEGORIES, categorizer=temp.categorize_temp_simple), repeat),
+        "category_probabilities[WS10M_MAX]": timeit(lambda: temp.category_probabilities_weighted_days(
+            history, "2025-06-10", "WS10M_MAX", temp.WIND_CATEGORIES, categorizer=temp.categorize_wind_speed_ms), repeat),
+    }
+
+
+def bench_climatology(history, repeat):
+    end_year = history.end.year
+    clim = temp.build_climatology(history, end_year=end_year)
+    years = [temp.year_stats(history, y) for y in range(end_year, end_year - temp.ROLLING_YEARS, -1)]
+    return {
+        "build_climatology": timeit(lambda: temp.build_climatology(history, end_year=end_year), max(1, repeat // 4)),
+        "predict_from_climatology": timeit(lambda: temp.predict_from_climatology(clim, "2025-06-10"), repeat),
+        f"bootstrap_bands[{temp.BOOTSTRAP_REPLICATES}]": timeit(
+            lambda: temp.bootstrap_bands(clim, years, "2025-06-10"), repeat),
+    }
+
+
+def bench_grid(history, repeat, n_cells=2000):
+    """/predict_grid render of a moved viewport whose per-cell cube rows are already cached."""
+    end_year = history.end.year
+    clim = temp.build_climatology(history, end_year=end_year)
+    row = temp.climatology_row(clim, end_year)
+    cube = temp.stack_rows([row] * n_cells, end_year)
+    values = temp.grid_values(cube, "2025-06-10", "rain").reshape(40, n_cells // 40)
+    return {
+        f"stack_rows[{n_cells} cells]": timeit(lambda: temp.stack_rows([row] * n_cells, end_year),
+                                               max(1, repeat // 4)),
+        f"grid_values[{n_cells} cells]": timeit(lambda: temp.grid_values(cube, "2025-06-10", "rain"), repeat),
+        "grid png encode": timeit(lambda: temp.encode_png(temp.colorize(values), scale=4), repeat),
+    }
+
+
+def bench_rolling(history, repeat):
+    """Move a window forward by one year (the Jan 1 case): HistoryStats add + drop vs. a full rebuild."""
+    end_year = history.end.year
+    n = temp.ROLLING_YEARS - 1            # synthetic history is exactly 20 years: roll 19-year windows
+    samples = []
+    for _ in range(max(1, repeat // 4)):
+        stats = temp.HistoryStats(last_n_years=n)
+        for y in range(end_year - n, end_year):
+            stats.add(temp.year_stats(history, y))
+        t0 = time.perf_counter()
+        stats.drop(end_year - n)
+        stats.add(temp.year_stats(history, end_year))
+        stats.climatology(end_year)
+        samples.append(time.perf_counter() - t0)
+    window = history.slice(pd.Timestamp(end_year - n + 1, 1, 1), history.end)
+    return {
+        "HistoryStats[roll 1 year]": summarize(samples),
+        "build_climatology[rebuild]": timeit(lambda: temp.build_climatology(window, end_year, last_n_years=n),
+                                             max(1, repeat // 4)),
+    }
+
+
+# =========================
+# === FAKE NASA POWER =====
+# =========================
+class FakePower:
+    """
+    Local stand-in for GET {base}/daily/point: JSON or CSV (format=...) with the requested parameters
+    and date span, from a synthetic history seeded by the location, plus optional per-request latency.
+    """
+
+    def __init__(self, latency_ms=0.0, host="127.0.0.1", port=0):
+        self.latency_s = latency_ms / 1000.0
+        self.requests = 0
+        self.bytes_sent = 0
+        self._frames = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), _fake_handler(self))
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_port}"
+
+    def frame(self, lat, lon):
+        key = (round(lat, 4), round(lon, 4))
+        with self._lock:
+            df = self._frames.get(key)
+            if df is None:
+                seed = abs(hash(key)) % (2 ** 32)
+                df = self._frames[key] = synthetic_history(FAKE_FIRST_YEAR, pd.Timestamp.today().year, seed=seed)
+            return df
+
+    def payload(self, query):
+        lat, lon = float(query["latitude"]), float(query["longitude"])
+        start, end = pd.to_datetime(query["start"], format="%Y%m%d"), pd.to_datetime(query["end"], format="%Y%m%d")
+        df = self.frame(lat, lon).loc[start:end, query["parameters"].split(",")]
+        if query.get("format", "JSON").upper() == "CSV":
+            return power_csv(df).encode("utf-8"), "text/csv"
+        return power_json(df), "application/json"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _fake_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, like the real API behind the pooled client
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if not url.path.endswith("/point"):
+                return self._send(404, b"not found", "text/plain")
+            try:
+                body, content_type = fake.payload(query)
+            except (KeyError, ValueError) as e:
+                return self._send(422, str(e).encode("utf-8"), "text/plain")
+            if fake.latency_s:
+                time.sleep(fake.latency_s)
+            with fake._lock:
+                fake.requests += 1
+                fake.bytes_sent += len(body)
+            self._send(200, body, content_type)
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+# =========================
+# === SERVER BENCHMARKS ===
+# =========================
+class BenchServer:
+    """temp.app on a local port, reading the fake POWER with fresh caches under workdir."""
+
+    def __init__(self, fake, workdir):
+        temp.power_client = power_client.PowerClient(base_url=fake.url)
+        temp.power_cache = PowerCache(root=os.path.join(workdir, "power_cache")) if temp.USE_DISK_CACHE else None
+        temp.model_store = SharedStore(root=os.path.join(workdir, "model_store")) if temp.USE_SHARED_STORE else None
+        temp.USE_REGION_STORES = False
+        temp.clear_memory_caches()
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        self.server = make_server("127.0.0.1", 0, temp.app, threaded=True)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.session = requests.Session()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def predict(self, lat, lon, date_str, session=None):
+        t0 = time.perf_counter()
+        r = (session or self.session).post(f"{self.url}/predict_all",
+                                           json={"lat": lat, "lon": lon, "date_str": date_str}, timeout=120)
+        return time.perf_counter() - t0, r.status_code
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def bench_locations(n, offset=0):
+    """n points in distinct POWER grid cells (never the cell centre, so snapping is exercised)."""
+    return [(-40.0 + 1.5 * ((offset + i) % 50) + 0.1, -120.0 + 2.5 * ((offset + i) // 50) + 0.2) for i in range(n)]
+
+
+def bench_latency(server, fake, n=LATENCY_LOCATIONS):
+    """
+    /predict_all over HTTP, per cache tier:
+      cold         nothing cached: upstream fetch + parse + per-year stats + climatology
+      warm[disk]   process restarted: POWER years from the disk cache, stats from the shared store
+      warm[model]  climatology in memory, new date (response memo miss)
+      warm[memo]   identical request repeated
+    """
+    locations = bench_locations(n)
+    results = {}
+
+    def tier(name, date_str):
+        samples = []
+        for lat, lon in locations:
+            elapsed, status = server.predict(lat, lon, date_str)
+            if status != 200:
+                raise RuntimeError(f"/predict_all answered {status} in {name}")
+            samples.append(elapsed)
+        results[f"predict_all[{name}]"] = summarize(samples)
+
+    upstream_before = fake.requests
+    tier("cold", BENCH_DATE)
+    upstream_cold = fake.requests - upstream_before
+    temp.clear_memory_caches()
+    tier("warm:disk", BENCH_DATE)
+    tier("warm:model", "2025-06-11")
+    tier("warm:memo", "2025-06-11")
+    results["predict_all[cold]"]["upstream_requests"] = upstream_cold
+    return results
+
+
+def bench_load(server, concurrency_levels=LOAD_CONCURRENCY, n_requests=LOAD_REQUESTS, n_locations=LOAD_LOCATIONS):
+    """Throughput of warm /predict_all traffic (memo misses over a week of dates) per client concurrency."""
+    locations = bench_locations(n_locations, offset=LATENCY_LOCATIONS)
+    for lat, lon in locations:
+        server.predict(lat, lon, BENCH_DATE)   # climatologies in memory; the load measures serving, not fetching
+    dates = [str(d.date()) for d in pd.date_range(BENCH_DATE, periods=7, freq="D")]
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        lat, lon = locations[i % len(locations)]
+        return server.predict(lat, lon, dates[(i // len(locations)) % len(dates)], local.session)
+
+    results = {}
+    for c in concurrency_levels:
+        temp.clear_memory_caches()
+        for lat, lon in locations:
+            server.predict(lat, lon, BENCH_DATE)
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=c) as pool:
+            out = list(pool.map(one, range(n_requests)))
+        wall = time.perf_counter() - t0
+        ok = [elapsed for elapsed, status in out if status == 200]
+        results[f"predict_all[load c={c}]"] = {
+            **summarize(ok or [float("nan")]),
+            "req_per_s": len(ok) / wall,
+            "rejected": len(out) - len(ok),   # 503s from MAX_CONCURRENT_PREDICTIONS
+        }
+    return results
+
+
+# =========================
+# === OUTPUT ==============
+# =========================
+def environment():
+    return {
+        "timestamp": pd.Timestamp.now(tz="UTC").isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "orjson": power_client.HAS_ORJSON,
+        "power_format": temp.POWER_FORMAT,
+    }
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Benchmarks whose median is more than tolerance above the baseline's: [(name, baseline_ms, now_ms)]."""
+    slower = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None or not np.isfinite(r["median_ms"]) or not base.get("median_ms"):
+            continue
+        if r["median_ms"] > base["median_ms"] * (1.0 + tolerance):
+            slower.append((name, base["median_ms"], r["median_ms"]))
+    return slower
+
+
+def report(results):
+    width = max(len(k) for k in results)
+    for name, r in results.items():
+        extra = f"   {r['req_per_s']:8.1f} req/s" if "req_per_s" in r else ""
+        print(f"{name:<{width}}  median {r['median_ms']:8.3f} ms   p90 {r['p90_ms']:8.3f} ms   (n={r['n']}){extra}")
+
+
+def run_micro(repeat):
+    frame = synthetic_history()
+    history = temp.as_history(frame)   # compact float32 container, as served by load_history
+    results = bench_parse(frame, repeat)
+    results.update(bench_seasonal(temp.rain_frame(history), repeat))
+    results.update(bench_categories(history, repeat))
+    results.update(bench_climatology(history, repeat))
+    results.update(bench_rolling(history, repeat))
+    results.update(bench_grid(history, repeat))
+    return results
+
+
+def run_server(suites, upstream_latency_ms):
+    fake = FakePower(latency_ms=upstream_latency_ms).start()
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="wir-bench-") as workdir:
+        server = BenchServer(fake, workdir)
+        try:
+            if "latency" in suites:
+                results.update(bench_latency(server, fake))
+            if "load" in suites:
+                results.update(bench_load(server))
+        finally:
+            server.stop()
+            fake.stop()
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmarks for the rain / temperature / wind models and /predict_all.")
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--suites", default=",".join(SUITES), help=f"comma-separated subset of {','.join(SUITES)}")
+    ap.add_argument("--upstream-latency-ms", type=float, default=0.0, help="added to every fake POWER response")
+    ap.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    ap.add_argument("--compare", metavar="PATH", help="baseline JSON from --json; exit 1 on regressions")
+    ap.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    ap.add_argument("--serve-fake", type=int, metavar="PORT", help="only run the fake NASA POWER server")
+    args = ap.parse_args()
+
+    if args.serve_fake is not None:
+        fake = FakePower(latency_ms=args.upstream_latency_ms, port=args.serve_fake)
+        print(f"fake NASA POWER on {fake.url}  (WIR_POWER_URL={fake.url})")
+        fake.server.serve_forever()
+        return
+
+    suites = [x.strip() for x in args.suites.split(",") if x.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        ap.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    results = run_micro(args.repeat) if "micro" in suites else {}
+    if "latency" in suites or "load" in suites:
+        results.update(run_server(suites, args.upstream_latency_ms))
+
+    if args.json:
+        doc = json.dumps({"environment": environment(), "results": results}, indent=1)
+        if args.json == "-":
+            print(doc)
+        else:
+            with open(args.json, "w", encoding="utf-8") as f:
+                f.write(doc + "\n")
+    if args.json != "-":
+        report(results)
+        if "micro" in suites:
+            speedup = results["seasonal_window[apply]"]["median_ms"] / results["seasonal_window[mask]"]["median_ms"]
+            # level2_rain calls seasonal_probs twice per request (target day + yesterday)
+            print(f"\nseasonal_window speedup: {speedup:.1f}x  (x2 calls per /predict_all request)")
+            raw, csv_text, _, _ = power_payloads(synthetic_history())
+            print(f"POWER payload: JSON {len(raw) / 1e6:.2f} MB, CSV {len(csv_text) / 1e6:.2f} MB"
+                  f"  (orjson {'on' if power_client.HAS_ORJSON else 'off'})")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            slower = compare(results, json.load(f)["results"], args.tolerance)
+        for name, base, now in slower:
+            print(f"REGRESSION {name}: {base:.3f} ms -> {now:.3f} ms", file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
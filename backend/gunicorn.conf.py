@@ -0,0 +1,21 @@
+# gunicorn.conf.py
+# Preforked workers so CPU-bound pandas / numpy work scales with cores instead of sharing one GIL.
+# Every knob can be overridden from the environment (WIR_WORKERS=8 gunicorn -c gunicorn.conf.py wsgi:app).
+import multiprocessing
+import os
+
+bind = os.environ.get("WIR_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WIR_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+# Model requests run at once per worker: temp.limit_concurrency reads the same variable, so this is the
+# knob. threads must stay above it or the limit never binds (requests would wait in gunicorn's accept
+# queue instead); the spare threads answer /metrics, /cache_stats and the 503s of an overloaded worker.
+max_concurrent = int(os.environ.setdefault("WIR_MAX_CONCURRENT", "4"))
+threads = int(os.environ.get("WIR_THREADS", 2 * max_concurrent))
+timeout = 300                                       # cold history fetch: several upstream calls with retries
+graceful_timeout = 30
+keepalive = 5
+max_requests = 2000                                 # recycle workers to bound memory growth
+max_requests_jitter = 200
+preload_app = False                                 # each worker opens its own upstream connection pool
+accesslog = "-"
@@ -0,0 +1,113 @@
+# history.py
+# Compact in-memory daily history: one contiguous float32 array per variable on an implicit
+# date axis (start date + day offset). About 4x smaller than the parsed float64 DataFrame.
+import numpy as np
+import pandas as pd
+
+POWER_FILL_VALUE = -999.0           # NASA POWER "missing" marker
+FIRST_POWER_YEAR = 1981             # start of the NASA POWER daily record
+
+
+class PowerHistory:
+    """Daily history for one location; history["PRECTOTCORR"] -> float32 array aligned with history.dates."""
+
+    __slots__ = ("start", "n_days", "_data", "_dates", "_derived")
+
+    def __init__(self, start, data):
+        self.start = pd.Timestamp(start).normalize()
+        self._data = {name: np.ascontiguousarray(values, dtype=np.float32) for name, values in data.items()}
+        lengths = {len(v) for v in self._data.values()}
+        if len(lengths) > 1:
+            raise ValueError("All history columns must have the same length.")
+        self.n_days = lengths.pop() if lengths else 0
+        self._dates = None
+        self._derived = {}
+
+    @classmethod
+    def from_frame(cls, df, columns=None):
+        """From a daily DatetimeIndex frame; gaps become NaN rows and the POWER fill value becomes NaN."""
+        if df.empty:
+            return cls(pd.Timestamp(1970, 1, 1), {c: np.empty(0) for c in (columns or df.columns)})
+        df = df.sort_index()
+        full = pd.date_range(df.index[0], df.index[-1], freq="D")
+        if len(full) != len(df) or not full.equals(df.index):
+            df = df[~df.index.duplicated()].reindex(full)
+        data = {}
+        for c in (columns or df.columns):
+            if c not in df.columns:
+                continue
+            values = pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=np.float32)
+            data[c] = np.where(values == POWER_FILL_VALUE, np.float32(np.nan), values)
+        return cls(full[0], data)
+
+    # ---- columns ----
+    @property
+    def columns(self):
+        return list(self._data)
+
+    def __contains__(self, name):
+        return name in self._data
+
+    def __getitem__(self, name):
+        return self._data[name]
+
+    # ---- date axis ----
+    @property
+    def end(self):
+        return self.start + pd.Timedelta(days=self.n_days - 1)
+
+    @property
+    def dates(self):
+        if self._dates is None:
+            self._dates = pd.date_range(self.start, periods=self.n_days, freq="D")
+        return self._dates
+
+    def offset(self, date):
+        """Day index of date on this history's axis (may be out of range)."""
+        return int((pd.Timestamp(date).normalize() - self.start).days)
+
+    def bounds(self, start, end):
+        """(lo, hi) day indices of [start, end] clipped to the available days (lo <= hi)."""
+        lo = max(self.offset(start), 0)
+        hi = min(self.offset(end) + 1, self.n_days)
+        return lo, max(hi, lo)
+
+    def between(self, values, start, end, fill=np.nan):
+        """Entries of a day-aligned array (column or derived feature) for every day in [start, end], padded with fill."""
+        i0, i1 = self.offset(start), self.offset(end) + 1
+        out = np.full(max(i1 - i0, 0), fill, dtype=values.dtype)
+        lo, hi = max(i0, 0), min(i1, self.n_days)
+        if hi > lo:
+            out[lo - i0:hi - i0] = values[lo:hi]
+        return out
+
+    def slice(self, start, end):
+        """Sub-history for [start, end] clipped to the available days (views, no copy)."""
+        lo, hi = self.bounds(start, end)
+        return PowerHistory(self.start + pd.Timedelta(days=lo), {k: v[lo:hi] for k, v in self._data.items()})
+
+    # ---- derived features ----
+    def derived(self, name, build):
+        """Day-aligned array build(self), computed on first use and memoized on this history object."""
+        values = self._derived.get(name)
+        if values is None:
+            values = self._derived[name] = build(self)
+        return values
+
+    # ---- size ----
+    @property
+    def nbytes(self):
+        return sum(v.nbytes for v in self._data.values()) + sum(v.nbytes for v in self._derived.values())
+
+    def __len__(self):
+        return self.n_days
+
+    def __repr__(self):
+        return f"PowerHistory({self.start.date()}..{self.end.date()}, {self.columns}, {self.nbytes} bytes)"
+
+
+def as_history(obj, columns=None):
+    """PowerHistory passthrough; DataFrames (fetch_power output, test frames) are converted."""
+    if isinstance(obj, PowerHistory):
+        return obj
+    return PowerHistory.from_frame(obj, columns=columns)
@@ -0,0 +1,94 @@
+# ingest_region.py
+# Bulk download of every NASA POWER grid cell in a bounding box into a RegionStore (region_store.py).
+# Cells are fetched with bounded parallelism and checkpointed one by one, so an interrupted run
+# resumes where it stopped when started again with the same arguments.
+#   python ingest_region.py --name georgia --bbox 41.0 40.0 43.6 46.8          # south west north east
+#   python ingest_region.py --name georgia --bbox 41.0 40.0 43.6 46.8 --workers 4 --start-year 1990
+#   python ingest_region.py --name georgia --status
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from history import FIRST_POWER_YEAR
+from region_store import REGIONS_DIR, RegionStore
+
+DEFAULT_WORKERS = 4                 # NASA POWER rate limits; power_client caps concurrency as well
+
+
+def open_or_create(name, bbox, start_year, end_year, variables, lat_step, lon_step, root=REGIONS_DIR):
+    """Existing store for name (must match the request, so a resume never mixes layouts) or a new one."""
+    path = os.path.join(root, name)
+    if os.path.isfile(os.path.join(path, "meta.json")):
+        store = RegionStore(path, writable=True)
+        m = store.meta
+        same = ([float(v) for v in m["bbox"]] == [float(v) for v in bbox] and m["start_year"] == start_year
+                and m["end_year"] == end_year and m["variables"] == list(variables))
+        if not same:
+            raise ValueError(f"Region '{name}' exists with a different bbox / years / variables; pick a new name.")
+        return store
+    return RegionStore.create(path, name, bbox, start_year, end_year, variables, lat_step, lon_step)
+
+
+def ingest(store, fetch, workers=DEFAULT_WORKERS, log=print):
+    """Fetch every cell that is not done yet with at most `workers` in flight; returns {index: error}."""
+    cells = store.cells()
+    todo = [i for i in range(store.n_cells) if not store.done[i]]
+    start = f"{store.start_year}0101"
+    end = f"{store.end_year}1231"
+    log(f"{store.name}: {store.n_cells} cells, {store.n_cells - len(todo)} done, {len(todo)} to fetch")
+    failures = {}
+
+    def one(i):
+        lat, lon = cells[i]
+        t0 = time.perf_counter()
+        store.write_cell(i, fetch(lat, lon, start, end))
+        return time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(one, i): i for i in todo}
+        for n, fut in enumerate(as_completed(futures), 1):
+            i = futures[fut]
+            lat, lon = cells[i]
+            try:
+                log(f"[{n}/{len(todo)}] ok    ({lat:.3f}, {lon:.3f})  {fut.result():6.2f} s")
+            except Exception as e:
+                failures[i] = str(e)
+                log(f"[{n}/{len(todo)}] FAIL  ({lat:.3f}, {lon:.3f})  {e}")
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Download NASA POWER daily history for every grid cell of a bbox.")
+    ap.add_argument("--name", required=True, help="region name (directory under the regions root)")
+    ap.add_argument("--bbox", type=float, nargs=4, metavar=("SOUTH", "WEST", "NORTH", "EAST"))
+    ap.add_argument("--start-year", type=int, default=FIRST_POWER_YEAR)
+    ap.add_argument("--end-year", type=int, default=pd.Timestamp.today().year - 1,
+                    help="last year stored (default: last complete year)")
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="parallel cell downloads")
+    ap.add_argument("--root", default=REGIONS_DIR, help="regions directory (WIR_REGIONS_DIR)")
+    ap.add_argument("--status", action="store_true", help="print ingestion progress and exit")
+    args = ap.parse_args()
+
+    if args.status:
+        print(RegionStore(os.path.join(args.root, args.name)).progress())
+        return
+    if args.bbox is None:
+        sys.exit("--bbox is required to create or resume a region.")
+
+    import temp
+    store = open_or_create(args.name, args.bbox, args.start_year, args.end_year, temp.POWER_PARAMETERS.split(","),
+                           temp.GRID_LAT_STEP, temp.GRID_LON_STEP, root=args.root)
+    t0 = time.perf_counter()
+    failures = ingest(store, temp.fetch_power_upstream, workers=args.workers)
+    p = store.progress()
+    print(f"\n{p['done']}/{p['cells']} cells stored in {time.perf_counter() - t0:.1f} s"
+          + (f"; {len(failures)} failed, run again to resume" if failures else ""))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# metrics.py
+# In-process metrics without a client library: counters and histograms rendered in the Prometheus
+# text exposition format (GET /metrics), plus per-request stage timings ("spans") tied to a request id.
+#   with span("fetch_power"): ...            # or @timed("fetch_power")
+#   CACHE_LOOKUPS.inc(cache="climatology", result="hit")
+import contextvars
+import functools
+import threading
+import time
+import uuid
+
+# =========================
+# === PRESETS (EDITABLE) ==
+# =========================
+LATENCY_BUCKETS_S = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"expected labels {labelnames}, got {sorted(labels)}")
+    return tuple(str(labels[n]) for n in labelnames)
+
+
+def _label_text(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(n, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                    for n, v in pairs)
+    return "{" + body + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {v}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS_S):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}   # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            v = self._values.get(key)
+            if v is None:
+                v = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    v[i] += 1
+            v[-2] += value
+            v[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                for upper, n in zip(self.buckets, v):
+                    lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', repr(upper))])} {n}")
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', '+Inf')])} {v[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {v[-2]}")
+                lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {v[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        m = Counter(name, documentation, labelnames)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS_S):
+        m = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(m)
+        return m
+
+    def collector(self, fn):
+        """fn() -> [(name, type, documentation, {labels tuple: value})], read at scrape time (gauges)."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        for fn in self._collectors:
+            for name, kind, documentation, samples in fn():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples.items():
+                    lines.append(f"{name}{_label_text([n for n, _ in labels], [v for _, v in labels])} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.histogram("wir_request_seconds", "HTTP request latency.", ("route", "method", "status"))
+STAGE_SECONDS = REGISTRY.histogram("wir_stage_seconds", "Time spent per model / data stage (inclusive).", ("stage",))
+UPSTREAM_REQUESTS = REGISTRY.counter("wir_upstream_requests_total", "NASA POWER HTTP requests.", ("status",))
+UPSTREAM_BYTES = REGISTRY.counter("wir_upstream_bytes_total", "NASA POWER response body bytes.")
+UPSTREAM_RETRIES = REGISTRY.counter("wir_upstream_retries_total", "NASA POWER retries (connection errors, 429, 5xx).")
+CACHE_LOOKUPS = REGISTRY.counter("wir_cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result"))
+
+
+# =========================
+# === REQUEST SPANS =======
+# =========================
+_current = contextvars.ContextVar("wir_request", default=None)
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+def start_request(request_id):
+    """Begin collecting stage timings for the request handled by this thread / context."""
+    _current.set({"request_id": request_id, "start": time.perf_counter(), "stages": {}})
+
+
+def end_request():
+    """{"request_id", "total_ms", "stages": {stage: {"ms", "calls"}}} of the current request (None if none)."""
+    state = _current.get()
+    _current.set(None)
+    if state is None:
+        return None
+    return timing_breakdown(state)
+
+
+def current_breakdown():
+    state = _current.get()
+    return timing_breakdown(state) if state is not None else None
+
+
+def timing_breakdown(state):
+    return {
+        "request_id": state["request_id"],
+        "total_ms": round((time.perf_counter() - state["start"]) * 1000.0, 3),
+        "stages": {k: {"ms": round(v[0] * 1000.0, 3), "calls": v[1]} for k, v in state["stages"].items()},
+    }
+
+
+class span:
+    """Times a block into wir_stage_seconds{stage} and the current request's breakdown (nested spans overlap)."""
+
+    __slots__ = ("stage", "t0")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.t0
+        STAGE_SECONDS.observe(elapsed, stage=self.stage)
+        state = _current.get()
+        if state is not None:
+            total, calls = state["stages"].get(self.stage, (0.0, 0))
+            state["stages"][self.stage] = (total + elapsed, calls + 1)
+        return False
+
+
+def timed(stage):
+    """Decorator form of span(stage)."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
@@ -0,0 +1,145 @@
+# power_cache.py
+# Persistent on-disk cache for NASA POWER daily history.
+# History is stored one (rounded lat/lon, parameter set, year) chunk per Parquet file, so rolling
+# windows only need the years they do not already have. Files are evicted by age and total size.
+import hashlib
+import os
+import threading
+import time
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (pandas Parquet engine)
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+# =========================
+# === PRESETS (EDITABLE) ==
+# =========================
+CACHE_DIR = os.environ.get("WIR_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".power_cache"))
+CACHE_MAX_BYTES = 512 * 1024 * 1024   # total size on disk before least-recently-used files are dropped
+CACHE_MAX_AGE_DAYS = 90               # entries older than this are refetched
+COORD_DECIMALS = 2                    # lat/lon rounding for cache keys (~1 km)
+
+
+class PowerCache:
+    """
+    Small file cache for POWER DataFrames, one calendar year per entry.
+    Uses Parquet when pyarrow is installed, pickle otherwise; hit/miss counters via stats().
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, max_age_days=CACHE_MAX_AGE_DAYS,
+                 coord_decimals=COORD_DECIMALS):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self.max_age_s = float(max_age_days) * 86400.0
+        self.coord_decimals = coord_decimals
+        self.ext = ".parquet" if HAS_PARQUET else ".pkl"
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    # ---- keys ----
+    def key(self, lat, lon, parameters, year, temporal="daily", community="RE"):
+        lat_r = round(float(lat), self.coord_decimals)
+        lon_r = round(float(lon), self.coord_decimals)
+        params = ",".join(sorted(parameters.split(","))) if isinstance(parameters, str) else ",".join(sorted(parameters))
+        raw = f"{temporal}|{community}|{lat_r:.{self.coord_decimals}f}|{lon_r:.{self.coord_decimals}f}|{params}|{int(year)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key + self.ext)
+
+    # ---- read / write ----
+    def get(self, key):
+        path = self._path(key)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._count(hit=False)
+            return None
+        if self.max_age_s > 0 and time.time() - st.st_mtime > self.max_age_s:
+            self._remove(path)
+            self._count(hit=False)
+            return None
+        try:
+            df = pd.read_parquet(path) if HAS_PARQUET else pd.read_pickle(path)
+        except Exception:
+            # Corrupt / partially written file: drop it and refetch
+            self._remove(path)
+            self._count(hit=False)
+            return None
+        os.utime(path, (time.time(), st.st_mtime))  # atime = last use (LRU), mtime = fetch time (age)
+        self._count(hit=True)
+        return df
+
+    def put(self, key, df, evict=True):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if HAS_PARQUET:
+            df.to_parquet(tmp)
+        else:
+            df.to_pickle(tmp)
+        os.replace(tmp, path)  # atomic: readers never see a half-written file
+        if evict:
+            self.evict()
+
+    # ---- eviction ----
+    def evict(self):
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.root):
+            if not name.endswith(self.ext):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if self.max_age_s > 0 and now - st.st_mtime > self.max_age_s:
+                self._remove(path)
+                continue
+            entries.append((st.st_atime, st.st_size, path))
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self.evictions += 1
+
+    # ---- counters ----
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        files = [n for n in os.listdir(self.root) if n.endswith(self.ext)]
+        size = sum(os.path.getsize(os.path.join(self.root, n)) for n in files)
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else None,
+                "evictions": self.evictions,
+                "entries": len(files),
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "max_age_days": self.max_age_s / 86400.0,
+                "format": "parquet" if HAS_PARQUET else "pickle",
+            }
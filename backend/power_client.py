@@ -0,0 +1,112 @@
+# power_client.py
+# Pooled HTTP client for NASA POWER: keep-alive connection pool, retries with backoff,
+# a cap on concurrent upstream requests and single-flight coalescing of identical requests.
+import json
+import os
+import threading
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import UPSTREAM_BYTES, UPSTREAM_REQUESTS, UPSTREAM_RETRIES, span
+
+try:
+    import orjson  # optional: ~3-5x faster decoding of the large POWER payloads
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# =========================
+# === PRESETS (EDITABLE) ==
+# =========================
+POWER_BASE_URL = os.environ.get("WIR_POWER_URL", "https://power.larc.nasa.gov/api/temporal")   # bench.py --serve-fake
+POOL_SIZE = 16                      # keep-alive connections kept open to the API host
+MAX_CONCURRENT_REQUESTS = 4         # simultaneous upstream calls (NASA POWER rate limits)
+REQUEST_TIMEOUT_S = 90
+MAX_RETRIES = 3                     # on connection errors, 429 and 5xx (honours Retry-After)
+RETRY_BACKOFF_S = 1.0
+
+
+def decode_json(raw):
+    """bytes -> Python objects, with orjson when it is installed."""
+    return orjson.loads(raw) if HAS_ORJSON else json.loads(raw)
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution; later callers wait for its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._inflight[key] = fut
+        if not leader:
+            return fut.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+class PowerClient:
+    """requests.Session wrapper shared by all threads of the app."""
+
+    def __init__(self, base_url=POWER_BASE_URL, pool_size=POOL_SIZE, max_concurrency=MAX_CONCURRENT_REQUESTS,
+                 timeout=REQUEST_TIMEOUT_S, retries=MAX_RETRIES, backoff=RETRY_BACKOFF_S):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(["GET"]), respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._flights = SingleFlight()
+
+    def get_json(self, path, params):
+        """GET base_url/path and decode JSON; identical concurrent requests are sent once."""
+        raw = self.get_bytes(path, params)
+        with span("decode_json"):
+            return decode_json(raw)
+
+    def get_text(self, path, params):
+        """GET base_url/path as text (CSV responses)."""
+        return self.get_bytes(path, params).decode("utf-8")
+
+    def get_bytes(self, path, params):
+        """Raw response body; identical concurrent requests are sent once."""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        key = (url, tuple(sorted((k, str(v)) for k, v in params.items())))
+        return self._flights.do(key, lambda: self._get_bytes(url, params))
+
+    def _get_bytes(self, url, params):
+        with self._slots, span("upstream_http"):
+            try:
+                r = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.RequestException:
+                UPSTREAM_REQUESTS.inc(status="error")
+                raise
+            retries = getattr(getattr(r.raw, "retries", None), "history", None)
+            if retries:
+                UPSTREAM_RETRIES.inc(len(retries))
+            UPSTREAM_REQUESTS.inc(status=str(r.status_code))
+            r.raise_for_status()
+            content = r.content
+            UPSTREAM_BYTES.inc(len(content))
+            return content
@@ -0,0 +1,106 @@
+# prewarm.py
+# Pre-warm the history cache and climatology tables for a known list of locations,
+# so the first click on a popular city does not wait for a cold NASA POWER download.
+#   python prewarm.py                                   # cities from src/components/WeatherMap.tsx
+#   python prewarm.py --file cities.csv --workers 8     # "lat,lon[,name]" per line (or a JSON list)
+#   python prewarm.py --server http://127.0.0.1:5000    # warm a running server's in-memory tables too
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import requests
+
+CATALOGUE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "components", "WeatherMap.tsx")
+DEFAULT_WORKERS = 4
+
+# { name: 'Kyiv', country: 'Ukraine', coordinates: [30.5245, 50.44504], ... }   (coordinates are [lon, lat])
+_CITY_RE = re.compile(r"name:\s*'([^']*)'[^}]*?coordinates:\s*\[\s*(-?\s*[\d.]+)\s*,\s*(-?\s*[\d.]+)\s*\]")
+
+
+def locations_from_catalogue(path=CATALOGUE):
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    return [{"name": name, "lat": float(lat.replace(" ", "")), "lon": float(lon.replace(" ", ""))}
+            for name, lon, lat in _CITY_RE.findall(text)]
+
+
+def locations_from_file(path):
+    """JSON list of {lat, lon[, name]} or CSV lines "lat,lon[,name]" (header optional, # comments)."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith(".json"):
+        return [{"name": d.get("name", f"{d['lat']},{d['lon']}"), "lat": float(d["lat"]), "lon": float(d["lon"])}
+                for d in json.loads(text)]
+    out = []
+    for row in csv.reader(line for line in text.splitlines() if line.strip() and not line.startswith("#")):
+        try:
+            lat, lon = float(row[0]), float(row[1])
+        except ValueError:
+            continue  # header
+        out.append({"name": row[2].strip() if len(row) > 2 else f"{lat},{lon}", "lat": lat, "lon": lon})
+    return out
+
+
+def warm_local(loc, date_str):
+    import temp
+    temp.get_climatology(loc["lat"], loc["lon"], date_str)
+
+
+def warm_remote(loc, date_str, server):
+    r = requests.get(f"{server.rstrip('/')}/climatology",
+                     params={"lat": loc["lat"], "lon": loc["lon"], "date_str": date_str}, timeout=600)
+    r.raise_for_status()
+
+
+def prewarm(locations, date_str, workers=DEFAULT_WORKERS, server=None, log=print):
+    """Warm every location with at most `workers` in flight; returns {name: error} for failures."""
+    failures = {}
+
+    def one(loc):
+        t0 = time.perf_counter()
+        if server:
+            warm_remote(loc, date_str, server)
+        else:
+            warm_local(loc, date_str)
+        return time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(one, loc): loc for loc in locations}
+        for fut in as_completed(futures):
+            loc = futures[fut]
+            try:
+                log(f"ok    {loc['name']:<24} ({loc['lat']:.4f}, {loc['lon']:.4f})  {fut.result():6.2f} s")
+            except Exception as e:
+                failures[loc["name"]] = str(e)
+                log(f"FAIL  {loc['name']:<24} ({loc['lat']:.4f}, {loc['lon']:.4f})  {e}")
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Pre-warm NASA POWER history and climatology for known locations.")
+    ap.add_argument("--file", help="CSV (lat,lon[,name]) or JSON list of locations; default: WeatherMap.tsx cities")
+    ap.add_argument("--catalogue", default=CATALOGUE, help="frontend city catalogue to extract coordinates from")
+    ap.add_argument("--date", default=pd.Timestamp.today().strftime("%Y-%m-%d"),
+                    help="target date whose history window is warmed (default: today)")
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="parallel locations")
+    ap.add_argument("--server", help="warm a running server through GET /climatology instead of in-process")
+    args = ap.parse_args()
+
+    locations = locations_from_file(args.file) if args.file else locations_from_catalogue(args.catalogue)
+    if not locations:
+        sys.exit("No locations found.")
+    print(f"Pre-warming {len(locations)} locations for {args.date} with {args.workers} workers")
+    t0 = time.perf_counter()
+    failures = prewarm(locations, args.date, workers=args.workers, server=args.server)
+    print(f"\n{len(locations) - len(failures)}/{len(locations)} warm in {time.perf_counter() - t0:.1f} s")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# raster.py
+# Minimal PNG writer (zlib + struct, no imaging dependency) and a probability colour ramp,
+# for the /predict_grid heatmap tiles.
+import struct
+import zlib
+
+import numpy as np
+
+# Percent 0 -> 100: transparent-ish pale yellow -> green -> blue -> dark purple
+RAMP_STOPS = np.array([0.0, 25.0, 50.0, 75.0, 100.0])
+RAMP_RGBA = np.array([
+    [255, 255, 204, 60],
+    [161, 218, 180, 150],
+    [65, 182, 196, 190],
+    [34, 94, 168, 220],
+    [37, 52, 148, 240],
+], dtype=float)
+
+
+def colorize(values, vmin=0.0, vmax=100.0):
+    """(rows, cols) percent array -> (rows, cols, 4) uint8 RGBA; NaN cells are fully transparent."""
+    v = np.clip((np.asarray(values, dtype=float) - vmin) / (vmax - vmin) * 100.0, 0.0, 100.0)
+    rgba = np.stack([np.interp(v, RAMP_STOPS, RAMP_RGBA[:, k]) for k in range(4)], axis=-1)
+    rgba[np.isnan(values)] = 0.0
+    return np.round(rgba).astype(np.uint8)
+
+
+def encode_png(rgba, scale=1):
+    """RGBA uint8 (rows, cols, 4) -> PNG bytes; each cell is drawn as scale x scale pixels."""
+    rgba = np.asarray(rgba, dtype=np.uint8)
+    if scale > 1:
+        rgba = np.repeat(np.repeat(rgba, scale, axis=0), scale, axis=1)
+    height, width = rgba.shape[:2]
+    # Filter type 0 (None) in front of every scanline
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)], axis=1)
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)   # 8-bit RGBA
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)) + chunk(b"IEND", b""))
@@ -0,0 +1,157 @@
+# region_store.py
+# Memory-mapped daily history for every NASA POWER grid cell of a bounding box.
+# One directory per region:
+#   meta.json     bbox, grid, variables, years
+#   YYYY.npy      float32 (cell, day, variable) chunk for one calendar year (np.load(mmap_mode="r"))
+#   done.npy      bool (cell,) ingestion checkpoint: a cell's rows are only read once it is True
+# Filled by ingest_region.py; load_history in temp.py reads covered cells from here without the network.
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from history import PowerHistory
+
+# =========================
+# === PRESETS (EDITABLE) ==
+# =========================
+REGIONS_DIR = os.environ.get("WIR_REGIONS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".regions"))
+
+
+def grid_axis(lo, hi, step):
+    """Cell centres (multiples of step) whose cells intersect [lo, hi]."""
+    first = np.floor(lo / step + 0.5)
+    last = np.floor(hi / step + 0.5)
+    return np.arange(first, last + 1) * step
+
+
+class RegionStore:
+    """Regular lat x lon block of grid cells; cell index = i_lat * n_lon + i_lon."""
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.writable = writable
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.name = self.meta["name"]
+        self.variables = list(self.meta["variables"])
+        self.lat_step = float(self.meta["lat_step"])
+        self.lon_step = float(self.meta["lon_step"])
+        self.lats = np.asarray(self.meta["lats"], dtype=float)
+        self.lons = np.asarray(self.meta["lons"], dtype=float)
+        self.start_year = int(self.meta["start_year"])
+        self.end_year = int(self.meta["end_year"])
+        self._chunks = {}
+        self._lock = threading.Lock()
+        self.done = np.load(os.path.join(path, "done.npy"), mmap_mode="r+" if writable else "r")
+
+    @classmethod
+    def create(cls, path, name, bbox, start_year, end_year, variables, lat_step, lon_step):
+        """Empty store (all NaN, no cell done) for bbox = (south, west, north, east)."""
+        south, west, north, east = (float(v) for v in bbox)
+        if not (south <= north and west <= east):
+            raise ValueError("bbox must be (south, west, north, east) with south <= north and west <= east.")
+        lats = grid_axis(max(south, -90.0), min(north, 90.0), lat_step)
+        lons = grid_axis(west, east, lon_step)
+        os.makedirs(path, exist_ok=True)
+        n_cells = len(lats) * len(lons)
+        for year in range(start_year, end_year + 1):
+            n_days = 366 if pd.Timestamp(year, 12, 31).dayofyear == 366 else 365
+            chunk = np.lib.format.open_memmap(os.path.join(path, f"{year}.npy"), mode="w+", dtype=np.float32,
+                                              shape=(n_cells, n_days, len(variables)))
+            chunk[:] = np.nan
+            chunk.flush()
+            del chunk
+        np.save(os.path.join(path, "done.npy"), np.zeros(n_cells, dtype=bool))
+        meta = {
+            "name": name,
+            "bbox": [south, west, north, east],
+            "lat_step": lat_step,
+            "lon_step": lon_step,
+            "lats": lats.tolist(),
+            "lons": lons.tolist(),
+            "start_year": int(start_year),
+            "end_year": int(end_year),
+            "variables": list(variables),
+        }
+        tmp = os.path.join(path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=1)
+        os.replace(tmp, os.path.join(path, "meta.json"))  # meta.json last: a store is only opened once complete
+        return cls(path, writable=True)
+
+    # ---- cells ----
+    @property
+    def n_cells(self):
+        return len(self.lats) * len(self.lons)
+
+    def cells(self):
+        """(n_cells, 2) array of (lat, lon) cell centres in index order."""
+        lat, lon = np.meshgrid(self.lats, self.lons, indexing="ij")
+        return np.column_stack([lat.ravel(), lon.ravel()])
+
+    def cell_index(self, lat, lon):
+        """Index of the cell containing (lat, lon), or None outside the region."""
+        i = int(np.floor((float(lat) - self.lats[0]) / self.lat_step + 0.5)) if len(self.lats) else -1
+        j = int(np.floor((float(lon) - self.lons[0]) / self.lon_step + 0.5)) if len(self.lons) else -1
+        if not (0 <= i < len(self.lats) and 0 <= j < len(self.lons)):
+            return None
+        return i * len(self.lons) + j
+
+    # ---- chunks ----
+    def chunk(self, year, writable=False):
+        key = (year, writable)
+        with self._lock:
+            arr = self._chunks.get(key)
+            if arr is None:
+                arr = np.load(os.path.join(self.path, f"{year}.npy"), mmap_mode="r+" if writable else "r")
+                self._chunks[key] = arr
+            return arr
+
+    def write_cell(self, index, df):
+        """Store one cell's daily frame (DatetimeIndex, variable columns) and mark the cell done."""
+        for year in range(self.start_year, self.end_year + 1):
+            chunk = self.chunk(year, writable=True)
+            days = pd.date_range(pd.Timestamp(year, 1, 1), pd.Timestamp(year, 12, 31), freq="D")
+            part = df.reindex(days)
+            chunk[index] = np.column_stack([
+                part[v].to_numpy(dtype=np.float32) if v in part.columns else np.full(len(days), np.nan, np.float32)
+                for v in self.variables])
+            chunk.flush()
+        self.done[index] = True   # checkpoint only after the data is on disk
+        self.done.flush()
+
+    # ---- reads ----
+    def covers(self, lat, lon, start, end):
+        index = self.cell_index(lat, lon)
+        return (index is not None and bool(self.done[index])
+                and pd.Timestamp(start).year >= self.start_year and pd.Timestamp(end).year <= self.end_year)
+
+    def history(self, lat, lon, start, end):
+        """PowerHistory of the cell containing (lat, lon) for [start, end], or None if not covered."""
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        if not self.covers(lat, lon, start, end):
+            return None
+        index = self.cell_index(lat, lon)
+        rows = np.concatenate([self.chunk(y)[index] for y in range(start.year, end.year + 1)], axis=0)
+        lo = (start - pd.Timestamp(start.year, 1, 1)).days
+        hi = lo + (end - start).days + 1
+        return PowerHistory(start, {v: rows[lo:hi, k] for k, v in enumerate(self.variables)})
+
+    def progress(self):
+        return {"name": self.name, "cells": self.n_cells, "done": int(np.count_nonzero(self.done)),
+                "years": [self.start_year, self.end_year], "variables": self.variables}
+
+
+def open_stores(root=REGIONS_DIR):
+    """Every complete region directory under root."""
+    stores = []
+    if not os.path.isdir(root):
+        return stores
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if os.path.isfile(os.path.join(path, "meta.json")):
+            stores.append(RegionStore(path))
+    return stores
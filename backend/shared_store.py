@@ -0,0 +1,228 @@
+# shared_store.py
+# Cross-process cache for derived model tables (per-year statistics, climatologies), so the
+# preforked workers of a production server share work instead of each one rebuilding it.
+# Entries are pickled files written atomically; a per-key file lock makes one process build a
+# missing entry while the others wait for it and then read the result.
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+try:
+    import fcntl  # POSIX advisory locks; elsewhere only threads of one process are coordinated
+except ImportError:
+    fcntl = None
+
+# =========================
+# === PRESETS (EDITABLE) ==
+# =========================
+STORE_DIR = os.environ.get("WIR_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".model_store"))
+# Total size on disk before least-recently-used entries are dropped. Per-year stats cost ~35 KB per cell and
+# year (~0.7 MB per cell for a 20-year window): size it to hold the working set of the ingested regions.
+STORE_MAX_BYTES = int(os.environ.get("WIR_STORE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+STORE_EVICT_TO = 0.9                  # eviction trims to this fraction of max_bytes, so full scans stay rare
+STORE_RESCAN_S = 60                   # writes of other processes are picked up by a directory scan this often
+STORE_LOCK_TIMEOUT_S = 300            # longest wait for another process building the same entry
+
+
+class SharedStore:
+    """Pickle-per-key store shared by all processes using the same root; see get_or_build()."""
+
+    def __init__(self, root=STORE_DIR, max_bytes=STORE_MAX_BYTES, lock_timeout=STORE_LOCK_TIMEOUT_S):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self.lock_timeout = float(lock_timeout)
+        self._lock = threading.Lock()
+        self._thread_locks = {}           # key -> [lock, threads holding or waiting for it]
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self._bytes = None                # running estimate of the .pkl total (None until the first scan)
+        self._scanned = 0.0
+        os.makedirs(self.root, exist_ok=True)
+
+    # ---- keys ----
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key + ".pkl")
+
+    # ---- read / write ----
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                obj = pickle.load(f)
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        except Exception:
+            # Corrupt / foreign file: drop it and rebuild
+            self._remove(path)
+            self._count("misses")
+            return None
+        try:
+            os.utime(path)  # last use, for LRU eviction
+        except FileNotFoundError:
+            pass
+        self._count("hits")
+        return obj
+
+    def put(self, key, obj, evict=True):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = f.tell()
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp, path)  # atomic: readers never see a half-written file
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += size - replaced
+        if evict:
+            self.evict()
+
+    def get_or_build(self, key, build):
+        """Stored value for key, or build() it once across all threads and processes and store it."""
+        obj = self.get(key)
+        if obj is not None:
+            return obj
+        with self._key_lock(key):
+            obj = self.get(key)  # another worker may have finished it while we waited
+            if obj is not None:
+                return obj
+            obj = build()
+            self._count("builds")
+            if obj is not None:
+                self.put(key, obj)
+            return obj
+
+    # ---- locking ----
+    def _key_lock(self, key):
+        with self._lock:
+            entry = self._thread_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        return _KeyLock(entry[0], os.path.join(self.root, key + ".lock"), self.lock_timeout,
+                        on_release=lambda: self._release_key_lock(key))
+
+    def _release_key_lock(self, key):
+        """Drop key's thread lock once no thread holds or waits for it, so the dict only holds keys in use."""
+        with self._lock:
+            entry = self._thread_locks[key]
+            entry[1] -= 1
+            if not entry[1]:
+                del self._thread_locks[key]
+
+    # ---- eviction ----
+    def evict(self, force=False):
+        """
+        Drop least-recently-used entries down to STORE_EVICT_TO x max_bytes once the store is over max_bytes.
+        Writes keep a running size estimate, so the directory is only scanned when that estimate crosses
+        max_bytes or every STORE_RESCAN_S (to count other processes' writes), not on every put.
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = self._bytes is None or self._bytes > self.max_bytes or now - self._scanned > STORE_RESCAN_S
+        if not (due or force):
+            return
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith(".tmp") or name.endswith(".lock"):
+                # Leftovers of crashed writers / finished builds
+                try:
+                    if time.time() - os.stat(path).st_mtime > self.lock_timeout:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            if not name.endswith(".pkl"):
+                continue
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(e[1] for e in entries)
+        if total > self.max_bytes:
+            target = self.max_bytes * STORE_EVICT_TO
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                self._remove(path)
+                total -= size
+        with self._lock:
+            self._bytes = total
+            self._scanned = now
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # ---- counters ----
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        files = [n for n in os.listdir(self.root) if n.endswith(".pkl")]
+        size = sum(os.path.getsize(os.path.join(self.root, n)) for n in files)
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else None,
+                "builds": self.builds,
+                "entries": len(files),
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "pid": os.getpid(),
+            }
+
+
+class _KeyLock:
+    """Thread lock + exclusive flock on a lock file (waits up to timeout, then proceeds unlocked)."""
+
+    def __init__(self, tlock, path, timeout, on_release=None):
+        self.tlock = tlock
+        self.path = path
+        self.timeout = timeout
+        self.on_release = on_release
+        self.fd = None
+
+    def __enter__(self):
+        self.tlock.acquire()
+        if fcntl is None:
+            return self
+        self.fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return self
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    # A stuck builder must not block every worker: build a duplicate instead
+                    os.close(self.fd)
+                    self.fd = None
+                    return self
+                time.sleep(0.05)
+
+    def __exit__(self, *exc):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+        self.tlock.release()
+        if self.on_release is not None:
+            self.on_release()
+        return False
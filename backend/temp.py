@@ -1,12 +1,28 @@
 # merged_weather_baseline.py
 # One script: Rain probability (Level-2) + Temperature & Wind category probabilities
 # Uses NASA POWER daily data for the previous N full years ending before the target year.
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, redirect, stream_with_context
 import pandas as pd
 import numpy as np
-import requests
+import functools
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import timedelta
+from urllib.parse import urlencode
 from flask_cors import CORS
+from power_cache import PowerCache
+from power_client import PowerClient, SingleFlight
+from shared_store import SharedStore
+from region_store import grid_axis, open_stores
+from raster import colorize, encode_png
+from metrics import (CACHE_LOOKUPS, REGISTRY, REQUEST_SECONDS, current_breakdown, end_request, new_request_id,
+                     span, start_request, timed)
+from history import FIRST_POWER_YEAR, POWER_FILL_VALUE, PowerHistory, as_history
 
 app = Flask(__name__)
 CORS(app, origins="*")
@@ -15,6 +31,8 @@ CORS(app, origins="*")
 # === PRESETS (EDITABLE) ==
 # =========================
 ROLLING_YEARS = 20                  # previous N FULL calendar years (ending year BEFORE target)
+YEAR_WEIGHTINGS = ("default", "equal", "linear", "exponential")   # see year_weights()
+YEAR_WEIGHT_HALF_LIFE = 5.0         # years, for "exponential"
 SMOOTH_WINDOW_DAYS = 13             # +/- days around target DOY for seasonality (rain model)
 TW_HALF_WINDOW_DAYS = 10            # +/- days for temp/wind categories
 BLEND_MODE = "equal"                # "equal" or "sample_weighted"
@@ -29,6 +47,27 @@ HEAVY_THRESHOLD   = 15.0
 MPH_PER_MS = 2.23693629
 WINDY_THRESHOLD_MPH = 11.5
 WINDY_THRESHOLD_MS  = WINDY_THRESHOLD_MPH / MPH_PER_MS  # ≈ 3.58 m/s
+
+# NASA POWER request (only the variables the models read)
+POWER_PARAMETERS = "PRECTOTCORR,T2M_MAX,WS10M_MAX"
+POWER_FORMAT = "CSV"                # "CSV" (~2.5x smaller on the wire for daily point data) or "JSON"
+SNAP_TO_GRID = True                 # fetch / cache per NASA POWER grid cell instead of per raw click
+GRID_LAT_STEP = 0.5                 # MERRA-2 meteorology grid (degrees): every point in a cell gets the same data
+GRID_LON_STEP = 0.625
+USE_DISK_CACHE = True               # persist fetched history (see power_cache.py for size/age limits)
+HISTORY_CACHE_MAX_BYTES = 256 * 1024 * 1024   # in-process float32 history kept across requests
+CURRENT_YEAR_TTL_S = 3600           # in-process entries holding not yet final years are rebuilt after this
+POWER_LAG_DAYS = 60                 # NASA POWER fills in a year late: it counts as final this long after Dec 31
+
+USE_REGION_STORES = True            # read bulk-ingested regions (ingest_region.py) from disk before the network
+REGION_RESCAN_S = 60                # how often newly ingested regions are picked up
+USE_SHARED_STORE = True             # share per-year stats / climatologies across server processes (shared_store.py)
+MAX_CONCURRENT_PREDICTIONS = int(os.environ.get("WIR_MAX_CONCURRENT", "8"))   # per process (gunicorn.conf.py sets it)
+QUEUE_TIMEOUT_S = 10.0              # wait for a free slot before answering 503
+
+power_cache = PowerCache() if USE_DISK_CACHE else None
+power_client = PowerClient()          # pooled session, bounded concurrency, coalesced identical requests
+model_store = SharedStore() if USE_SHARED_STORE else None
  
 # =========================
 # === INPUT ===============
@@ -36,7 +75,7 @@ WINDY_THRESHOLD_MS  = WINDY_THRESHOLD_MPH / MPH_PER_MS  # ≈ 3.58 m/s
 # =========================
 # === HISTORY WINDOW ======
 # =========================
-def compute_history_window(target_date_str, rolling_years=ROLLING_YEARS, min_first_year=1981):
+def compute_history_window(target_date_str, rolling_years=ROLLING_YEARS, min_first_year=FIRST_POWER_YEAR):
     """
     Use previous N FULL calendar years ending Dec 31 of the year before target.
     Example: target=2024-12-05, N=20 -> 2004-01-01 .. 2023-12-31
@@ -51,32 +90,232 @@ def compute_history_window(target_date_str, rolling_years=ROLLING_YEARS, min_fir
 # =========================
 # === DATA FETCH (POWER) ==
 # =========================
-def fetch_power(lat, lon, start_yyyymmdd, end_yyyymmdd, temporal="daily", community="RE"):
+def power_dates(start_yyyymmdd, end_yyyymmdd):
+    return pd.date_range(pd.to_datetime(start_yyyymmdd, format="%Y%m%d"),
+                         pd.to_datetime(end_yyyymmdd, format="%Y%m%d"), freq="D")
+
+def power_frame(columns, dates):
+    """float32 frame on a daily index with the -999 fill value mapped to NaN."""
+    data = {name: np.where(v == POWER_FILL_VALUE, np.float32(np.nan), v) for name, v in columns.items()}
+    return pd.DataFrame(data, index=dates)
+
+@timed("parse_power")
+def parse_power_json(payload, start_yyyymmdd, end_yyyymmdd):
+    """
+    properties.parameter = {name: {"YYYYMMDD": value, ...}} -> DataFrame.
+    A complete, ordered series takes its dates from start/end and its values straight into a float32
+    array; anything irregular (gaps, extra days, nulls) is aligned by its date keys instead.
+    """
+    data = payload.get("properties", {}).get("parameter", {})
+    if not data:
+        raise RuntimeError("No data returned from NASA POWER. Check coordinates/dates.")
+    dates = power_dates(start_yyyymmdd, end_yyyymmdd)
+    first, last = dates[0].strftime("%Y%m%d"), dates[-1].strftime("%Y%m%d")
+    columns = {}
+    for name, series in data.items():
+        if len(series) == len(dates) and next(iter(series)) == first and next(reversed(series)) == last:
+            try:
+                columns[name] = np.fromiter(series.values(), dtype=np.float32, count=len(dates))
+                continue
+            except (TypeError, ValueError):
+                pass
+        idx = pd.to_datetime(list(series), format="%Y%m%d", errors="coerce")
+        values = pd.Series(pd.to_numeric(pd.Series(list(series.values()), dtype=object), errors="coerce").to_numpy(),
+                           index=idx)
+        values = values[values.index.notna() & ~values.index.duplicated()]
+        columns[name] = values.reindex(dates).to_numpy(dtype=np.float32)
+    return power_frame(columns, dates)
+
+@timed("parse_power")
+def parse_power_csv(text, start_yyyymmdd, end_yyyymmdd):
+    """POWER CSV (header block, then YEAR,MO,DY[,...] or YEAR,DOY rows plus one column per parameter) -> DataFrame."""
+    marker = "-END HEADER-"
+    at = text.find(marker)
+    body = text[at + len(marker):].lstrip("\r\n") if at >= 0 else text
+    raw = pd.read_csv(io.StringIO(body), engine="c")
+    if raw.empty:
+        raise RuntimeError("No data returned from NASA POWER. Check coordinates/dates.")
+    date_cols = [c for c in ("YEAR", "MO", "DY", "DOY") if c in raw.columns]
+    columns = {c: pd.to_numeric(raw[c], errors="coerce").to_numpy(dtype=np.float32)
+               for c in raw.columns if c not in date_cols}
+    dates = power_dates(start_yyyymmdd, end_yyyymmdd)
+    year = raw["YEAR"].to_numpy()
+    if "DOY" in raw.columns:
+        day_keys, key_format = year * 1000 + raw["DOY"].to_numpy(), "%Y%j"
+    else:
+        day_keys, key_format = (year * 100 + raw["MO"].to_numpy()) * 100 + raw["DY"].to_numpy(), "%Y%m%d"
+    expected = (int(dates[0].strftime(key_format)), int(dates[-1].strftime(key_format)))
+    # Complete, ordered rows (the normal case): dates straight from start / end
+    if len(raw) == len(dates) and (day_keys[0], day_keys[-1]) == expected and (np.diff(day_keys) > 0).all():
+        return power_frame(columns, dates)
+    df = pd.DataFrame(columns, index=pd.to_datetime(day_keys.astype(str), format=key_format))
+    df = df[~df.index.duplicated()].reindex(dates)
+    return power_frame({c: df[c].to_numpy(dtype=np.float32) for c in df.columns}, dates)
+
+@timed("fetch_power_upstream")
+def fetch_power_upstream(lat, lon, start_yyyymmdd, end_yyyymmdd, temporal="daily", community="RE"):
     """
     One call for all variables we need:
       - Rain: PRECTOTCORR (mm/day)
-      - Temperature: T2M, T2M_MAX, T2M_MIN (°C)
+      - Temperature: T2M_MAX (°C)
       - Wind: WS10M_MAX (m/s)
+    Values are float32 with the -999 fill value already mapped to NaN.
     """
-    base_url = f"https://power.larc.nasa.gov/api/temporal/{temporal}/point"
     params = {
-        "parameters": "PRECTOTCORR,T2M,T2M_MAX,T2M_MIN,WS10M_MAX",
+        "parameters": POWER_PARAMETERS,
         "community": community,
         "longitude": lon,
         "latitude": lat,
         "start": start_yyyymmdd,
         "end": end_yyyymmdd,
-        "format": "JSON",
+        "format": POWER_FORMAT,
     }
-    r = requests.get(base_url, params=params, timeout=90)
-    r.raise_for_status()
-    data = r.json().get("properties", {}).get("parameter", {})
-    if not data:
+    if POWER_FORMAT.upper() == "CSV":
+        return parse_power_csv(power_client.get_text(f"{temporal}/point", params), start_yyyymmdd, end_yyyymmdd)
+    return parse_power_json(power_client.get_json(f"{temporal}/point", params), start_yyyymmdd, end_yyyymmdd)
+
+def missing_year_runs(years):
+    """Group sorted years into contiguous (first, last) runs, so each gap costs one upstream call."""
+    runs = []
+    for y in years:
+        if runs and y == runs[-1][1] + 1:
+            runs[-1][1] = y
+        else:
+            runs.append([y, y])
+    return [(a, b) for a, b in runs]
+
+def year_complete(year):
+    """True once NASA POWER has had POWER_LAG_DAYS past Dec 31 of year to publish its last days."""
+    return pd.Timestamp.today() >= pd.Timestamp(year + 1, 1, 1) + pd.Timedelta(days=POWER_LAG_DAYS)
+
+@timed("fetch_power")
+def fetch_power(lat, lon, start_yyyymmdd, end_yyyymmdd, temporal="daily", community="RE"):
+    """
+    Same frame as fetch_power_upstream, assembled from per-(location, year) cache chunks.
+    Only the years not already on disk are requested (one call per contiguous gap). Only final years
+    (year_complete, Dec 31 published) are stored: recent ones are refetched while POWER fills them in.
+    """
+    if power_cache is None:
+        return fetch_power_upstream(lat, lon, start_yyyymmdd, end_yyyymmdd, temporal, community)
+
+    start = pd.to_datetime(start_yyyymmdd, format="%Y%m%d")
+    end = pd.to_datetime(end_yyyymmdd, format="%Y%m%d")
+
+    chunks = {}
+    missing = []
+    for y in range(start.year, end.year + 1):
+        cached = None
+        if year_complete(y):
+            cached = power_cache.get(power_cache.key(lat, lon, POWER_PARAMETERS, y, temporal, community))
+        if cached is None:
+            missing.append(y)
+        else:
+            chunks[y] = cached
+
+    for first, last in missing_year_runs(missing):
+        df_run = fetch_power_upstream(lat, lon, f"{first}0101", f"{last}1231", temporal, community)
+        for y, df_y in df_run.groupby(df_run.index.year):
+            chunks[y] = df_y
+            if year_complete(y) and df_y.iloc[-1].notna().any():
+                power_cache.put(power_cache.key(lat, lon, POWER_PARAMETERS, y, temporal, community), df_y, evict=False)
+    if missing:
+        power_cache.evict()
+
+    if not chunks:
         raise RuntimeError("No data returned from NASA POWER. Check coordinates/dates.")
-    df = pd.DataFrame(data)              # columns are parameter names, index are YYYYMMDD strings
-    df.index = pd.to_datetime(df.index)  # to datetime index
-    df = df.apply(pd.to_numeric, errors="coerce").sort_index()
-    return df
+    df = pd.concat([chunks[y] for y in sorted(chunks)])
+    return df.loc[start:end]
+ 
+def entry_expiry(last_year):
+    """time.monotonic() deadline of an in-process entry built from data through last_year (None = never)."""
+    if not year_complete(last_year):                # POWER is still filling that year in
+        return time.monotonic() + CURRENT_YEAR_TTL_S
+    return None
+ 
+def expired(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+ 
+_history_cache = OrderedDict()      # key -> (PowerHistory, expiry)
+_history_lock = threading.Lock()
+_region_stores = {"scanned": 0.0, "stores": []}
+ 
+def region_stores():
+    """Ingested region stores holding every POWER_PARAMETERS variable (rescanned every REGION_RESCAN_S)."""
+    if not USE_REGION_STORES:
+        return []
+    now = time.monotonic()
+    with _history_lock:
+        if now - _region_stores["scanned"] > REGION_RESCAN_S or not _region_stores["scanned"]:
+            columns = POWER_PARAMETERS.split(",")
+            _region_stores["stores"] = [st for st in open_stores() if all(c in st.variables for c in columns)]
+            _region_stores["scanned"] = now
+        return _region_stores["stores"]
+ 
+def region_covers(lat, lon, start_yyyymmdd, end_yyyymmdd):
+    start, end = pd.to_datetime(start_yyyymmdd, format="%Y%m%d"), pd.to_datetime(end_yyyymmdd, format="%Y%m%d")
+    return any(store.covers(lat, lon, start, end) for store in region_stores())
+ 
+def region_history(lat, lon, start_yyyymmdd, end_yyyymmdd):
+    """History from an ingested region store that holds this cell and span completely, else None."""
+    start, end = pd.to_datetime(start_yyyymmdd, format="%Y%m%d"), pd.to_datetime(end_yyyymmdd, format="%Y%m%d")
+    stores = region_stores()
+    for store in stores:
+        history = store.history(lat, lon, start, end)
+        if history is not None:
+            CACHE_LOOKUPS.inc(cache="region", result="hit")
+            return history
+    if stores:
+        CACHE_LOOKUPS.inc(cache="region", result="miss")
+    return None
+ 
+ 
+@timed("load_history")
+def load_history(lat, lon, start_yyyymmdd, end_yyyymmdd):
+    """fetch_power as a compact PowerHistory, kept in an in-process LRU bounded by HISTORY_CACHE_MAX_BYTES."""
+    key = location_key(lat, lon) + (start_yyyymmdd, end_yyyymmdd)
+    with _history_lock:
+        history = None
+        entry = _history_cache.get(key)
+        if entry is not None and not expired(entry[1]):
+            history = entry[0]
+            _history_cache.move_to_end(key)
+    CACHE_LOOKUPS.inc(cache="history", result="hit" if history is not None else "miss")
+    if history is not None:
+        return history
+    history = region_history(lat, lon, start_yyyymmdd, end_yyyymmdd)
+    if history is None:
+        history = PowerHistory.from_frame(fetch_power(lat, lon, start_yyyymmdd, end_yyyymmdd),
+                                          columns=POWER_PARAMETERS.split(","))
+    with _history_lock:
+        _history_cache[key] = (history, entry_expiry(int(end_yyyymmdd[:4])))
+        _history_cache.move_to_end(key)
+        total = sum(h.nbytes for h, _ in _history_cache.values())
+        while total > HISTORY_CACHE_MAX_BYTES and len(_history_cache) > 1:
+            _, (dropped, _) = _history_cache.popitem(last=False)
+            total -= dropped.nbytes
+    return history
+ 
+def grid_cell(lat, lon):
+    """Centre of the NASA POWER grid cell containing (lat, lon); the point itself if SNAP_TO_GRID is off."""
+    lat, lon = float(lat), float(lon)
+    if not SNAP_TO_GRID:
+        return lat, lon
+    lat_c = min(max(float(np.floor(lat / GRID_LAT_STEP + 0.5)) * GRID_LAT_STEP, -90.0), 90.0)
+    lon_c = float(np.floor(lon / GRID_LON_STEP + 0.5)) * GRID_LON_STEP
+    if lon_c >= 180.0:
+        lon_c -= 360.0
+    return lat_c, lon_c
+ 
+def location_key(lat, lon):
+    """In-process cache key for a point: its grid cell (same rounding as the disk cache)."""
+    lat, lon = grid_cell(lat, lon)
+    d = power_cache.coord_decimals if power_cache is not None else 2
+    return (round(lat, d), round(lon, d))
+ 
+def location_echo(lat, lon):
+    """Requested coordinates plus the grid cell whose history answered them (response "location")."""
+    cell_lat, cell_lon = grid_cell(lat, lon)
+    return {"lat": float(lat), "lon": float(lon), "grid_lat": cell_lat, "grid_lon": cell_lon}
  
 # =========================
 # === RAIN MODEL (LEVEL-2)
@@ -89,22 +328,56 @@ def classify_intensity(mm):
     else:
         return "heavy"
  
+INTENSITY_CLASSES = ("no_rain", "moderate", "heavy")   # intensity codes 0, 1, 2
+ 
+def intensity_codes(mm):
+    """Vectorized classify_intensity as int8 codes into INTENSITY_CLASSES (NaN -> heavy, as there)."""
+    mm = np.asarray(mm, dtype=float)
+    return np.where(mm < NO_RAIN_THRESHOLD, 0, np.where(mm < HEAVY_THRESHOLD, 1, 2)).astype(np.int8)
+ 
+# Per-day features of a PowerHistory, built on first use and memoized on the (cached) history object
+def day_of_year0(history):
+    """0-based day of year, leap DOY 366 folded into 365 (int16)."""
+    return history.derived("doy0", lambda h: (np.minimum(h.dates.dayofyear.to_numpy(), 365) - 1).astype(np.int16))
+ 
+def month_of(history):
+    return history.derived("month", lambda h: h.dates.month.to_numpy().astype(np.int8))
+ 
+def year_of(history):
+    return history.derived("year", lambda h: h.dates.year.to_numpy().astype(np.int16))
+ 
+def wet_flags(history):
+    """1 where PRECTOTCORR >= NO_RAIN_THRESHOLD (NaN -> dry), uint8."""
+    return history.derived("wet", lambda h: (h["PRECTOTCORR"] >= NO_RAIN_THRESHOLD).astype(np.uint8))
+ 
+def rain_intensity(history):
+    return history.derived("intensity", lambda h: intensity_codes(h["PRECTOTCORR"]))
+ 
+@timed("add_calendar_and_flags")
 def add_calendar_and_flags(df_precip):
-    df = df_precip.copy()
-    doy = df["date"].dt.dayofyear
-    df["doy"] = doy.where(doy != 366, 365)     # map leap DOY to 365
-    df["month"] = df["date"].dt.month
-    df["class"] = [classify_intensity(x) for x in df["precip_mm"]]
-    df["wet"] = (df["precip_mm"] >= NO_RAIN_THRESHOLD).astype(int)
-    return df
+    """doy / month / class (categorical, INTENSITY_CLASSES) / wet columns for a date + precip_mm frame."""
+    doy = df_precip["date"].dt.dayofyear.to_numpy()
+    precip = df_precip["precip_mm"].to_numpy(dtype=float)
+    return df_precip.assign(**{
+        "doy": np.minimum(doy, 365),     # map leap DOY to 365
+        "month": df_precip["date"].dt.month.to_numpy(),
+        "class": pd.Categorical.from_codes(intensity_codes(precip), INTENSITY_CLASSES),
+        "wet": (precip >= NO_RAIN_THRESHOLD).astype(int),
+    })
  
 def circular_doy_distance(d1, d2):
-    raw = abs(d1 - d2)
-    return min(raw, 365 - raw)
+    """Works on scalars and NumPy arrays alike."""
+    raw = np.abs(d1 - d2)
+    return np.minimum(raw, 365 - raw)
+ 
+def seasonal_window_mask(doy, target_doy, half_width):
+    """Boolean mask over a DOY array: rows within +/- half_width days of target_doy (wrapping at year end)."""
+    return circular_doy_distance(np.asarray(doy), target_doy) <= half_width
  
 def seasonal_window(df, target_doy, half_width):
-    return df[df["doy"].apply(lambda d: circular_doy_distance(d, target_doy) <= half_width)]
+    return df[seasonal_window_mask(df["doy"].to_numpy(), target_doy, half_width)]
  
+@timed("seasonal_probs")
 def seasonal_probs(df, target_date, half_width=SMOOTH_WINDOW_DAYS):
     target = pd.to_datetime(target_date, errors="coerce")
     if pd.isna(target):
@@ -112,15 +385,16 @@ def seasonal_probs(df, target_date, half_width=SMOOTH_WINDOW_DAYS):
     target_doy = target.timetuple().tm_yday
     if target_doy == 366:
         target_doy = 365
-    sub = seasonal_window(df, target_doy, half_width)
-    n = len(sub)
+    mask = seasonal_window_mask(df["doy"].to_numpy(), target_doy, half_width)
+    n = int(mask.sum())
     if n == 0:
         raise RuntimeError("No historical samples in seasonal window.")
-    p_rain = sub["wet"].mean()
-    wet_sub = sub[sub["wet"] == 1]
-    if len(wet_sub) > 0:
-        f_mod = (wet_sub["class"] == "moderate").mean()
-        f_hev = (wet_sub["class"] == "heavy").mean()
+    wet = df["wet"].to_numpy()[mask]
+    p_rain = wet.mean()
+    wet_class = pd.Categorical(df["class"], categories=INTENSITY_CLASSES).codes[mask][wet == 1]
+    if len(wet_class) > 0:
+        f_mod = (wet_class == 1).mean()
+        f_hev = (wet_class == 2).mean()
     else:
         f_mod = np.nan; f_hev = np.nan
     return {
@@ -134,27 +408,33 @@ def seasonal_probs(df, target_date, half_width=SMOOTH_WINDOW_DAYS):
         }
     }
  
+@timed("monthly_markov")
 def monthly_markov(df):
-    """For each month m: P(W|W_prev,m), P(W|D_prev,m) and denominators."""
-    x = df.sort_values("date").copy()
-    x["wet_prev"] = x["wet"].shift(1)
-    valid = x.dropna(subset=["wet_prev"]).copy()
-    out = {}
-    for m in range(1, 13):
-        vm = valid[valid["month"] == m]
-        if len(vm) == 0:
-            out[m] = {"P_W_given_W": np.nan, "P_W_given_D": np.nan,
-                      "den_Wprev": 0, "den_Dprev": 0}
-            continue
-        den_Wprev = int((vm["wet_prev"] == 1).sum())
-        den_Dprev = int((vm["wet_prev"] == 0).sum())
-        num_WW   = int(((vm["wet_prev"] == 1) & (vm["wet"] == 1)).sum())
-        num_DW   = int(((vm["wet_prev"] == 0) & (vm["wet"] == 1)).sum())
-        p_w_w = (num_WW / den_Wprev) if den_Wprev > 0 else np.nan
-        p_w_d = (num_DW / den_Dprev) if den_Dprev > 0 else np.nan
-        out[m] = {"P_W_given_W": p_w_w, "P_W_given_D": p_w_d,
-                  "den_Wprev": den_Wprev, "den_Dprev": den_Dprev}
-    return out
+    """
+    Day-to-day wet/dry transition counts by month of the later day, in one pass:
+    counts[month - 1, prev_state, state] with states 0 = dry, 1 = wet (int64, shape (12, 2, 2)).
+    Counts from different periods can simply be added; see markov_probs for the probabilities.
+    """
+    dates = df["date"].to_numpy()
+    order = None if df["date"].is_monotonic_increasing else np.argsort(dates, kind="stable")
+    wet = df["wet"].to_numpy().astype(np.int64)
+    month = df["month"].to_numpy().astype(np.int64)
+    if order is not None:
+        wet, month = wet[order], month[order]
+    codes = ((month[1:] - 1) * 2 + wet[:-1]) * 2 + wet[1:]
+    return np.bincount(codes, minlength=48).reshape(12, 2, 2)
+ 
+def markov_probs(counts):
+    """For each month (index month - 1): P(W|W_prev), P(W|D_prev) and denominators, as 12-element arrays."""
+    den_w = counts[:, 1, :].sum(axis=1)
+    den_d = counts[:, 0, :].sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "P_W_given_W": np.where(den_w > 0, counts[:, 1, 1] / den_w, np.nan),
+            "P_W_given_D": np.where(den_d > 0, counts[:, 0, 1] / den_d, np.nan),
+            "den_Wprev": den_w,
+            "den_Dprev": den_d,
+        }
  
 def blend_probs(p_climo, p_markov, mode="equal", n_climo=None, n_markov=None, cap=0.85, w_persist=None):
     if np.isnan(p_markov):
@@ -170,26 +450,35 @@ def blend_probs(p_climo, p_markov, mode="equal", n_climo=None, n_markov=None, ca
         return (1.0 - w_m) * p_climo + w_m * p_markov
     return 0.5 * (p_climo + p_markov)
  
+def rain_frame(df_full):
+    """Precip df for the rain model (date, precip_mm + calendar features and flags); PowerHistory or frame."""
+    history = as_history(df_full)
+    if "PRECTOTCORR" not in history:
+        raise RuntimeError("PRECTOTCORR not found in fetched data.")
+    return pd.DataFrame({
+        "date": history.dates,
+        "precip_mm": history["PRECTOTCORR"],
+        "doy": day_of_year0(history) + 1,
+        "month": month_of(history),
+        "class": pd.Categorical.from_codes(rain_intensity(history), INTENSITY_CLASSES),
+        "wet": wet_flags(history),
+    })
+ 
 def level2_rain(lat, lon, target_date, df_full,
                 smooth_window_days=SMOOTH_WINDOW_DAYS,
                 blend_mode=BLEND_MODE,
                 y_infer_mode=YESTERDAY_INFERENCE,
                 persistence_weight=PERSISTENCE_WEIGHT):
-    # Build precip df for the rain model
-    if "PRECTOTCORR" not in df_full.columns:
-        raise RuntimeError("PRECTOTCORR not found in fetched data.")
-    df_precip = df_full[["PRECTOTCORR"]].rename(columns={"PRECTOTCORR": "precip_mm"}).copy()
-    df_precip = df_precip.reset_index().rename(columns={"index": "date"})
- 
     # Prep / features
-    df = add_calendar_and_flags(df_precip)
+    history = as_history(df_full)
+    df = rain_frame(history)
     season = seasonal_probs(df, target_date, half_width=smooth_window_days)
     p_climo, n_climo = season["p_climo"], season["n_climo"]
  
     # Markov by month
     month = pd.to_datetime(target_date).month
-    markov = monthly_markov(df)
-    rec = markov.get(month, {"P_W_given_W": np.nan, "P_W_given_D": np.nan, "den_Wprev":0, "den_Dprev":0})
+    markov = markov_probs(monthly_markov(df))
+    rec = {k: v[month - 1] for k, v in markov.items()}
     p_w_w = rec["P_W_given_W"]; p_w_d = rec["P_W_given_D"]
  
     # Yesterday inference
@@ -204,26 +493,32 @@ def level2_rain(lat, lon, target_date, df_full,
             prev_year_yday = yesterday_dt.replace(year=yesterday_dt.year - 1)
         except ValueError:
             prev_year_yday = yesterday_dt.replace(year=yesterday_dt.year - 1, day=28)
-        row = df[df["date"] == prev_year_yday]
-        if len(row):
-            ystate_proxy = "wet" if float(row.iloc[0]["precip_mm"]) >= NO_RAIN_THRESHOLD else "dry"
+        i = history.offset(prev_year_yday)
+        if 0 <= i < len(history):
+            ystate_proxy = "wet" if wet_flags(history)[i] else "dry"
             p_markov = p_w_w if ystate_proxy == "wet" else p_w_d
-            n_markov_den = rec["den_Wprev"] if ystate_proxy == "wet" else rec["den_Dprev"]
+            n_markov_den = int(rec["den_Wprev"] if ystate_proxy == "wet" else rec["den_Dprev"])
  
     if (np.isnan(p_markov) or y_infer_mode == "yday_climo") and (not np.isnan(p_w_w) and not np.isnan(p_w_d)):
         season_yday = seasonal_probs(df, str(yesterday_dt.date()), half_width=smooth_window_days)
         p_yday = season_yday["p_climo"]
         p_markov = p_w_w * p_yday + p_w_d * (1.0 - p_yday)
-        n_markov_den = rec["den_Wprev"] + rec["den_Dprev"]
+        n_markov_den = int(rec["den_Wprev"] + rec["den_Dprev"])
  
+    f_mod = season["cond_wet_split"]["f_moderate_given_wet"]
+    f_hev = season["cond_wet_split"]["f_heavy_given_wet"]
+    return finalize_rain(p_climo, n_climo, p_markov, n_markov_den, f_mod, f_hev,
+                         blend_mode=blend_mode, persistence_weight=persistence_weight)
+ 
+def finalize_rain(p_climo, n_climo, p_markov, n_markov_den, f_mod, f_hev,
+                  blend_mode=BLEND_MODE, persistence_weight=PERSISTENCE_WEIGHT):
+    """Blend climatology with persistence and split the wet probability into intensity classes."""
     # Blend
     p_final = blend_probs(p_climo, p_markov,
                           mode=blend_mode, n_climo=n_climo, n_markov=n_markov_den,
                           w_persist=persistence_weight)
  
     # Split intensities
-    f_mod = season["cond_wet_split"]["f_moderate_given_wet"]
-    f_hev = season["cond_wet_split"]["f_heavy_given_wet"]
     if f_mod is None or f_hev is None or np.isnan(f_mod) or np.isnan(f_hev):
         P_moderate = np.nan; P_heavy = np.nan
     else:
@@ -241,6 +536,9 @@ def level2_rain(lat, lon, target_date, df_full,
 # =========================
 # === TEMP & WIND CATS ====
 # =========================
+TEMP_CATEGORIES = ["Very Cold", "Cold", "Mild", "Warm / Hot", "Very Hot"]
+WIND_CATEGORIES = ["No Wind", "Windy"]
+ 
 def categorize_temp_simple(temp_c):
     if pd.isna(temp_c): return None
     if temp_c < 0:   return "Very Cold"
@@ -253,74 +551,1501 @@ def categorize_wind_speed_ms(ws_ms):
     if pd.isna(ws_ms): return None
     return "No Wind" if ws_ms < WINDY_THRESHOLD_MS else "Windy"
  
+# Bin edges + labels equivalent to the categorizers above (np.digitize: edges[i-1] <= x < edges[i])
+CATEGORY_BINS = {
+    categorize_temp_simple: ([0.0, 10.0, 20.0, 30.0], TEMP_CATEGORIES),
+    categorize_wind_speed_ms: ([WINDY_THRESHOLD_MS], WIND_CATEGORIES),
+}
+ 
+def category_codes(values, categories, categorizer):
+    """Index into categories for every value (-1 = missing / not one of categories)."""
+    values = np.asarray(values, dtype=float)
+    bins = CATEGORY_BINS.get(categorizer)
+    if bins is not None:
+        edges, labels = bins
+        remap = np.array([categories.index(c) if c in categories else -1 for c in labels])
+        codes = remap[np.digitize(values, edges)]
+    else:
+        # Custom categorizer: one call per value
+        cat_index = {c: i for i, c in enumerate(categories)}
+        codes = np.array([cat_index.get(categorizer(v), -1) for v in values], dtype=int)
+    return np.where(np.isnan(values), -1, codes)
+ 
+def category_feature(history, column, categories, categorizer):
+    """category_codes of a whole history column (int8), memoized on the history."""
+    key = f"codes:{column}:{getattr(categorizer, '__name__', id(categorizer))}:{'|'.join(categories)}"
+    return history.derived(key, lambda h: category_codes(h[column], categories, categorizer).astype(np.int8))
+ 
+@timed("category_probabilities")
 def category_probabilities_weighted_days(df, target_date, column, categories,
                                          last_n_years=ROLLING_YEARS, half_window_days=TW_HALF_WINDOW_DAYS,
                                          categorizer=None):
+    """
+    Weighted category probabilities (%) for target_date from the previous last_n_years years.
+    Per year: triangular day kernel around the anchor date (clipped to that calendar year);
+    years are then averaged with weights N, N-1, ... (most recent first).
+    """
     # target date
     try:
         anchor = pd.to_datetime(target_date, format="%Y%m%d", errors="raise")
     except Exception:
         anchor = pd.to_datetime(target_date)
  
-    year_distributions = []
-    year_weights = []
- 
-    # Loop over past years (exclude target year)
-    for i, y in enumerate(range(anchor.year - 1, anchor.year - last_n_years - 1, -1)):
-        y_weight = last_n_years - i
-        year_weights.append(y_weight)
- 
+    # Anchor date in each past year (exclude target year), Feb 29 -> Feb 28 in common years
+    years = anchor.year - 1 - np.arange(last_n_years)
+    anchors = []
+    for y in years:
         try:
-            anchor_y = anchor.replace(year=y)
+            anchors.append(anchor.replace(year=int(y)))
         except ValueError:
-            anchor_y = anchor.replace(year=y, day=28)
+            anchors.append(anchor.replace(year=int(y), day=28))
+    anchors = pd.DatetimeIndex(anchors)
+ 
+    # All days that can fall in any year's window, in one slice (integer day offsets on the history axis)
+    history = as_history(df)
+    lo = max(history.offset(anchors.min()) - half_window_days, 0)
+    hi = min(history.offset(anchors.max()) + half_window_days + 1, history.n_days)
+    hi = max(hi, lo)
+    i_year = anchor.year - 1 - year_of(history)[lo:hi].astype(int)
+    in_range = (i_year >= 0) & (i_year < last_n_years)
+    i_year = np.where(in_range, i_year, 0)
+    anchor_offsets = ((anchors - history.start) // pd.Timedelta(days=1)).to_numpy()
+    day_diff = np.arange(lo, hi) - anchor_offsets[i_year]
+    weights = (half_window_days - np.abs(day_diff) + 1).astype(float)     # triangular kernel
+    codes = category_feature(history, column, categories, categorizer)[lo:hi]
+    keep = in_range & (weights > 0) & (codes >= 0)
+ 
+    k = len(categories)
+    weighted_counts = np.bincount(i_year[keep] * k + codes[keep], weights=weights[keep],
+                                  minlength=last_n_years * k).reshape(last_n_years, k)
+    total = weighted_counts.sum(axis=1)
+    valid = total > 0
+    if not valid.any():
+        return categories, None
+ 
+    # Year weights N, N-1, ... with skipped years zeroed, paired with the valid years in order
+    year_weights = np.where(valid, last_n_years - np.arange(last_n_years), 0)[:valid.sum()]
+    if year_weights.sum() == 0:
+        return categories, None
+    year_probs = 100.0 * weighted_counts[valid] / total[valid][:, None]
+    mean_probs = (year_probs * year_weights[:, None]).sum(axis=0) / year_weights.sum()
+    return categories, pd.Series(mean_probs, index=categories)
+ 
+# =========================
+# === YEAR STATISTICS =====
+# =========================
+# Both models only need counts, so each (location, year) is reduced once to additive statistics:
+#   rain        per-DOY day counts [n, wet, moderate, heavy]            (365, 4)
+#   markov      within-year transition counts (see monthly_markov)      (12, 2, 2)
+#   categories  per-month-day kernel category probabilities (%) + valid (366, K), (366,)
+# HistoryStats keeps running rain / markov sums and the per-year category rows, so rolling the
+# history window forward is one add + one drop instead of a rescan of 20 years of daily data.
+CATEGORY_VARIABLES = {
+    "temperature": ("T2M_MAX", TEMP_CATEGORIES, categorize_temp_simple),
+    "wind": ("WS10M_MAX", WIND_CATEGORIES, categorize_wind_speed_ms),
+}
+MONTH_DAYS = pd.date_range("2000-01-01", "2000-12-31", freq="D")   # leap calendar: one row per month-day
+MONTH_DAY_INDEX = pd.Index(MONTH_DAYS.strftime("%m-%d"), name="month_day")
+ 
+def year_category_probs(history, year, column, categories, categorizer, half_window_days=TW_HALF_WINDOW_DAYS):
+    """
+    Kernel-weighted category probabilities (%) of one year for every month-day anchor, and which anchors
+    have data. Triangular kernel convolution of the one-hot categories, clipped at the year edges.
+    """
+    days = pd.date_range(pd.Timestamp(year, 1, 1), pd.Timestamp(year, 12, 31), freq="D")
+    k = len(categories)
+    kernel = (half_window_days + 1 - np.abs(np.arange(-half_window_days, half_window_days + 1))).astype(float)
+    codes = history.between(category_feature(history, column, categories, categorizer), days[0], days[-1], fill=-1)
+    onehot = (codes[:, None] == np.arange(k)[None, :]).astype(float)
+    weighted = np.stack([np.convolve(onehot[:, j], kernel, mode="same") for j in range(k)], axis=1)
+    # Anchor day of each month-day in this year (Feb 29 -> Feb 28 in common years)
+    anchor = MONTH_DAYS.dayofyear.to_numpy() - 1
+    if len(days) == 365:
+        anchor = np.where(anchor >= 59, anchor - 1, anchor)
+    counts = weighted[anchor]
+    total = counts.sum(axis=1)
+    valid = total > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        probs = np.where(valid[:, None], 100.0 * counts / total[:, None], 0.0)
+    return probs, valid
+ 
+@timed("year_stats")
+def year_stats(history, year, half_window_days=TW_HALF_WINDOW_DAYS):
+    """Additive statistics of one calendar year of a PowerHistory (None if the year has no days)."""
+    lo, hi = history.bounds(pd.Timestamp(year, 1, 1), pd.Timestamp(year, 12, 31))
+    if hi == lo:
+        return None
+    ys = {"year": int(year), "first_date": history.start + pd.Timedelta(days=lo),
+          "last_date": history.start + pd.Timedelta(days=hi - 1),
+          "rain": np.zeros((365, 4), dtype=np.int64), "markov": np.zeros((12, 2, 2), dtype=np.int64),
+          "wet": None, "categories": {}}
+    if "PRECTOTCORR" in history:
+        wet = wet_flags(history)[lo:hi]                        # NaN -> dry, as in add_calendar_and_flags
+        intensity = rain_intensity(history)[lo:hi]
+        doy0 = day_of_year0(history)[lo:hi]
+        ys["rain"] = np.stack([
+            np.bincount(doy0, minlength=365),
+            np.bincount(doy0, weights=wet, minlength=365),
+            np.bincount(doy0, weights=intensity == 1, minlength=365),
+            np.bincount(doy0, weights=wet & (intensity == 2), minlength=365),
+        ], axis=1).astype(np.int64)
+        w = wet.astype(np.int64)
+        codes = ((month_of(history)[lo + 1:hi].astype(np.int64) - 1) * 2 + w[:-1]) * 2 + w[1:]
+        ys["markov"] = np.bincount(codes, minlength=48).reshape(12, 2, 2)
+        ys["wet"] = wet.copy()
+    for variable, (column, categories, categorizer) in CATEGORY_VARIABLES.items():
+        if column in history:
+            ys["categories"][variable] = year_category_probs(history, year, column, categories, categorizer,
+                                                             half_window_days=half_window_days)
+    return ys
+ 
+def year_weighted_mean(probs, valid):
+    """
+    Year-weighted mean of per-year category rows, probs (N, rows, K) / valid (N, rows) ordered most
+    recent year first. Year weights N, N-1, ... are paired with the valid years in order (as in the
+    per-year loop of category_probabilities_weighted_days).
+    """
+    n_years = len(probs)
+    base = (n_years - np.arange(n_years)).astype(float)[:, None]
+    w_eff = np.where(valid, base, 0.0)
+    rank = np.clip(np.cumsum(valid, axis=0) - 1, 0, None)
+    paired = np.where(valid, np.take_along_axis(w_eff, rank, axis=0), 0.0)
+    n_valid = valid.sum(axis=0)
+    w_cum = np.cumsum(w_eff, axis=0)
+    w_sum = np.where(n_valid > 0, w_cum[np.clip(n_valid - 1, 0, None), np.arange(probs.shape[1])], 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (probs * paired[:, :, None]).sum(axis=0) / w_sum[:, None]
+    mean[w_sum == 0] = np.nan
+    return mean
+ 
+def recent_wet_series(years, end_year):
+    """Daily wet flags of end_year - 1 and end_year from {year: year_stats}."""
+    recent = [years[y] for y in (end_year - 1, end_year) if y in years and years[y]["wet"] is not None]
+    if not recent:
+        return pd.Series(dtype=np.uint8)
+    return pd.concat([pd.Series(ys["wet"], index=pd.date_range(ys["first_date"], ys["last_date"], freq="D"))
+                      for ys in recent])
+ 
+class HistoryStats:
+    """Running rain / markov sums of year_stats over a set of years at one location, plus each year's rows."""
+ 
+    def __init__(self, last_n_years=ROLLING_YEARS, half_window_days=TW_HALF_WINDOW_DAYS):
+        self.last_n_years = last_n_years
+        self.half_window_days = half_window_days
+        self.years = {}
+        self.rain = np.zeros((365, 4), dtype=np.int64)
+        self.markov = np.zeros((12, 2, 2), dtype=np.int64)
+        self.lock = threading.Lock()
+ 
+    def add(self, ys):
+        y = ys["year"]
+        if y in self.years:
+            self.drop(y)
+        self._apply(ys, +1)
+        self.years[y] = ys
+        self._boundary(y - 1, y, +1)
+        self._boundary(y, y + 1, +1)
+ 
+    def drop(self, year):
+        if year not in self.years:
+            return
+        self._boundary(year - 1, year, -1)
+        self._boundary(year, year + 1, -1)
+        self._apply(self.years.pop(year), -1)
+ 
+    def _apply(self, ys, sign):
+        self.rain += sign * ys["rain"]
+        self.markov += sign * ys["markov"]
+ 
+    def _boundary(self, a, b, sign):
+        """Dec 31 -> Jan 1 transition between two adjacent stored years."""
+        ya, yb = self.years.get(a), self.years.get(b)
+        if ya is None or yb is None or ya["wet"] is None or yb["wet"] is None:
+            return
+        if ya["last_date"] + pd.Timedelta(days=1) != yb["first_date"]:
+            return
+        self.markov[yb["first_date"].month - 1, ya["wet"][-1], yb["wet"][0]] += sign
+ 
+    @timed("climatology_table")
+    def climatology(self, end_year, smooth_window_days=SMOOTH_WINDOW_DAYS):
+        """Climatology table for targets in end_year + 1; the stored years must lie in that history window."""
+        first_year = end_year - self.last_n_years + 1
+        if any(y < first_year or y > end_year for y in self.years):
+            raise ValueError(f"Stats hold years outside {first_year}..{end_year}.")
+        clim = {
+            "end_year": int(end_year),
+            "last_n_years": int(self.last_n_years),
+            "rain": rain_table(self.rain, half_width=smooth_window_days),
+            "markov": self.markov.copy(),
+            "recent_wet": self.recent_wet(end_year),
+            "temperature": None,
+            "wind": None,
+        }
+        for variable, (_, categories, _) in CATEGORY_VARIABLES.items():
+            mean = self.category_means(end_year, variable)
+            if mean is not None:
+                clim[variable] = pd.DataFrame(mean, columns=categories, index=MONTH_DAY_INDEX)
+        return clim
+ 
+    def recent_wet(self, end_year):
+        """Daily wet flags of end_year - 1 and end_year (for the "prev_year_yesterday" inference)."""
+        return recent_wet_series(self.years, end_year)
+ 
+    def category_means(self, end_year, variable):
+        """(366, K) year-weighted category percentages by month-day for the window ending end_year, or None."""
+        categories = CATEGORY_VARIABLES[variable][1]
+        n_rows = len(MONTH_DAYS)
+        per_year = [self.years.get(end_year - i, {}).get("categories", {}).get(variable)
+                    for i in range(self.last_n_years)]                # most recent year first
+        if all(v is None for v in per_year):
+            return None
+        probs = np.stack([v[0] if v is not None else np.zeros((n_rows, len(categories))) for v in per_year])
+        valid = np.stack([v[1] if v is not None else np.zeros(n_rows, dtype=bool) for v in per_year])
+        return year_weighted_mean(probs, valid)
+ 
+# =========================
+# === CLIMATOLOGY TABLE ===
+# =========================
+# Everything the models need for one location + history window, precomputed for every day of the year:
+#   rain        365 rows by DOY (366 folded into 365): window counts, p_climo and wet-day intensity split
+#   markov      monthly_markov transition counts, shape (12, 2, 2)
+#   temperature 366 rows by "MM-DD": year-weighted kernel category probabilities (%)
+#   wind        366 rows by "MM-DD"
+# Answering a target date is then a row lookup instead of a pass over ~7,300 daily rows.
+CLIMATOLOGY_CACHE_SIZE = 256        # tables kept in memory (one per location + history window)
+STATS_CACHE_SIZE = 128              # locations whose per-year HistoryStats are kept for rolling updates
+# Stored tables depend on these presets: changing one must not serve tables built with the old value
+STORE_VERSION = "|".join(str(v) for v in (
+    2, POWER_PARAMETERS, NO_RAIN_THRESHOLD, HEAVY_THRESHOLD, WINDY_THRESHOLD_MS,
+    SMOOTH_WINDOW_DAYS, TW_HALF_WINDOW_DAYS, ROLLING_YEARS))
+BATCH_MAX_QUERIES = 2000            # /predict_batch request size limit
+RANGE_MAX_DAYS = 366                # /predict_range span limit
+ 
+def circular_window_sum(counts, half_width):
+    """Sum of a per-DOY array (axis 0, length 365) over +/- half_width days, wrapping at year end."""
+    n = counts.shape[0]
+    if 2 * half_width + 1 >= n:
+        return np.broadcast_to(counts.sum(axis=0), counts.shape).copy()
+    padded = np.concatenate([counts[-half_width:], counts, counts[:half_width]])
+    csum = np.concatenate([np.zeros((1,) + counts.shape[1:], dtype=counts.dtype), np.cumsum(padded, axis=0)])
+    return csum[2 * half_width + 1:] - csum[:n]
+ 
+def rain_table(counts, half_width=SMOOTH_WINDOW_DAYS):
+    """seasonal_probs for every target DOY at once, from per-DOY [n, wet, moderate, heavy] day counts."""
+    n, n_wet, n_mod, n_hev = circular_window_sum(counts, half_width).T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        table = pd.DataFrame({
+            "n_climo": n,
+            "n_wet": n_wet,
+            "n_moderate": n_mod,
+            "n_heavy": n_hev,
+            "p_climo": np.where(n > 0, n_wet / n, np.nan),
+            "f_moderate_given_wet": np.where(n_wet > 0, n_mod / n_wet, np.nan),
+            "f_heavy_given_wet": np.where(n_wet > 0, n_hev / n_wet, np.nan),
+        }, index=pd.RangeIndex(1, 366, name="doy"))
+    return table
+ 
+@timed("build_climatology")
+def build_climatology(df_all, end_year, last_n_years=ROLLING_YEARS,
+                      smooth_window_days=SMOOTH_WINDOW_DAYS, tw_half_window_days=TW_HALF_WINDOW_DAYS):
+    """All per-day-of-year statistics for targets in year end_year + 1 (df_all = that history window)."""
+    history = as_history(df_all)
+    stats = HistoryStats(last_n_years=last_n_years, half_window_days=tw_half_window_days)
+    for y in range(max(end_year - last_n_years + 1, history.start.year), end_year + 1):
+        ys = year_stats(history, y, half_window_days=tw_half_window_days)
+        if ys is not None:
+            stats.add(ys)
+    return stats.climatology(end_year, smooth_window_days=smooth_window_days)
+ 
+def blend_probs_array(p_climo, p_markov, mode="equal", n_climo=None, n_markov=None, cap=0.85, w_persist=None):
+    """blend_probs applied elementwise to arrays (w_persist may be an array broadcast against them)."""
+    p_climo = np.asarray(p_climo, dtype=float)
+    p_markov = np.asarray(p_markov, dtype=float)
+    if w_persist is not None:
+        w = np.clip(np.asarray(w_persist, dtype=float), 0.0, 1.0)
+        blended = (1.0 - w) * p_climo + w * p_markov
+    elif mode == "sample_weighted" and n_climo is not None and n_markov is not None:
+        n_climo = np.asarray(n_climo, dtype=float); n_markov = np.asarray(n_markov, dtype=float)
+        w_m = n_markov / (n_climo + n_markov + 1e-9)
+        w_m = np.minimum(np.maximum(w_m, 0.15), cap)
+        blended = np.where(n_climo + n_markov > 0, (1.0 - w_m) * p_climo + w_m * p_markov, 0.5 * (p_climo + p_markov))
+    else:
+        blended = 0.5 * (p_climo + p_markov)
+    blended = np.where(np.isnan(p_climo), p_markov, blended)
+    return np.where(np.isnan(p_markov), p_climo, blended)
+ 
+@timed("rain_lookup")
+def rain_from_climatology_many(clim, dates,
+                               blend_mode=BLEND_MODE,
+                               y_infer_mode=YESTERDAY_INFERENCE,
+                               persistence_weight=PERSISTENCE_WEIGHT):
+    """
+    level2_rain for many target dates at once, from table lookups (arrays aligned with dates).
+    "ok" is False where level2_rain would raise (no samples in a seasonal window); those rows are NaN.
+    """
+    dates = pd.DatetimeIndex(dates)
+    rain = clim["rain"]
+    p_tab = rain["p_climo"].to_numpy()
+    n_tab = rain["n_climo"].to_numpy()
+    i_target = np.minimum(dates.dayofyear.to_numpy(), 365) - 1
+    yesterday = dates - pd.Timedelta(days=1)
+    i_yday = np.minimum(yesterday.dayofyear.to_numpy(), 365) - 1
+ 
+    # Markov by month
+    markov = markov_probs(clim["markov"])
+    m = dates.month.to_numpy() - 1
+    markov = {k: v[m] for k, v in markov.items()}
+ 
+    wet_prev = None
+    if y_infer_mode == "prev_year_yesterday":
+        prev_year_yday = yesterday - pd.DateOffset(years=1)   # Feb 29 -> Feb 28
+        wet_prev = clim["recent_wet"].reindex(prev_year_yday).to_numpy(dtype=float)
+ 
+    return rain_from_rows(p_tab[i_target], n_tab[i_target], p_tab[i_yday], n_tab[i_yday], markov, wet_prev,
+                          rain["f_moderate_given_wet"].to_numpy()[i_target],
+                          rain["f_heavy_given_wet"].to_numpy()[i_target],
+                          blend_mode=blend_mode, y_infer_mode=y_infer_mode, persistence_weight=persistence_weight)
+ 
+def rain_from_rows(p_climo, n_climo, p_yday, n_yday, markov, wet_prev, f_mod, f_hev,
+                   blend_mode=BLEND_MODE,
+                   y_infer_mode=YESTERDAY_INFERENCE,
+                   persistence_weight=PERSISTENCE_WEIGHT):
+    """
+    Elementwise core of rain_from_climatology_many: table rows already gathered for each output element
+    (dates of one location, or cells of one date for /predict_grid). markov holds markov_probs rows of the
+    target month; wet_prev the observed wet state of last year's yesterday (NaN = unknown, None = unused).
+    """
+    p_markov, n_markov_den, use_climo = yesterday_markov(p_climo, p_yday, markov, wet_prev, y_infer_mode)
+    ok = (n_climo > 0) & ~(use_climo & (n_yday == 0))
+ 
+    # Blend
+    p_final = blend_probs_array(p_climo, p_markov, mode=blend_mode, n_climo=n_climo, n_markov=n_markov_den,
+                                w_persist=persistence_weight)
+ 
+    # Split intensities
+    split = ~np.isnan(f_mod) & ~np.isnan(f_hev)
+    out = {
+        "P_rain_final": p_final,
+        "P_no_rain": 1.0 - p_final,
+        "P_moderate": np.where(split, p_final * f_mod, np.nan),
+        "P_heavy": np.where(split, p_final * f_hev, np.nan),
+    }
+    out = {k: np.where(ok, v, np.nan) for k, v in out.items()}
+    out["ok"] = ok
+    return out
+ 
+def yesterday_markov(p_climo, p_yday, markov, wet_prev, y_infer_mode=YESTERDAY_INFERENCE):
+    """
+    Markov rain probability from yesterday's (inferred) state, elementwise: (p_markov, n_markov_den, use_climo),
+    use_climo marking elements where yesterday's state was replaced by its climatological probability.
+    """
+    p_w_w = markov["P_W_given_W"]
+    p_w_d = markov["P_W_given_D"]
+    den_w = markov["den_Wprev"].astype(float)
+    den_d = markov["den_Dprev"].astype(float)
+ 
+    # Yesterday inference
+    p_markov = np.full(np.shape(p_climo), np.nan)
+    n_markov_den = np.zeros(np.shape(p_climo))
+ 
+    if y_infer_mode == "prev_year_yesterday" and wet_prev is not None:
+        found = ~np.isnan(wet_prev)
+        p_markov = np.where(found, np.where(wet_prev == 1, p_w_w, p_w_d), np.nan)
+        n_markov_den = np.where(found, np.where(wet_prev == 1, den_w, den_d), 0.0)
+ 
+    use_climo = (np.isnan(p_markov) | (y_infer_mode == "yday_climo")) & ~np.isnan(p_w_w) & ~np.isnan(p_w_d)
+    p_markov = np.where(use_climo, p_w_w * p_yday + p_w_d * (1.0 - p_yday), p_markov)
+    n_markov_den = np.where(use_climo, den_w + den_d, n_markov_den)
+    return p_markov, n_markov_den, use_climo
+ 
+@timed("category_lookup")
+def categories_from_climatology_many(clim, dates, variable):
+    """(categories, n_dates x n_categories array of percent) for "temperature" or "wind"; NaN rows = no data."""
+    table = clim.get(variable)
+    if table is None:
+        return [], None
+    rows = table.index.get_indexer(pd.DatetimeIndex(dates).strftime("%m-%d"))
+    return list(table.columns), table.to_numpy()[rows]
+ 
+_climatology_cache = OrderedDict()  # key -> (climatology, expiry)
+_climatology_lock = threading.Lock()
+_climatology_flights = SingleFlight()
+ 
+_stats_cache = OrderedDict()
+ 
+def history_stats(lat, lon):
+    """The HistoryStats of a location (LRU); callers hold stats.lock while updating / reading it."""
+    key = location_key(lat, lon)
+    with _climatology_lock:
+        stats = _stats_cache.get(key)
+        if stats is None:
+            stats = _stats_cache[key] = HistoryStats()
+            while len(_stats_cache) > STATS_CACHE_SIZE:
+                _stats_cache.popitem(last=False)
+        _stats_cache.move_to_end(key)
+        return stats
+ 
+def update_history_stats(stats, lat, lon, first_year, last_year):
+    """
+    Roll stats to hold exactly first_year..last_year: drop years that left the window and add new ones,
+    from the shared store when another process already summarised them, else from fetched history.
+    """
+    for y in [y for y in stats.years if y < first_year or y > last_year]:
+        stats.drop(y)
+    missing = []
+    for y in range(first_year, last_year + 1):
+        if y in stats.years:
+            continue
+        ys = None
+        if model_store is not None and year_complete(y):
+            ys = model_store.get(model_store.key("year_stats", STORE_VERSION, *location_key(lat, lon), y))
+        if ys is not None:
+            stats.add(ys)
+        else:
+            missing.append(y)
+    for y0, y1 in missing_year_runs(missing):
+        history = load_history(lat, lon, f"{y0}0101", f"{y1}1231")
+        for y in range(y0, y1 + 1):
+            ys = year_stats(history, y, half_window_days=stats.half_window_days)
+            if ys is None:
+                continue
+            stats.add(ys)
+            # POWER is still filling in recent years: only share final ones
+            if model_store is not None and year_complete(y):
+                model_store.put(model_store.key("year_stats", STORE_VERSION, *location_key(lat, lon), y), ys, evict=False)
+    if missing and model_store is not None:
+        model_store.evict()
+ 
+def climatology_from_stats(lat, lon, first_year, last_year):
+    """Climatology of first_year..last_year from the location's rolling HistoryStats."""
+    # A new window (e.g. on Jan 1) only adds its newest year and drops its oldest one
+    stats = history_stats(lat, lon)
+    with stats.lock:
+        update_history_stats(stats, lat, lon, first_year, last_year)
+        clim = stats.climatology(last_year)
+        # Years POWER is still filling in are refetched next time: never keep their statistics
+        for y in [y for y in stats.years if not year_complete(y)]:
+            stats.drop(y)
+    return clim
+ 
+@timed("get_climatology")
+def get_climatology(lat, lon, date_str):
+    """
+    Climatology for the history window of date_str, built once per grid cell + window and cached:
+    in-process LRU first, then the shared store (complete windows only), then a build.
+    """
+    lat, lon = grid_cell(lat, lon)   # every click inside a cell shares one fetch and one table
+    _, _, hist_start_year, hist_end_year = compute_history_window(date_str, rolling_years=ROLLING_YEARS)
+    key = location_key(lat, lon) + (hist_start_year, hist_end_year)
+    clim = cached_climatology(key)
+    CACHE_LOOKUPS.inc(cache="climatology", result="hit" if clim is not None else "miss")
+    if clim is not None:
+        return clim
+ 
+    def local():
+        return climatology_from_stats(lat, lon, hist_start_year, hist_end_year)
+ 
+    def build():
+        if model_store is not None and year_complete(hist_end_year):
+            # One process builds a missing table, the other workers wait and read it
+            clim = model_store.get_or_build(model_store.key("climatology", STORE_VERSION, *key), local)
+        else:
+            clim = local()
+        remember_climatology(key, clim, hist_end_year)
+        return clim
+ 
+    # Concurrent first requests for the same point share one fetch + build
+    return _climatology_flights.do(key, build)
+ 
+def cached_climatology(key):
+    """In-process climatology for key, or None (missing, or holding not yet final years and older than its TTL)."""
+    with _climatology_lock:
+        entry = _climatology_cache.get(key)
+        if entry is None or expired(entry[1]):
+            return None
+        _climatology_cache.move_to_end(key)
+        return entry[0]
+ 
+def remember_climatology(key, clim, last_year):
+    with _climatology_lock:
+        _climatology_cache[key] = (clim, entry_expiry(last_year))
+        _climatology_cache.move_to_end(key)
+        while len(_climatology_cache) > CLIMATOLOGY_CACHE_SIZE:
+            _climatology_cache.popitem(last=False)
+ 
+def local_climatology(lat, lon, date_str):
+    """
+    get_climatology without new upstream calls: a cached table (memory / shared store) or a build from an
+    ingested region store; None when the cell would need a NASA POWER download.
+    """
+    lat, lon = grid_cell(lat, lon)
+    start_str, end_str, hist_start_year, hist_end_year = compute_history_window(date_str, rolling_years=ROLLING_YEARS)
+    key = location_key(lat, lon) + (hist_start_year, hist_end_year)
+    clim = cached_climatology(key)
+    if clim is not None:
+        return clim
+    if model_store is not None and year_complete(hist_end_year):
+        clim = model_store.get(model_store.key("climatology", STORE_VERSION, *key))
+        if clim is not None:
+            remember_climatology(key, clim, hist_end_year)
+            return clim
+    if region_covers(lat, lon, start_str, end_str):
+        return get_climatology(lat, lon, date_str)
+    return None
+ 
+# =========================
+# === FULL RECORD =========
+# =========================
+# Requests may choose their history length (history_years) and year weighting instead of the presets.
+# Those windows are cut from one LocationRecord per grid cell: the year_stats of every year since
+# FIRST_POWER_YEAR stacked along a year axis, so any window / weighting is a weighted sum over that axis
+# (no refetch, no rescan). The per-year statistics come from the shared store / disk cache as usual.
+RECORD_CACHE_SIZE = 32              # full records kept in memory (~1.5 MB each for 45 years)
+ 
+def year_weights(n_years, weighting="equal", half_life=YEAR_WEIGHT_HALF_LIFE):
+    """Weights of the window years, most recent first (index = age in years)."""
+    age = np.arange(n_years, dtype=float)
+    if weighting == "linear":
+        return n_years - age                                         # N, N-1, ..., 1 (as the category model)
+    if weighting == "exponential":
+        return 0.5 ** (age / float(half_life))
+    return np.ones(n_years)
+ 
+class LocationRecord:
+    """year_stats of one location stacked by year (ascending); see window_climatology()."""
+ 
+    def __init__(self, years):
+        years = sorted(years, key=lambda ys: ys["year"])
+        self.by_year = {ys["year"]: ys for ys in years}
+        self.years = np.array([ys["year"] for ys in years], dtype=int)
+        self.rain = np.stack([ys["rain"] for ys in years]).astype(np.int32)
+        self.markov = np.stack([ys["markov"] for ys in years]).astype(np.int32)
+        # Dec 31 -> Jan 1 transition into each year (HistoryStats._boundary), counted when both years are used
+        self.boundary = np.zeros_like(self.markov)
+        for i in range(1, len(years)):
+            a, b = years[i - 1], years[i]
+            if (a["year"] == b["year"] - 1 and a["wet"] is not None and b["wet"] is not None
+                    and a["last_date"] + pd.Timedelta(days=1) == b["first_date"]):
+                self.boundary[i, b["first_date"].month - 1, a["wet"][-1], b["wet"][0]] = 1
+        self.categories = {}
+        for variable, (_, categories, _) in CATEGORY_VARIABLES.items():
+            per_year = [ys["categories"].get(variable) for ys in years]
+            if all(v is None for v in per_year):
+                continue
+            n_rows = len(MONTH_DAYS)
+            self.categories[variable] = (
+                np.stack([v[0] if v is not None else np.zeros((n_rows, len(categories))) for v in per_year]),
+                np.stack([v[1] if v is not None else np.zeros(n_rows, dtype=bool) for v in per_year]))
+ 
+    @property
+    def nbytes(self):
+        return (self.rain.nbytes + self.markov.nbytes + self.boundary.nbytes
+                + sum(p.nbytes + v.nbytes for p, v in self.categories.values()))
+ 
+    def extended(self, years):
+        """A record with more / replaced years (e.g. the growing current year)."""
+        return LocationRecord(list({**self.by_year, **{ys["year"]: ys for ys in years}}.values()))
+ 
+@timed("window_climatology")
+def window_climatology(record, end_year, n_years, weighting="default", half_life=YEAR_WEIGHT_HALF_LIFE,
+                       smooth_window_days=SMOOTH_WINDOW_DAYS):
+    """
+    Climatology table of the n_years ending end_year, from a LocationRecord.
+    weighting "default" is the preset model (rain: every year equal; categories: N..1 recency weights paired
+    with valid years); any other scheme weights both models' years by year_weights() (rain weights scaled
+    to mean 1, so sample sizes stay comparable).
+    """
+    first_year = max(FIRST_POWER_YEAR, end_year - n_years + 1)
+    sel = np.flatnonzero((record.years >= first_year) & (record.years <= end_year))
+    if len(sel) == 0:
+        raise RuntimeError("No history in the requested window.")
+    age = end_year - record.years[sel]
+    w_age = year_weights(n_years, "equal" if weighting == "default" else weighting, half_life)
+    w = w_age[age]
+    w_rain = w * (len(w) / w.sum())
+    in_window_prev = record.years[sel] > first_year                  # boundary only between two window years
+    clim = {
+        "end_year": int(end_year),
+        "last_n_years": int(n_years),
+        "rain": rain_table(np.tensordot(w_rain, record.rain[sel], axes=1), half_width=smooth_window_days),
+        "markov": (np.tensordot(w_rain, record.markov[sel], axes=1)
+                   + np.tensordot(w_rain * in_window_prev, record.boundary[sel], axes=1)),
+        "recent_wet": recent_wet_series(record.by_year, end_year),
+        "temperature": None,
+        "wind": None,
+        "weighting": weighting,
+    }
+    for variable, (probs, valid) in record.categories.items():
+        categories = CATEGORY_VARIABLES[variable][1]
+        if weighting == "default":
+            # Most recent first, one slot per window year (missing years invalid), as HistoryStats.category_means
+            slot = np.full(n_years, -1)
+            slot[age] = sel
+            p = np.where(slot[:, None, None] >= 0, probs[slot], 0.0)
+            v = (slot[:, None] >= 0) & valid[slot]
+            mean = year_weighted_mean(p, v)
+        else:
+            wv = w[:, None] * valid[sel]                               # (years, rows)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.einsum("yr,yrk->rk", wv, probs[sel]) / wv.sum(axis=0)[:, None]
+        clim[variable] = pd.DataFrame(mean, columns=categories, index=MONTH_DAY_INDEX)
+    return clim
+ 
+_record_cache = OrderedDict()
+_record_flights = SingleFlight()
+ 
+def location_record(lat, lon, end_year):
+    """
+    LocationRecord of a grid cell: one cached record of FIRST_POWER_YEAR..the last final year (year_complete)
+    serves every window (window_climatology cuts the years it needs); later years are added, never cached,
+    when end_year reaches them.
+    """
+    lat, lon = grid_cell(lat, lon)
+    complete = pd.Timestamp.today().year - 1
+    while not year_complete(complete):
+        complete -= 1
+    key = location_key(lat, lon) + (complete,)
+    with _climatology_lock:
+        record = _record_cache.get(key)
+        if record is not None:
+            _record_cache.move_to_end(key)
+    CACHE_LOOKUPS.inc(cache="record", result="hit" if record is not None else "miss")
  
-        start_y = max(pd.Timestamp(y, 1, 1), anchor_y - timedelta(days=half_window_days))
-        end_y   = min(pd.Timestamp(y, 12, 31), anchor_y + timedelta(days=half_window_days))
+    def build():
+        stats = HistoryStats(last_n_years=complete - FIRST_POWER_YEAR + 1)
+        update_history_stats(stats, lat, lon, FIRST_POWER_YEAR, complete)
+        record = LocationRecord(list(stats.years.values()))
+        with _climatology_lock:
+            _record_cache[key] = record
+            while len(_record_cache) > RECORD_CACHE_SIZE:
+                _record_cache.popitem(last=False)
+        return record
  
-        sub = df.loc[start_y:end_y, [column]].copy()
-        if sub.empty:
-            year_weights[-1] = 0
+    if record is None:
+        record = _record_flights.do(key, build)
+    if end_year > complete:
+        current = HistoryStats(last_n_years=end_year - complete)
+        update_history_stats(current, lat, lon, complete + 1, end_year)
+        record = record.extended(list(current.years.values()))
+    return record
+ 
+def number_param(name, value, kind=float):
+    """A request parameter as int / float; the ValueError names the parameter instead of echoing the parser."""
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be {'an integer' if kind is int else 'a number'}") from None
+ 
+def requested_history(date_str, history_years=None, weighting=None, half_life=None):
+    """
+    Validated (history_years, weighting, half_life) of a request for date_str, or None for the preset model
+    (ROLLING_YEARS, "default"), which is served by get_climatology. An explicit history_years must fit in the
+    NASA POWER record before date_str's year; the default is clamped at FIRST_POWER_YEAR like the presets.
+    """
+    n_years = ROLLING_YEARS if history_years in (None, "") else number_param("history_years", history_years, int)
+    weighting = "default" if weighting in (None, "") else str(weighting)
+    if n_years < 1:
+        raise ValueError("history_years must be at least 1")
+    if history_years not in (None, ""):
+        record_years = pd.to_datetime(date_str).year - FIRST_POWER_YEAR
+        if n_years > record_years:
+            raise ValueError(f"history_years={n_years} exceeds the {max(record_years, 0)} years of NASA POWER record "
+                             f"({FIRST_POWER_YEAR} on) before {date_str}")
+    if weighting not in YEAR_WEIGHTINGS:
+        raise ValueError(f"year_weighting must be one of {', '.join(YEAR_WEIGHTINGS)}")
+    if weighting == "exponential":
+        half_life = YEAR_WEIGHT_HALF_LIFE if half_life in (None, "") else number_param("half_life", half_life)
+        if not half_life > 0:
+            raise ValueError("half_life must be positive")
+    else:
+        half_life = None
+    if n_years == ROLLING_YEARS and weighting == "default":
+        return None
+    return n_years, weighting, half_life
+ 
+def history_climatology(lat, lon, date_str, history=None):
+    """Climatology for date_str under a requested_history() spec (None = the presets, get_climatology)."""
+    if history is None:
+        return get_climatology(lat, lon, date_str)
+    n_years, weighting, half_life = history
+    lat, lon = grid_cell(lat, lon)
+    _, _, hist_start_year, hist_end_year = compute_history_window(date_str, rolling_years=n_years)
+    key = location_key(lat, lon) + (hist_start_year, hist_end_year, history)
+    clim = cached_climatology(key)
+    CACHE_LOOKUPS.inc(cache="climatology", result="hit" if clim is not None else "miss")
+    if clim is not None:
+        return clim
+    record = location_record(lat, lon, hist_end_year)
+    clim = window_climatology(record, hist_end_year, n_years, weighting, half_life or YEAR_WEIGHT_HALF_LIFE)
+    remember_climatology(key, clim, hist_end_year)
+    return clim
+ 
+def history_echo(clim, history):
+    n_years, weighting, half_life = history
+    out = {"history_years": n_years, "first_year": max(FIRST_POWER_YEAR, clim["end_year"] - n_years + 1),
+           "end_year": clim["end_year"], "year_weighting": weighting}
+    if half_life is not None:
+        out["half_life"] = half_life
+    return out
+ 
+# =========================
+# === CUSTOM THRESHOLDS ===
+# =========================
+# Client-chosen thresholds / bins instead of the fixed rain, temperature and wind classes. Per location and
+# history window, every DOY keeps the sorted samples of its seasonal window ((365, M) float32, NaN padded),
+# so P(X >= t) or the share of each bin [e_i, e_i+1) is a binary search in one row, for any t.
+# Samples are unweighted (every window day of every year counts once). Missing precipitation days count as
+# 0 mm (dry), as in the rain table, so P(precipitation >= NO_RAIN_THRESHOLD) is its p_climo; missing
+# temperature / wind days are left out, as in the category model.
+THRESHOLD_VARIABLES = {             # variable: (column, window half width, value of missing days or None)
+    "precipitation": ("PRECTOTCORR", SMOOTH_WINDOW_DAYS, 0.0),   # mm/day, rain model window
+    "temperature": ("T2M_MAX", TW_HALF_WINDOW_DAYS, None),        # degC
+    "wind": ("WS10M_MAX", TW_HALF_WINDOW_DAYS, None),             # m/s
+}
+SAMPLES_VERSION = repr(sorted(THRESHOLD_VARIABLES.items()))   # stored samples depend on these
+SAMPLES_CACHE_SIZE = 32             # locations + windows whose sorted samples are kept (~2 MB each)
+MAX_CUSTOM_THRESHOLDS = 64          # thresholds + bin edges per variable and request
+ 
+def doy_sorted_samples(history, column, half_width, missing=None):
+    """
+    (samples (365, M) float32, counts (365,)): row d holds every value within +/- half_width days of
+    DOY d + 1 (wrapping at year end, 366 folded into 365 as in the rain table), sorted with NaN last.
+    Missing days are left out, or take the value missing when it is given.
+    """
+    values = history[column]
+    if missing is not None:
+        values = np.where(np.isnan(values), np.float32(missing), values)
+    doy0 = day_of_year0(history)
+    order = np.argsort(doy0, kind="stable")
+    per_doy = np.bincount(doy0, minlength=365)
+    starts = np.cumsum(per_doy) - per_doy
+    by_doy = np.full((365, max(int(per_doy.max()), 1)), np.nan, dtype=np.float32)
+    by_doy[doy0[order], np.arange(len(order)) - starts[doy0[order]]] = values[order]
+    if 2 * half_width + 1 >= 365:
+        rows = np.broadcast_to(by_doy.reshape(1, -1), (365, by_doy.size))
+    else:
+        idx = (np.arange(365)[:, None] + np.arange(-half_width, half_width + 1)[None, :]) % 365
+        rows = by_doy[idx].reshape(365, -1)
+    samples = np.sort(rows, axis=1)                                   # NaN sorts last
+    counts = np.count_nonzero(~np.isnan(samples), axis=1)
+    return np.ascontiguousarray(samples[:, :max(int(counts.max()), 1)]), counts
+ 
+_samples_cache = OrderedDict()
+ 
+def sample_tables(lat, lon, date_str, n_years=ROLLING_YEARS):
+    """{variable: doy_sorted_samples} of a grid cell for the n_years history window of date_str (cached)."""
+    lat, lon = grid_cell(lat, lon)
+    start_str, end_str, hist_start_year, hist_end_year = compute_history_window(date_str, rolling_years=n_years)
+    key = location_key(lat, lon) + (hist_start_year, hist_end_year)
+    with _climatology_lock:
+        tables = _samples_cache.get(key)
+        if tables is not None:
+            _samples_cache.move_to_end(key)
+    CACHE_LOOKUPS.inc(cache="samples", result="hit" if tables is not None else "miss")
+    if tables is not None:
+        return tables
+ 
+    def build():
+        history = load_history(lat, lon, start_str, end_str)
+        return {name: doy_sorted_samples(history, column, half_width, missing)
+                for name, (column, half_width, missing) in THRESHOLD_VARIABLES.items() if column in history}
+ 
+    if model_store is not None and year_complete(hist_end_year):
+        tables = model_store.get_or_build(model_store.key("samples", STORE_VERSION, SAMPLES_VERSION, *key), build)
+    else:
+        tables = build()
+    if year_complete(hist_end_year):
+        with _climatology_lock:
+            _samples_cache[key] = tables
+            while len(_samples_cache) > SAMPLES_CACHE_SIZE:
+                _samples_cache.popitem(last=False)
+    return tables
+ 
+def requested_thresholds(thresholds=None, bins=None):
+    """
+    Validated ({variable: sorted thresholds}, {variable: increasing bin edges}) in THRESHOLD_VARIABLES order,
+    or None when neither is given. Values are lists of numbers or comma-separated strings.
+    """
+    def parse(spec, what):
+        if spec in (None, {}):
+            return {}
+        if not isinstance(spec, dict):
+            raise ValueError(f"{what} must map variables ({', '.join(THRESHOLD_VARIABLES)}) to lists of numbers")
+        out = {}
+        for variable, values in spec.items():
+            if variable not in THRESHOLD_VARIABLES:
+                raise ValueError(f"unknown {what} variable '{variable}'")
+            if isinstance(values, str):
+                values = values.split(",")
+            values = values if isinstance(values, list) else [values]
+            values = [number_param(f"{what}.{variable}", v) for v in values]
+            if not values or len(values) > MAX_CUSTOM_THRESHOLDS or not all(np.isfinite(values)):
+                raise ValueError(f"{what}.{variable}: 1 to {MAX_CUSTOM_THRESHOLDS} finite numbers")
+            out[variable] = values
+        return {variable: out[variable] for variable in THRESHOLD_VARIABLES if variable in out}
+    thresholds, bins = parse(thresholds, "thresholds"), parse(bins, "bins")
+    thresholds = {variable: sorted(values) for variable, values in thresholds.items()}
+    for variable, edges in bins.items():
+        if any(b <= a for a, b in zip(edges, edges[1:])):
+            raise ValueError(f"bins.{variable} must be strictly increasing")
+    if not thresholds and not bins:
+        return None
+    return thresholds, bins
+ 
+def query_thresholds(args):
+    """(thresholds, bins) specs for requested_thresholds from GET args thresholds.<variable>= / bins.<variable>=."""
+    specs = {"thresholds": {}, "bins": {}}
+    for name, value in args.items():
+        what, dot, variable = name.partition(".")
+        if dot and what in specs:
+            specs[what][variable] = value
+    return specs["thresholds"], specs["bins"]
+ 
+def thresholds_query(custom):
+    """GET args of a requested_thresholds() spec, in its one canonical spelling."""
+    def number(v):
+        text = repr(float(v))
+        return text[:-2] if text.endswith(".0") else text
+    params = {}
+    for what, spec in zip(("thresholds", "bins"), custom):
+        for variable, values in spec.items():
+            params[f"{what}.{variable}"] = ",".join(number(v) for v in values)
+    return params
+ 
+@timed("custom_thresholds")
+def custom_threshold_probs(tables, date_str, thresholds, bins):
+    """
+    {variable: {"samples", "exceedance": [{"threshold", "percent"}], "bins": [{"lo", "hi", "percent"}]}}:
+    percent of window samples with value >= threshold, and in [lo, hi) per bin (open-ended outer bins).
+    """
+    doy0 = min(pd.to_datetime(date_str).dayofyear, 365) - 1
+    out = {}
+    for variable in dict.fromkeys(list(thresholds) + list(bins)):
+        if variable not in tables:
+            out[variable] = {"samples": 0}
             continue
+        samples, counts = tables[variable]
+        n = int(counts[doy0])
+        row = samples[doy0, :n].astype(float)
+        entry = {"samples": n}
+        if n == 0:
+            out[variable] = entry
+            continue
+        if variable in thresholds:
+            below = np.searchsorted(row, thresholds[variable], side="left")
+            entry["exceedance"] = [{"threshold": t, "percent": 100.0 * (n - b) / n}
+                                   for t, b in zip(thresholds[variable], below)]
+        if variable in bins:
+            edges = bins[variable]
+            cum = np.concatenate([[0], np.searchsorted(row, edges, side="left"), [n]])
+            entry["bins"] = [{"lo": lo, "hi": hi, "percent": 100.0 * k / n}
+                             for lo, hi, k in zip([None] + edges, edges + [None], np.diff(cum))]
+        out[variable] = entry
+    return out
+ 
+def pct(x):
+    return None if x is None or np.isnan(x) else float(100 * x)
  
-        # --- FIX: robust day differences & weights (no .clip() on Index) ---
-        day_diff = ((sub.index - anchor_y) / pd.Timedelta(days=1)).astype(float)  # in days
-        weights  = np.clip(half_window_days - np.abs(day_diff) + 1, 0, None)      # triangular kernel
-        sub["Day_Weight"] = weights
+@timed("prediction_rows")
+def prediction_rows(clim, dates):
+    """/predict_all response bodies for many dates of one location (rows with "error" where undefined)."""
+    dates = pd.DatetimeIndex(dates)
+    rain = rain_from_climatology_many(clim, dates)
+    cats_t, probs_t = categories_from_climatology_many(clim, dates, "temperature")
+    cats_w, probs_w = categories_from_climatology_many(clim, dates, "wind")
  
-        # Categorize
-        sub["Category"] = sub[column].apply(categorizer)
+    def cat_dict(cats, probs, i):
+        if probs is None or np.isnan(probs[i]).all():
+            return {}
+        return {c: float(v) for c, v in zip(cats, probs[i])}
  
-        # Drop NaNs/None
-        valid = sub.dropna(subset=["Category", column])
-        if valid.empty:
-            year_weights[-1] = 0
+    rows = []
+    for i in range(len(dates)):
+        if not rain["ok"][i]:
+            rows.append({"error": "No historical samples in seasonal window."})
             continue
+        rows.append({
+            "temperature": cat_dict(cats_t, probs_t, i),
+            "wind": cat_dict(cats_w, probs_w, i),
+            "precipitation": {
+                "Final Rain": pct(rain["P_rain_final"][i]),
+                "No Rain": pct(rain["P_no_rain"][i]),
+                "Moderate": pct(rain["P_moderate"][i]),
+                "Heavy": pct(rain["P_heavy"][i]),
+            },
+        })
+    return rows
+ 
+def predict_from_climatology(clim, date_str):
+    """The /predict_all response body for one date."""
+    row = prediction_rows(clim, [pd.to_datetime(date_str)])[0]
+    if "error" in row:
+        raise RuntimeError(row["error"])
+    return row
+ 
+def forecast_columns(clim, dates):
+    """Columnar rain / temperature / wind percentages for many dates of one location (None = undefined)."""
+    dates = pd.DatetimeIndex(dates)
+    rain = rain_from_climatology_many(clim, dates)
  
-        weighted_counts = valid.groupby("Category")["Day_Weight"].sum().reindex(categories, fill_value=0.0)
-        total = weighted_counts.sum()
-        if total <= 0:
-            year_weights[-1] = 0
+    def col(values):
+        return [None if np.isnan(v) else float(v) for v in values]
+ 
+    out = {
+        "precipitation": {
+            "Final Rain": col(100 * rain["P_rain_final"]),
+            "No Rain": col(100 * rain["P_no_rain"]),
+            "Moderate": col(100 * rain["P_moderate"]),
+            "Heavy": col(100 * rain["P_heavy"]),
+        },
+    }
+    for variable in ("temperature", "wind"):
+        cats, probs = categories_from_climatology_many(clim, dates, variable)
+        out[variable] = {} if probs is None else {c: col(probs[:, j]) for j, c in enumerate(cats)}
+    return out
+ 
+def forecast_range(df_all, start_date, end_date, rolling_years=ROLLING_YEARS):
+    """
+    Every day in [start_date, end_date] from one history frame (must cover the windows of all target years).
+    One climatology per target year (rolled forward one year at a time), then each year's days in a
+    single vectorized lookup.
+    """
+    dates = pd.date_range(pd.to_datetime(start_date), pd.to_datetime(end_date), freq="D")
+    history = as_history(df_all)
+    stats = HistoryStats(last_n_years=rolling_years)
+    clims = {}
+    for year in np.unique(dates.year):
+        _, _, hist_start_year, hist_end_year = compute_history_window(f"{year}-01-01", rolling_years=rolling_years)
+        for y in [y for y in stats.years if y < hist_start_year or y > hist_end_year]:
+            stats.drop(y)
+        for y in range(hist_start_year, hist_end_year + 1):
+            if y not in stats.years:
+                ys = year_stats(history, y, half_window_days=stats.half_window_days)
+                if ys is not None:
+                    stats.add(ys)
+        clims[year] = stats.climatology(hist_end_year)
+    return range_columns(clims, dates)
+ 
+def range_columns(clims, dates):
+    """Stitch forecast_columns of each target year's climatology ({year: clim}) into one columnar response."""
+    out = {"dates": [d.strftime("%Y-%m-%d") for d in dates]}
+    for year in np.unique(dates.year):
+        part = forecast_columns(clims[year], dates[dates.year == year])
+        for group, cols in part.items():
+            target = out.setdefault(group, {})
+            for name, values in cols.items():
+                target.setdefault(name, []).extend(values)
+    return out
+ 
+def climatology_to_json(clim):
+    """Column-oriented JSON view of a climatology table."""
+    def columns(table):
+        if table is None:
+            return None
+        out = {table.index.name: table.index.tolist()}
+        for c in table.columns:
+            out[c] = [None if pd.isna(v) else float(v) for v in table[c].to_numpy()]
+        return out
+    markov = pd.DataFrame(markov_probs(clim["markov"]), index=pd.RangeIndex(1, 13, name="month"))
+    return {
+        "history_end_year": clim["end_year"],
+        "history_years": clim["last_n_years"],
+        "rain": columns(clim["rain"]),
+        "markov": columns(markov),
+        "temperature": columns(clim["temperature"]),
+        "wind": columns(clim["wind"]),
+    }
+ 
+# =========================
+# === UNCERTAINTY =========
+# =========================
+# Optional percentile bands for /predict_all: the history years are resampled with replacement and the
+# model re-evaluated per replicate. Replicates are rows of a (replicates, years) multiplicity matrix, so
+# the resampled window counts / category means are matrix products over the per-year statistics and
+# the rain model runs once over all replicates (rain_from_rows is elementwise).
+BOOTSTRAP_REPLICATES = 1000         # default when a request asks for uncertainty
+BOOTSTRAP_MAX_REPLICATES = 10000
+BOOTSTRAP_PERCENTILES = (5, 50, 95)
+BOOTSTRAP_SEED = 20240601           # fixed: the same query always gets the same bands (cacheable)
+ 
+def window_year_stats(lat, lon, date_str):
+    """year_stats of the history window of date_str (most recent year first), from the location's HistoryStats."""
+    lat, lon = grid_cell(lat, lon)
+    _, _, hist_start_year, hist_end_year = compute_history_window(date_str, rolling_years=ROLLING_YEARS)
+    stats = history_stats(lat, lon)
+    with stats.lock:
+        update_history_stats(stats, lat, lon, hist_start_year, hist_end_year)
+        years = [stats.years[y] for y in range(hist_end_year, hist_start_year - 1, -1) if y in stats.years]
+        for y in [y for y in stats.years if not year_complete(y)]:
+            stats.drop(y)
+    return years
+ 
+def year_markov_counts(years):
+    """(N, 12, 2, 2) transition counts per year, each Dec 31 -> Jan 1 transition credited to the later year."""
+    counts = np.stack([ys["markov"] for ys in years]).copy()
+    for i, ys in enumerate(years):
+        prev = years[i + 1] if i + 1 < len(years) else None      # most recent first: i + 1 is the year before
+        if (prev is None or prev["year"] != ys["year"] - 1 or prev["wet"] is None or ys["wet"] is None
+                or prev["last_date"] + pd.Timedelta(days=1) != ys["first_date"]):
             continue
-        weighted_probs = 100.0 * weighted_counts / total
-        year_distributions.append(weighted_probs)
+        counts[i, ys["first_date"].month - 1, prev["wet"][-1], ys["wet"][0]] += 1
+    return counts
  
-    if not year_distributions:
-        return categories, None
+def bootstrap_bands(clim, years, target_date, replicates=BOOTSTRAP_REPLICATES, percentiles=BOOTSTRAP_PERCENTILES,
+                    seed=BOOTSTRAP_SEED, smooth_window_days=SMOOTH_WINDOW_DAYS,
+                    blend_mode=BLEND_MODE, y_infer_mode=YESTERDAY_INFERENCE, persistence_weight=PERSISTENCE_WEIGHT,
+                    year_weights=None):
+    """
+    Percentile bands of the /predict_all probabilities under resampling of the history years.
+    years: the window's year_stats, most recent first (window_year_stats); clim: its climatology table.
+    year_weights: per-year weights aligned with years (a requested year weighting), None = the preset model.
+    """
+    target = pd.to_datetime(target_date)
+    n_years = len(years)
+    if n_years == 0:
+        return None
+    weights = np.random.default_rng(seed).multinomial(n_years, np.full(n_years, 1.0 / n_years), size=replicates)
+    weights = weights.astype(float)                                   # (replicates, years)
+    rain_weights = weights
+    if year_weights is not None:
+        rain_weights = weights * (np.asarray(year_weights, dtype=float) * (n_years / np.sum(year_weights)))[None, :]
  
-    df_years = pd.concat(year_distributions, axis=1)
-    year_weights = np.array(year_weights[:df_years.shape[1]])
-    if year_weights.sum() == 0:
-        return categories, None
-    mean_probs = (df_years * year_weights).sum(axis=1) / year_weights.sum()
-    return categories, mean_probs
+    # Rain: per-year window counts at the target and yesterday DOY, then resampled sums
+    rain = np.stack([ys["rain"] for ys in years])                     # (N, 365, 4)
+    def window_counts(doy):
+        i = min(doy, 365) - 1
+        if 2 * smooth_window_days + 1 >= 365:
+            return rain.sum(axis=1)
+        return rain[:, (i + np.arange(-smooth_window_days, smooth_window_days + 1)) % 365].sum(axis=1)
+    yesterday = target - pd.Timedelta(days=1)
+    n, n_wet, n_mod, n_hev = (rain_weights @ window_counts(target.dayofyear)).T
+    n_y, n_wet_y = (rain_weights @ window_counts(yesterday.dayofyear))[:, :2].T
+    markov_counts = year_markov_counts(years)[:, target.month - 1].reshape(n_years, 4)
+    markov = markov_probs((rain_weights @ markov_counts).reshape(replicates, 2, 2))
+    wet_prev = None
+    if y_infer_mode == "prev_year_yesterday":
+        prev = clim["recent_wet"].reindex([yesterday - pd.DateOffset(years=1)]).to_numpy(dtype=float)
+        wet_prev = np.full(replicates, prev[0])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = rain_from_rows(np.where(n > 0, n_wet / n, np.nan), n, np.where(n_y > 0, n_wet_y / n_y, np.nan), n_y,
+                             markov, wet_prev, np.where(n_wet > 0, n_mod / n_wet, np.nan),
+                             np.where(n_wet > 0, n_hev / n_wet, np.nan), blend_mode=blend_mode,
+                             y_infer_mode=y_infer_mode, persistence_weight=persistence_weight)
+ 
+    def bands(samples, scale=1.0):
+        samples = samples[~np.isnan(samples)]
+        if len(samples) == 0:
+            return None
+        return {f"p{q:g}": float(v) * scale for q, v in zip(percentiles, np.percentile(samples, percentiles))}
+ 
+    result = {
+        "replicates": int(replicates),
+        "years": n_years,
+        "precipitation": {
+            "Final Rain": bands(out["P_rain_final"], 100.0),
+            "No Rain": bands(out["P_no_rain"], 100.0),
+            "Moderate": bands(out["P_moderate"], 100.0),
+            "Heavy": bands(out["P_heavy"], 100.0),
+        },
+    }
+ 
+    # Categories: resampled recency-weighted means of the per-year kernel probabilities
+    row = MONTH_DAYS.get_indexer([target.strftime("2000-%m-%d")])[0]
+    if year_weights is None:
+        recency = np.array([clim["last_n_years"] - (clim["end_year"] - ys["year"]) for ys in years], dtype=float)
+    else:
+        recency = np.asarray(year_weights, dtype=float)
+    for variable, (_, categories, _) in CATEGORY_VARIABLES.items():
+        per_year = [ys["categories"].get(variable) for ys in years]
+        if all(v is None for v in per_year):
+            result[variable] = {}
+            continue
+        probs = np.stack([v[0][row] if v is not None else np.zeros(len(categories)) for v in per_year])   # (N, K)
+        valid = np.array([v is not None and bool(v[1][row]) for v in per_year])
+        w = weights * np.where(valid, recency, 0.0)[None, :]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = (w @ probs) / w.sum(axis=1)[:, None]              # (replicates, K)
+        result[variable] = {c: bands(means[:, k]) for k, c in enumerate(categories)}
+    return result
+ 
+# =========================
+# === GRID (HEATMAP) ======
+# =========================
+# /predict_grid: one date, every grid cell of a bbox. Per-cell climatologies are stacked into arrays with
+# a leading cell axis ("cube", cached per viewport), so a render is a handful of numpy gathers.
+GRID_MAX_CELLS = 20000              # output size limit (rows x cols)
+GRID_MAX_FETCH_CELLS = 64           # cells that may be downloaded for one request when fetch=1
+GRID_CACHE_MAX_BYTES = 256 * 1024 * 1024   # stacked viewport cubes kept in memory (441 cells: ~8.5 MB)
+GRID_ROWS_MAX_BYTES = 256 * 1024 * 1024    # per-cell cube rows (~19 KB each) shared by every viewport / pan
+GRID_ENTRY_BYTES = 256                      # bookkeeping per cached entry, so empty cells count too
+GRID_MISSING_TTL_S = REGION_RESCAN_S    # cells without local data are looked up again after this
+GRID_RAIN_VARIABLES = {"rain": "P_rain_final", "rain_moderate": "P_moderate", "rain_heavy": "P_heavy"}
+ 
+def grid_axes(south, west, north, east, resolution=None):
+    """Output pixel centres: latitudes north -> south, longitudes west -> east (native grid by default)."""
+    if south > north:
+        raise ValueError("bbox south must not exceed north.")
+    if west > east:
+        raise ValueError("bbox west exceeds east (crosses the antimeridian?); request each side of 180 separately.")
+    lat_step = max(float(resolution), GRID_LAT_STEP) if resolution else GRID_LAT_STEP
+    lon_step = max(float(resolution), GRID_LON_STEP) if resolution else GRID_LON_STEP
+    lats = grid_axis(max(south, -90.0), min(north, 90.0), lat_step)[::-1]
+    lons = grid_axis(west, east, lon_step)
+    return lats, lons
+ 
+def climatology_row(clim, end_year):
+    """One cell's slice of a grid cube (float32 tables, markov counts) from its climatology table."""
+    recent_start = pd.Timestamp(end_year - 1, 1, 1)
+    recent_days = (pd.Timestamp(end_year, 12, 31) - recent_start).days + 1
+    rain = clim["rain"]
+    table = rain.to_numpy(dtype=np.float32)   # one block copy instead of four column lookups
+    row = {name: table[:, rain.columns.get_loc(column)]
+           for name, column in (("p_climo", "p_climo"), ("n_climo", "n_climo"),
+                                ("f_moderate", "f_moderate_given_wet"), ("f_heavy", "f_heavy_given_wet"))}
+    row["markov"] = np.asarray(clim["markov"], dtype=np.int64)
+    row["recent_wet"] = np.full(recent_days, np.nan, dtype=np.float32)
+    wet = clim["recent_wet"]
+    if len(wet):
+        offsets = (wet.index.to_numpy().astype("datetime64[D]")
+                   - np.datetime64(recent_start.date(), "D")).astype(np.int64)
+        inside = (offsets >= 0) & (offsets < recent_days)
+        row["recent_wet"][offsets[inside]] = wet.to_numpy(dtype=np.float32)[inside]
+    for variable in ("temperature", "wind"):
+        if clim.get(variable) is not None:
+            row[variable] = clim[variable].to_numpy(dtype=np.float32)
+    return row
+ 
+@timed("grid_stack")
+def stack_rows(rows, end_year):
+    """climatology_row per cell (None = no data) as arrays with a leading cell axis."""
+    n = len(rows)
+    recent_start = pd.Timestamp(end_year - 1, 1, 1)
+    recent_days = (pd.Timestamp(end_year, 12, 31) - recent_start).days + 1
+    cube = {
+        "end_year": end_year,
+        "p_climo": np.full((n, 365), np.nan, dtype=np.float32),
+        "n_climo": np.zeros((n, 365), dtype=np.float32),
+        "f_moderate": np.full((n, 365), np.nan, dtype=np.float32),
+        "f_heavy": np.full((n, 365), np.nan, dtype=np.float32),
+        "markov": np.zeros((n, 12, 2, 2), dtype=np.int64),
+        "recent_start": recent_start,
+        "recent_wet": np.full((n, recent_days), np.nan, dtype=np.float32),
+        "temperature": np.full((n, len(MONTH_DAYS), len(TEMP_CATEGORIES)), np.nan, dtype=np.float32),
+        "wind": np.full((n, len(MONTH_DAYS), len(WIND_CATEGORIES)), np.nan, dtype=np.float32),
+        "complete": all(r is not None for r in rows),
+    }
+    for i, row in enumerate(rows):
+        if row is None:
+            continue
+        for name, values in row.items():
+            cube[name][i] = values
+    return cube
+ 
+def stack_climatologies(clims, end_year):
+    """Per-cell climatology tables (None = no data) as a grid cube."""
+    return stack_rows([None if c is None else climatology_row(c, end_year) for c in clims], end_year)
+ 
+_grid_cache = OrderedDict()         # viewport -> (cube, expiry)
+_grid_rows = OrderedDict()          # cell + window -> (climatology_row or None, expiry)
+_grid_bytes = {"cubes": 0, "rows": 0}   # running totals, so an insert does not re-measure the whole cache
+ 
+def grid_nbytes(arrays):
+    """Memory of a cube or row (dict of arrays and scalars; None = empty cell)."""
+    if arrays is None:
+        return GRID_ENTRY_BYTES
+    return GRID_ENTRY_BYTES + sum(v.nbytes for v in arrays.values() if isinstance(v, np.ndarray))
+ 
+def remember_grid(cache, name, key, value, expiry, max_bytes):
+    """Put value in a byte-bounded grid LRU (caller holds _climatology_lock); too large values are not kept."""
+    size = grid_nbytes(value)
+    old = cache.pop(key, None)
+    if old is not None:
+        _grid_bytes[name] -= grid_nbytes(old[0])
+    if size > max_bytes:
+        return
+    cache[key] = (value, expiry)
+    _grid_bytes[name] += size
+    while _grid_bytes[name] > max_bytes:
+        _, (dropped, _) = cache.popitem(last=False)
+        _grid_bytes[name] -= grid_nbytes(dropped)
+ 
+def remember_grid_row(key, row, last_year):
+    expiry = entry_expiry(last_year) if row is not None else time.monotonic() + GRID_MISSING_TTL_S
+    with _climatology_lock:
+        remember_grid(_grid_rows, "rows", key, row, expiry, GRID_ROWS_MAX_BYTES)
+    return row
+ 
+def grid_row(cell, date_str, first_year, last_year):
+    """climatology_row of one cell from local data only (None if it has none), cached per cell + window."""
+    key = cell + (first_year, last_year)
+    with _climatology_lock:
+        entry = _grid_rows.get(key)
+        if entry is not None and not expired(entry[1]):
+            _grid_rows.move_to_end(key)
+            return entry[0]
+    try:
+        clim = local_climatology(cell[0], cell[1], date_str)
+    except Exception:
+        clim = None   # one unreadable cell stays NaN instead of failing the whole grid
+    return remember_grid_row(key, None if clim is None else climatology_row(clim, last_year), last_year)
+ 
+def grid_cube(cells, date_str, first_year, last_year, fetch=False):
+    """
+    Stacked climatologies of cells (location keys) for one history window. Rows are cached per cell, so a
+    moved or resized viewport only builds its new cells; the whole cube is cached once every cell has data.
+    """
+    key = (tuple(cells), first_year, last_year)
+    with _climatology_lock:
+        entry = _grid_cache.get(key)
+        if entry is not None and not expired(entry[1]):
+            _grid_cache.move_to_end(key)
+            return entry[0]
+    rows = [grid_row(cell, date_str, first_year, last_year) for cell in cells]
+    if fetch:
+        missing = [i for i, r in enumerate(rows) if r is None]
+        if len(missing) > GRID_MAX_FETCH_CELLS:
+            raise ValueError(f"{len(missing)} cells need a download; fetch=1 allows at most {GRID_MAX_FETCH_CELLS}.")
+        for i in missing:
+            try:
+                clim = get_climatology(cells[i][0], cells[i][1], date_str)
+            except Exception:
+                continue  # stays NaN in the grid
+            rows[i] = remember_grid_row(cells[i] + (first_year, last_year), climatology_row(clim, last_year),
+                                        last_year)
+    cube = stack_rows(rows, last_year)
+    if cube["complete"]:
+        with _climatology_lock:
+            remember_grid(_grid_cache, "cubes", key, cube, entry_expiry(last_year), GRID_CACHE_MAX_BYTES)
+    return cube
+ 
+@timed("grid_values")
+def grid_values(cube, target_date, variable,
+                blend_mode=BLEND_MODE,
+                y_infer_mode=YESTERDAY_INFERENCE,
+                persistence_weight=PERSISTENCE_WEIGHT):
+    """Percent for every cell of a cube on target_date ("rain", "rain_heavy", "temperature:Mild", ...)."""
+    d = pd.Timestamp(target_date).normalize()
+    if variable in GRID_RAIN_VARIABLES:
+        i = min(d.dayofyear, 365) - 1
+        yesterday = d - pd.Timedelta(days=1)
+        iy = min(yesterday.dayofyear, 365) - 1
+        wet_prev = None
+        if y_infer_mode == "prev_year_yesterday":
+            offset = ((yesterday - pd.DateOffset(years=1)) - cube["recent_start"]).days
+            inside = 0 <= offset < cube["recent_wet"].shape[1]
+            wet_prev = cube["recent_wet"][:, offset] if inside else np.full(len(cube["p_climo"]), np.nan)
+        out = rain_from_rows(cube["p_climo"][:, i], cube["n_climo"][:, i], cube["p_climo"][:, iy], cube["n_climo"][:, iy],
+                             markov_probs(cube["markov"][:, d.month - 1]), wet_prev,
+                             cube["f_moderate"][:, i], cube["f_heavy"][:, i],
+                             blend_mode=blend_mode, y_infer_mode=y_infer_mode, persistence_weight=persistence_weight)
+        return 100.0 * out[GRID_RAIN_VARIABLES[variable]]
+    name, _, category = variable.partition(":")
+    categories = {"temperature": TEMP_CATEGORIES, "wind": WIND_CATEGORIES}.get(name)
+    if categories is None or category not in categories:
+        raise ValueError(f"Unknown variable '{variable}'; use {', '.join(GRID_RAIN_VARIABLES)}, "
+                         f"temperature:<{'|'.join(TEMP_CATEGORIES)}> or wind:<{'|'.join(WIND_CATEGORIES)}>.")
+    row = (pd.Timestamp(2000, d.month, d.day) - pd.Timestamp(2000, 1, 1)).days
+    return cube[name][:, row, categories.index(category)]
+ 
+def predict_grid_values(south, west, north, east, date_str, resolution=None, variable="rain", fetch=False):
+    """(lats, lons, percent grid) with rows north -> south; NaN where a cell has no data."""
+    lats, lons = grid_axes(south, west, north, east, resolution)
+    if len(lats) * len(lons) > GRID_MAX_CELLS:
+        raise ValueError(f"grid of {len(lats)} x {len(lons)} cells exceeds {GRID_MAX_CELLS}; use a coarser resolution.")
+    target = pd.to_datetime(date_str)
+    _, _, hist_start_year, hist_end_year = compute_history_window(date_str, rolling_years=ROLLING_YEARS)
+    lat_g, lon_g = np.meshgrid(lats, lons, indexing="ij")
+    keys = [location_key(a, b) for a, b in zip(lat_g.ravel(), lon_g.ravel())]
+    cells = list(OrderedDict.fromkeys(keys))   # coarse resolutions sample each native cell once
+    where = {c: i for i, c in enumerate(cells)}
+    cube = grid_cube(cells, date_str, hist_start_year, hist_end_year, fetch=fetch)
+    values = grid_values(cube, target, variable)[[where[k] for k in keys]]
+    return lats, lons, values.reshape(lat_g.shape)
  
 # =========================
 # === MAIN RUNNER =========
 # =========================
+@app.before_request
+def begin_request_timing():
+    # Propagate a caller's request id (proxy / frontend) when it looks sane, else mint one
+    rid = request.headers.get("X-Request-ID", "")
+    start_request(rid if 0 < len(rid) <= 64 and rid.replace("-", "").isalnum() else new_request_id())
+ 
+@app.after_request
+def end_request_timing(resp):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    if resp.is_streamed:
+        # The body (NDJSON) is generated after this hook: stop the clock when the server closes the response
+        timing = current_breakdown()
+        if timing is not None:
+            resp.headers["X-Request-ID"] = timing["request_id"]
+        method, status = request.method, resp.status_code
+        resp.call_on_close(lambda: observe_request(end_request(), route, method, status))
+        return resp
+    timing = observe_request(end_request(), route, request.method, resp.status_code)
+    if timing is not None:
+        resp.headers["X-Request-ID"] = timing["request_id"]
+        resp.headers["Server-Timing"] = f"total;dur={timing['total_ms']}"
+    return resp
+ 
+def observe_request(timing, route, method, status):
+    if timing is not None:
+        REQUEST_SECONDS.observe(timing["total_ms"] / 1000.0, route=route, method=method, status=str(status))
+    return timing
+ 
+@REGISTRY.collector
+def cache_metrics():
+    """Disk cache / shared store counters, read at scrape time."""
+    out = []
+    for prefix, cache in (("wir_power_cache", power_cache), ("wir_model_store", model_store)):
+        if cache is None:
+            continue
+        st = cache.stats()
+        out.append((f"{prefix}_lookups_total", "counter", "Lookups by result (this process).",
+                    {(("result", "hit"),): st["hits"], (("result", "miss"),): st["misses"]}))
+        out.append((f"{prefix}_entries", "gauge", "Files on disk.", {(): st["entries"]}))
+        out.append((f"{prefix}_bytes", "gauge", "Bytes on disk.", {(): st["bytes"]}))
+    with _climatology_lock:
+        out.append(("wir_climatology_tables", "gauge", "Climatology tables held in memory.", {(): len(_climatology_cache)}))
+        out.append(("wir_grid_cells", "gauge", "Grid cube rows (cell + window) held in memory.", {(): len(_grid_rows)}))
+        out.append(("wir_grid_cache_bytes", "gauge", "Memory held by grid cubes and rows.",
+                    {(("kind", k),): v for k, v in _grid_bytes.items()}))
+    with _response_lock:
+        out.append(("wir_response_memo_entries", "gauge", "Memoized /predict_all bodies.", {(): len(_response_cache)}))
+    return out
+ 
+_prediction_slots = threading.BoundedSemaphore(MAX_CONCURRENT_PREDICTIONS)
+ 
+def limit_concurrency(view):
+    """
+    At most MAX_CONCURRENT_PREDICTIONS model requests per process; others queue for up to
+    QUEUE_TIMEOUT_S and then get 503 + Retry-After instead of piling up behind the GIL.
+    Streamed responses (NDJSON) hold their slot until the server closes them.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _prediction_slots.acquire(timeout=QUEUE_TIMEOUT_S):
+            resp = jsonify({"error": "server busy, retry shortly"})
+            resp.status_code = 503
+            resp.headers["Retry-After"] = "5"
+            return resp
+        try:
+            resp = app.make_response(view(*args, **kwargs))
+        except BaseException:
+            _prediction_slots.release()
+            raise
+        if resp.is_streamed:
+            resp.call_on_close(_prediction_slots.release)
+        else:
+            _prediction_slots.release()
+        return resp
+    return wrapper
+ 
 
+# /predict_all answers only depend on (grid cell, date, model presets) once the history window is made of
+# completed years, so final responses are memoized and GET responses are cacheable by browsers / CDNs.
+RESPONSE_CACHE_SIZE = 4096          # memoized /predict_all bodies
+RESPONSE_MAX_AGE_S = 30 * 86400     # Cache-Control lifetime when every history year is final (year_complete)
+RESPONSE_MAX_AGE_PARTIAL_S = CURRENT_YEAR_TTL_S   # window reaches a year POWER is still filling in
+MODEL_CONFIG = "|".join(str(v) for v in (STORE_VERSION, BLEND_MODE, YESTERDAY_INFERENCE, PERSISTENCE_WEIGHT))
+ 
+_response_cache = OrderedDict()
+_response_lock = threading.Lock()
+ 
+def clear_memory_caches():
+    """Drop every in-process cache (history, stats, climatology, grid, response memo); disk stores are kept."""
+    with _history_lock:
+        _history_cache.clear()
+        _region_stores["scanned"] = 0.0
+    with _climatology_lock:
+        _climatology_cache.clear()
+        _stats_cache.clear()
+        _grid_cache.clear()
+        _grid_rows.clear()
+        _grid_bytes.update(cubes=0, rows=0)
+        _record_cache.clear()
+        _samples_cache.clear()
+    with _response_lock:
+        _response_cache.clear()
+ 
+def window_complete(date_str):
+    _, _, _, hist_end_year = compute_history_window(date_str, rolling_years=ROLLING_YEARS)
+    return year_complete(hist_end_year)
+ 
+def canonical_query(lat, lon, date_str):
+    """The one spelling of a /predict_all GET that is cached: grid-cell centre and ISO date."""
+    lat, lon = grid_cell(lat, lon) if SNAP_TO_GRID else location_key(lat, lon)
+    return lat + 0.0, lon + 0.0, pd.to_datetime(date_str).strftime("%Y-%m-%d")
+ 
+@timed("response_memo")
+def cached_prediction(lat, lon, date_str, replicates=0, history=None, custom=None):
+    """
+    (payload, GET body bytes, strong ETag) for a canonical query; memoized (LRU) once its window is complete.
+    replicates > 0 adds bootstrap percentile bands ("uncertainty"); history is a requested_history() spec
+    and custom a requested_thresholds() spec ("custom").
+    """
+    custom_key = None if custom is None else tuple(thresholds_query(custom).items())
+    key = location_key(lat, lon) + (date_str, MODEL_CONFIG, replicates, history, custom_key)
+    with _response_lock:
+        entry = _response_cache.get(key)
+        if entry is not None:
+            _response_cache.move_to_end(key)
+    CACHE_LOOKUPS.inc(cache="response", result="hit" if entry is not None else "miss")
+    if entry is not None:
+        return entry
+    clim = history_climatology(lat, lon, date_str, history)
+    payload = predict_from_climatology(clim, date_str)
+    if history is not None:
+        payload["history"] = history_echo(clim, history)
+    if replicates:
+        with span("bootstrap"):
+            if history is None:
+                payload["uncertainty"] = bootstrap_bands(clim, window_year_stats(lat, lon, date_str), date_str,
+                                                         replicates)
+            else:
+                n_years, weighting, half_life = history
+                record = location_record(lat, lon, clim["end_year"])
+                years = [record.by_year[y] for y in range(clim["end_year"], clim["end_year"] - n_years, -1)
+                         if y in record.by_year]
+                weights = None
+                if weighting != "default":
+                    w = year_weights(n_years, weighting, half_life or YEAR_WEIGHT_HALF_LIFE)
+                    weights = w[[clim["end_year"] - ys["year"] for ys in years]]
+                payload["uncertainty"] = bootstrap_bands(clim, years, date_str, replicates, year_weights=weights)
+    if custom is not None:
+        tables = sample_tables(lat, lon, date_str, history[0] if history is not None else ROLLING_YEARS)
+        payload["custom"] = custom_threshold_probs(tables, date_str, *custom)
+    body = jsonify({**payload, "location": location_echo(lat, lon)}).get_data()
+    entry = (payload, body, hashlib.sha1(MODEL_CONFIG.encode("utf-8") + body).hexdigest())
+    if window_complete(date_str):   # same end year for every history length
+        with _response_lock:
+            _response_cache[key] = entry
+            while len(_response_cache) > RESPONSE_CACHE_SIZE:
+                _response_cache.popitem(last=False)
+    return entry
+ 
+def format_coord(v):
+    return f"{v:.4f}".rstrip("0").rstrip(".")
+ 
+def requested_replicates(value):
+    """Bootstrap replicates for an "uncertainty" request value: true / 1 -> default, an int -> that many."""
+    if value in (None, False, 0, "", "0", "false"):
+        return 0
+    if value in (True, 1, "1", "true"):
+        return BOOTSTRAP_REPLICATES
+    n = number_param("uncertainty", value, int)
+    if not 2 <= n <= BOOTSTRAP_MAX_REPLICATES:
+        raise ValueError(f"uncertainty replicates must be between 2 and {BOOTSTRAP_MAX_REPLICATES}")
+    return n
+ 
 @app.route("/predict_all", methods=["POST"])
+@limit_concurrency
 def predict_all():
+    """
+    Optional body keys: "uncertainty", "history_years" / "year_weighting" / "half_life", "debug", and
+    custom classes: "thresholds": {"precipitation": [1, 10]} (percent >= each value) and
+    "bins": {"temperature": [0, 15, 25]} (percent per bin); units mm/day, degC, m/s.
+    """
     data = request.json
     lat = data.get("lat")
     lon = data.get("lon")
@@ -328,55 +2053,228 @@ def predict_all():
     if lat is None or lon is None or date_str is None:
         return jsonify({"error": "lat, lon, and date_str are required"}), 400
 
-    # Build history window & fetch once
-    start_str, end_str, hist_start_year, hist_end_year = compute_history_window(date_str, rolling_years=ROLLING_YEARS)
     try:
-        df_all = fetch_power(lat, lon, start_str, end_str)
+        history = requested_history(date_str, data.get("history_years"), data.get("year_weighting"),
+                                    data.get("half_life"))
+        custom = requested_thresholds(data.get("thresholds"), data.get("bins"))
+        payload, _, _ = cached_prediction(*canonical_query(lat, lon, date_str),
+                                          replicates=requested_replicates(data.get("uncertainty")), history=history,
+                                          custom=custom)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
+    body = {**payload, "location": location_echo(lat, lon)}
+    if data.get("debug"):
+        body["timings"] = current_breakdown()
+    return jsonify(body)
 
-    # ---- Rain (Level-2) ----
-    rain_out = level2_rain(lat, lon, date_str, df_all)
-    def pct(x):
-        return None if x is None or np.isnan(x) else float(100 * x)
+@app.route("/predict_all", methods=["GET"])
+@limit_concurrency
+def predict_all_get():
+    """
+    Cacheable /predict_all: ?lat=41.5&lon=45&date_str=2026-06-10. Any other spelling of a query is redirected
+    (308) to the canonical one, so browsers and CDNs keep a single entry per grid cell and day.
+    Strong ETag + If-None-Match -> 304; long max-age only when every year of the history window is final.
+    &uncertainty=1 (or a replicate count) adds bootstrap percentile bands; &history_years=40,
+    &year_weighting=exponential and &half_life=5 choose the history window (see requested_history);
+    &thresholds.precipitation=1,10 and &bins.temperature=0,15,25 add custom classes as on POST.
+    """
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    date_str = request.args.get("date_str")
+    if lat is None or lon is None or date_str is None:
+        return jsonify({"error": "lat, lon, and date_str are required"}), 400
+    try:
+        cell_lat, cell_lon, day = canonical_query(lat, lon, date_str)
+        replicates = requested_replicates(request.args.get("uncertainty"))
+        history = requested_history(day, request.args.get("history_years"), request.args.get("year_weighting"),
+                                    request.args.get("half_life"))
+        custom = requested_thresholds(*query_thresholds(request.args))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    if request.args.get("debug") == "1":
+        # Timing breakdown: never redirected or cached
+        try:
+            payload, _, _ = cached_prediction(cell_lat, cell_lon, day, replicates, history, custom)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+        resp = jsonify({**payload, "location": location_echo(cell_lat, cell_lon), "timings": current_breakdown()})
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
+    params = {"lat": format_coord(cell_lat), "lon": format_coord(cell_lon), "date_str": day}
+    if history is not None:
+        params["history_years"] = history[0]
+        params["year_weighting"] = history[1]
+        if history[2] is not None:
+            params["half_life"] = f"{history[2]:g}"
+    if replicates:
+        params["uncertainty"] = replicates
+    if custom is not None:
+        params.update(thresholds_query(custom))
+    query = urlencode(params)
+    if request.query_string.decode("utf-8") != query:
+        resp = redirect(f"{request.path}?{query}", code=308)
+        resp.headers["Cache-Control"] = f"public, max-age={RESPONSE_MAX_AGE_S}"
+        return resp
 
-    rain_probs = {
-        "Final Rain": pct(rain_out['P_rain_final']),
-        "No Rain": pct(rain_out['P_no_rain']),
-        "Moderate": pct(rain_out['P_moderate']),
-        "Heavy": pct(rain_out['P_heavy']),
-    }
+    try:
+        _, body, etag = cached_prediction(cell_lat, cell_lon, day, replicates, history, custom)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+    max_age = RESPONSE_MAX_AGE_S if window_complete(day) else RESPONSE_MAX_AGE_PARTIAL_S
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = f"public, max-age={max_age}"
+    return resp
+
+@app.route("/predict_batch", methods=["POST"])
+@limit_concurrency
+def predict_batch():
+    """
+    Many (lat, lon, date_str) queries in one POST: {"queries": [{...}, ...]} or a bare list.
+    Queries are grouped by grid cell + history window so each cell is fetched and tabulated once,
+    all of its dates are evaluated together, and results stream back as NDJSON (one line per query,
+    in group order, carrying the query's "index" in the request).
+    """
+    data = request.json
+    queries = data.get("queries") if isinstance(data, dict) else data
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "queries must be a non-empty list"}), 400
+    if len(queries) > BATCH_MAX_QUERIES:
+        return jsonify({"error": f"at most {BATCH_MAX_QUERIES} queries per batch"}), 400
+
+    groups = OrderedDict()
+    errors = []
+    for i, q in enumerate(queries):
+        lat = q.get("lat") if isinstance(q, dict) else None
+        lon = q.get("lon") if isinstance(q, dict) else None
+        date_str = q.get("date_str") if isinstance(q, dict) else None
+        if lat is None or lon is None or date_str is None:
+            errors.append({"index": i, "error": "lat, lon, and date_str are required"})
+            continue
+        try:
+            target = pd.to_datetime(date_str)
+            _, _, hist_start_year, hist_end_year = compute_history_window(date_str, rolling_years=ROLLING_YEARS)
+            key = location_key(lat, lon) + (hist_start_year, hist_end_year)
+        except (ValueError, TypeError) as e:
+            errors.append({"index": i, "error": str(e)})
+            continue
+        groups.setdefault(key, []).append((i, lat, lon, date_str, target))
+
+    def generate():
+        for e in errors:
+            yield json.dumps(e) + "\n"
+        for items in groups.values():
+            _, lat, lon, date_str, _ = items[0]
+            try:
+                clim = get_climatology(lat, lon, date_str)
+                rows = prediction_rows(clim, [it[4] for it in items])
+            except Exception as e:
+                rows = [{"error": str(e)}] * len(items)
+            for (i, lat_i, lon_i, date_i, _), row in zip(items, rows):
+                yield json.dumps({"index": i, "lat": lat_i, "lon": lon_i, "date_str": date_i, **row,
+                                  "location": location_echo(lat_i, lon_i)}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route("/predict_range", methods=["POST"])
+@limit_concurrency
+def predict_range():
+    """Every day from start_date to end_date (inclusive) at one point, as columns aligned with "dates"."""
+    data = request.json
+    lat = data.get("lat")
+    lon = data.get("lon")
+    start_date = data.get("start_date")
+    end_date = data.get("end_date")
+    if lat is None or lon is None or start_date is None or end_date is None:
+        return jsonify({"error": "lat, lon, start_date and end_date are required"}), 400
+    try:
+        dates = pd.date_range(pd.to_datetime(start_date), pd.to_datetime(end_date), freq="D")
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    if len(dates) == 0 or len(dates) > RANGE_MAX_DAYS:
+        return jsonify({"error": f"range must cover 1..{RANGE_MAX_DAYS} days"}), 400
 
-    # ---- Temperature categories (use T2M_MAX) ----
-    temp_probs = {}
-    if "T2M_MAX" in df_all.columns:
-        temp_categories = ["Very Cold", "Cold", "Mild", "Warm / Hot", "Very Hot"]
-        cats_t, probs_t = category_probabilities_weighted_days(
-            df_all, date_str, "T2M_MAX", temp_categories,
-            last_n_years=ROLLING_YEARS, half_window_days=TW_HALF_WINDOW_DAYS,
-            categorizer=categorize_temp_simple
-        )
-        if probs_t is not None:
-            for c in cats_t:
-                temp_probs[c] = float(probs_t.get(c, 0.0))
-    # ---- Wind categories (use WS10M_MAX in m/s, threshold ~3.6 m/s) ----
-    wind_probs = {}
-    if "WS10M_MAX" in df_all.columns:
-        wind_categories = ["No Wind", "Windy"]
-        cats_w, probs_w = category_probabilities_weighted_days(
-            df_all, date_str, "WS10M_MAX", wind_categories,
-            last_n_years=ROLLING_YEARS, half_window_days=TW_HALF_WINDOW_DAYS,
-            categorizer=categorize_wind_speed_ms
-        )
-        if probs_w is not None:
-            for c in cats_w:
-                wind_probs[c] = float(probs_w.get(c, 0.0))
+    try:
+        clims = {year: get_climatology(lat, lon, f"{year}-01-01") for year in np.unique(dates.year)}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({**range_columns(clims, dates), "location": location_echo(lat, lon)})
 
+@app.route("/predict_grid", methods=["GET"])
+@limit_concurrency
+def predict_grid():
+    """
+    Heatmap of one variable over a bbox for one date:
+      ?bbox=south,west,north,east&date_str=2026-06-10[&variable=rain][&resolution=1.0][&format=json|f32|png]
+    Cells without local data (cache / ingested region) are null / NaN / transparent unless fetch=1.
+    f32 = little-endian float32 percent, row-major, rows north -> south; shape and extent in X-Grid-* headers.
+    """
+    args = request.args
+    try:
+        south, west, north, east = (float(v) for v in args.get("bbox", "").split(","))
+    except ValueError:
+        return jsonify({"error": "bbox=south,west,north,east is required"}), 400
+    date_str = args.get("date_str")
+    if date_str is None:
+        return jsonify({"error": "date_str is required"}), 400
+    variable = args.get("variable", "rain")
+    fmt = args.get("format", "json").lower()
+    try:
+        lats, lons, values = predict_grid_values(south, west, north, east, date_str,
+                                                 resolution=args.get("resolution", type=float), variable=variable,
+                                                 fetch=args.get("fetch", "0") == "1")
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+ 
+    headers = {
+        "X-Grid-Shape": f"{len(lats)},{len(lons)}",
+        "X-Grid-Lats": f"{lats[0]},{lats[-1]}" if len(lats) else "",
+        "X-Grid-Lons": f"{lons[0]},{lons[-1]}" if len(lons) else "",
+        "X-Grid-Variable": variable,
+    }
+    if fmt == "f32":
+        return Response(values.astype("<f4").tobytes(), mimetype="application/octet-stream", headers=headers)
+    if fmt == "png":
+        scale = min(max(args.get("scale", 1, type=int), 1), 16)
+        return Response(encode_png(colorize(values), scale=scale), mimetype="image/png", headers=headers)
     return jsonify({
-        "temperature": temp_probs,
-        "wind": wind_probs,
-        "precipitation": rain_probs
+        "date_str": date_str,
+        "variable": variable,
+        "lats": lats.tolist(),
+        "lons": lons.tolist(),
+        "values": [[None if np.isnan(v) else float(v) for v in row] for row in values],
     })
+ 
+@app.route("/climatology", methods=["GET"])
+@limit_concurrency
+def climatology():
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    date_str = request.args.get("date_str")
+    if lat is None or lon is None or date_str is None:
+        return jsonify({"error": "lat, lon, and date_str are required"}), 400
+    try:
+        clim = get_climatology(lat, lon, date_str)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({**climatology_to_json(clim), "location": location_echo(lat, lon)})
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus text exposition (per process: scrape every worker or aggregate upstream)."""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+ 
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    store = model_store.stats() if model_store is not None else None
+    if power_cache is None:
+        return jsonify({"enabled": False, "model_store": store})
+    return jsonify({"enabled": True, **power_cache.stats(), "model_store": store})
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    # Development server only; production: gunicorn -c gunicorn.conf.py wsgi:app
+    app.run(host=os.environ.get("WIR_HOST", "127.0.0.1"), port=int(os.environ.get("WIR_PORT", "5000")),
+            debug=os.environ.get("WIR_DEBUG", "0") == "1", threaded=True)
\ No newline at end of file
@@ -0,0 +1,283 @@
+# test_api.py
+# Endpoint behaviour against bench.FakePower (a local stand-in for NASA POWER), with fresh caches per module.
+#   cd backend && python -m pytest -q test_api.py
+import json
+import os
+import tempfile
+from urllib.parse import urlencode
+
+_scratch = tempfile.mkdtemp(prefix="wir-test-")
+for _var in ("WIR_CACHE_DIR", "WIR_STORE_DIR", "WIR_REGIONS_DIR"):
+    os.environ.setdefault(_var, os.path.join(_scratch, _var.lower()))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import bench
+import power_client
+import temp
+from power_cache import PowerCache
+from shared_store import SharedStore
+
+LAT, LON = 41.7, 44.8
+
+
+@pytest.fixture(scope="module")
+def fake():
+    server = bench.FakePower().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope="module")
+def client(fake, tmp_path_factory):
+    """temp.app's test client reading the fake POWER through fresh disk / store / memory caches."""
+    root = tmp_path_factory.mktemp("api")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(temp, "power_client", power_client.PowerClient(base_url=fake.url))
+        mp.setattr(temp, "power_cache", PowerCache(root=str(root / "power_cache")) if temp.USE_DISK_CACHE else None)
+        mp.setattr(temp, "model_store", SharedStore(root=str(root / "model_store")) if temp.USE_SHARED_STORE else None)
+        mp.setattr(temp, "USE_REGION_STORES", False)
+        temp.clear_memory_caches()
+        yield temp.app.test_client()
+    temp.clear_memory_caches()
+
+
+def predict(client, **body):
+    r = client.post("/predict_all", json={"lat": LAT, "lon": LON, **body})
+    assert r.status_code == 200, r.get_data(as_text=True)
+    return r.json
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+
+# ---- /predict_batch ----
+def test_batch_matches_predict_all(client):
+    queries = [{"lat": LAT, "lon": LON, "date_str": "2025-06-10"},
+               {"lat": 43.1, "lon": 41.2, "date_str": "2025-01-15"},
+               {"lat": LAT, "lon": LON, "date_str": "2025-06-11"}]
+    r = client.post("/predict_batch", json={"queries": queries})
+    assert r.status_code == 200
+    lines = sorted(ndjson(r), key=lambda line: line["index"])
+    assert [line["index"] for line in lines] == [0, 1, 2]
+    for q, line in zip(queries, lines):
+        expected = predict(client, lat=q["lat"], lon=q["lon"], date_str=q["date_str"])
+        assert (line["lat"], line["lon"], line["date_str"]) == (q["lat"], q["lon"], q["date_str"])
+        for key in ("precipitation", "temperature", "wind", "location"):
+            assert line[key] == expected[key]
+
+
+def test_batch_reports_bad_queries_by_index(client):
+    r = client.post("/predict_batch", json=[{"lat": LAT, "lon": LON, "date_str": "2025-06-10"},
+                                            {"lat": LAT, "date_str": "2025-06-10"},
+                                            {"lat": LAT, "lon": LON, "date_str": "not a date"}])
+    lines = {line["index"]: line for line in ndjson(r)}
+    assert set(lines) == {0, 1, 2}
+    assert "precipitation" in lines[0]
+    assert "error" in lines[1] and "error" in lines[2]
+
+
+@pytest.mark.parametrize("body", [[], {"queries": []}, {"queries": "x"},
+                                  [{"lat": LAT, "lon": LON, "date_str": "2025-06-10"}] * (temp.BATCH_MAX_QUERIES + 1)])
+def test_batch_rejects_empty_and_oversized(client, body):
+    assert client.post("/predict_batch", json=body).status_code == 400
+
+
+# ---- /predict_range ----
+def test_range_matches_predict_all_across_new_year(client):
+    r = client.post("/predict_range", json={"lat": LAT, "lon": LON,
+                                            "start_date": "2025-12-30", "end_date": "2026-01-02"})
+    assert r.status_code == 200
+    body = r.json
+    assert body["dates"] == ["2025-12-30", "2025-12-31", "2026-01-01", "2026-01-02"]
+    for i, date in enumerate(body["dates"]):
+        expected = predict(client, date_str=date)
+        for group in ("precipitation", "temperature", "wind"):
+            assert {k: v[i] for k, v in body[group].items()} == expected[group]
+
+
+@pytest.mark.parametrize("start_date, end_date", [("2025-06-10", "2025-06-09"), ("2025-01-01", "2026-01-02"),
+                                                  ("2025-06-10", "not a date")])
+def test_range_rejects_bad_spans(client, start_date, end_date):
+    r = client.post("/predict_range", json={"lat": LAT, "lon": LON, "start_date": start_date, "end_date": end_date})
+    assert r.status_code == 400
+
+
+# ---- /predict_grid ----
+GRID = {"bbox": "41,44,42,45.5", "date_str": "2025-06-10"}
+
+
+def test_grid_cells_match_predict_all(client):
+    r = client.get("/predict_grid", query_string={**GRID, "fetch": "1"})
+    assert r.status_code == 200
+    body = r.json
+    assert body["lats"] == sorted(body["lats"], reverse=True)
+    for lat, row in zip(body["lats"], body["values"]):
+        for lon, value in zip(body["lons"], row):
+            expected = predict(client, lat=lat, lon=lon, date_str=GRID["date_str"])["precipitation"]["Final Rain"]
+            assert value == pytest.approx(expected, rel=1e-6)
+
+
+def test_grid_repeat_and_f32_are_served_locally(client, fake):
+    body = client.get("/predict_grid", query_string={**GRID, "fetch": "1"}).json
+    before = fake.requests
+    r = client.get("/predict_grid", query_string={**GRID, "format": "f32"})
+    assert r.status_code == 200 and fake.requests == before
+    assert r.headers["X-Grid-Lats"] == f"{body['lats'][0]},{body['lats'][-1]}"
+    rows, cols = (int(n) for n in r.headers["X-Grid-Shape"].split(","))
+    got = np.frombuffer(r.data, dtype="<f4").reshape(rows, cols)
+    np.testing.assert_allclose(got, np.array(body["values"], dtype=float), rtol=1e-6)
+
+
+def test_grid_without_fetch_leaves_unknown_cells_empty(client, fake):
+    before = fake.requests
+    r = client.get("/predict_grid", query_string={"bbox": "-10,-60,-9,-59", "date_str": "2025-06-10"})
+    assert r.status_code == 200 and fake.requests == before
+    assert all(v is None for row in r.json["values"] for v in row)
+
+
+@pytest.mark.parametrize("query", [{"bbox": "42,44,41,45"}, {"bbox": "10,170,12,-170"}, {"bbox": "41,44"},
+                                   {"bbox": "-60,-180,60,180", "fetch": "1"}, {"bbox": "41,44,42,45", "variable": "x"}])
+def test_grid_rejects_bad_requests(client, query):
+    assert client.get("/predict_grid", query_string={"date_str": "2025-06-10", **query}).status_code == 400
+
+
+# ---- GET /predict_all: canonical redirect + ETag ----
+def test_get_redirects_then_revalidates(client):
+    r = client.get("/predict_all", query_string={"lat": LAT, "lon": LON, "date_str": "2025-6-10"})
+    assert r.status_code == 308
+    location = r.headers["Location"]
+    assert location == "/predict_all?" + urlencode({"lat": "41.5", "lon": "45", "date_str": "2025-06-10"})
+    assert client.get(location).status_code == 200   # already canonical: no further redirect
+
+    r = client.get(location)
+    etag = r.headers["ETag"]
+    assert r.headers["Cache-Control"] == f"public, max-age={temp.RESPONSE_MAX_AGE_S}"
+    assert r.json == predict(client, lat=41.5, lon=45.0, date_str="2025-06-10")
+
+    r = client.get(location, headers={"If-None-Match": etag})
+    assert r.status_code == 304 and not r.data and r.headers["ETag"] == etag
+    assert client.get(location, headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_get_window_with_unfinished_year_is_short_lived(client):
+    day = f"{pd.Timestamp.today().year + 1}-03-01"   # history ends with the current year
+    lat, lon, _ = temp.canonical_query(LAT, LON, day)
+    r = client.get(f"/predict_all?lat={temp.format_coord(lat)}&lon={temp.format_coord(lon)}&date_str={day}")
+    assert r.status_code == 200
+    assert r.headers["Cache-Control"] == f"public, max-age={temp.RESPONSE_MAX_AGE_PARTIAL_S}"
+
+
+# ---- bootstrap bands ----
+def test_uncertainty_bands_are_ordered_and_reproducible(client):
+    body = predict(client, date_str="2025-06-10", uncertainty=50)
+    bands = body["uncertainty"]
+    assert bands["replicates"] == 50
+    for group in ("precipitation", "temperature", "wind"):
+        assert set(bands[group]) == set(body[group])
+        for band in bands[group].values():
+            assert band["p5"] <= band["p50"] <= band["p95"]
+    temp.clear_memory_caches()
+    assert predict(client, date_str="2025-06-10", uncertainty=50)["uncertainty"] == bands
+
+
+@pytest.mark.parametrize("value, message", [("abc", "uncertainty must be an integer"), ("-3", None),
+                                            (temp.BOOTSTRAP_MAX_REPLICATES + 1, None)])
+def test_uncertainty_rejects_bad_replicate_counts(client, value, message):
+    r = client.post("/predict_all", json={"lat": LAT, "lon": LON, "date_str": "2025-06-10", "uncertainty": value})
+    assert r.status_code == 400
+    if message:
+        assert r.json["error"] == message
+
+
+# ---- history_years / year_weighting ----
+def test_history_defaults_are_the_preset_model(client):
+    preset = predict(client, date_str="2025-06-10")
+    assert predict(client, date_str="2025-06-10", history_years=temp.ROLLING_YEARS, year_weighting="default") == preset
+    assert "history" not in preset
+
+
+def test_history_window_is_echoed_and_weighted(client):
+    equal = predict(client, date_str="2025-06-10", history_years=30, year_weighting="equal")
+    assert equal["history"] == {"history_years": 30, "year_weighting": "equal", "first_year": 1995, "end_year": 2024}
+    flat = predict(client, date_str="2025-06-10", history_years=30, year_weighting="exponential", half_life=1e9)
+    assert flat["history"]["half_life"] == 1e9
+    for group in ("precipitation", "temperature", "wind"):
+        assert flat[group] == pytest.approx(equal[group], rel=1e-6, abs=1e-9)
+    recent = predict(client, date_str="2025-06-10", history_years=30, year_weighting="exponential", half_life=2)
+    assert recent["temperature"] != pytest.approx(equal["temperature"], rel=1e-6)
+
+
+@pytest.mark.parametrize("params, message", [
+    ({"history_years": "abc"}, "history_years must be an integer"),
+    ({"history_years": 45}, "history_years=45 exceeds the 44 years of NASA POWER record (1981 on) before 2025-06-10"),
+    ({"history_years": 0}, "history_years must be at least 1"),
+    ({"year_weighting": "cubic"}, None),
+    ({"year_weighting": "exponential", "half_life": "abc"}, "half_life must be a number"),
+    ({"year_weighting": "exponential", "half_life": -1}, "half_life must be positive"),
+])
+def test_history_rejects_bad_parameters(client, params, message):
+    r = client.post("/predict_all", json={"lat": LAT, "lon": LON, "date_str": "2025-06-10", **params})
+    assert r.status_code == 400
+    if message:
+        assert r.json["error"] == message
+    r = client.get("/predict_all", query_string={"lat": "41.5", "lon": "45", "date_str": "2025-06-10", **params})
+    assert r.status_code == 400
+
+
+# ---- custom thresholds / bins ----
+def window_samples(fake, variable, date_str, n_years=temp.ROLLING_YEARS):
+    """Reference: every value of the cell's history window within the variable's DOY half width of date_str."""
+    column, half_width, missing = temp.THRESHOLD_VARIABLES[variable]
+    lat, lon = temp.grid_cell(LAT, LON)
+    _, _, start_year, end_year = temp.compute_history_window(date_str, rolling_years=n_years)
+    history = fake.frame(lat, lon).loc[f"{start_year}-01-01":f"{end_year}-12-31", column]
+    if missing is not None:
+        history = history.fillna(missing)
+    doy0 = np.minimum(history.index.dayofyear, 365) - 1
+    target = min(pd.Timestamp(date_str).dayofyear, 365) - 1
+    distance = np.abs(doy0 - target)
+    return history[np.minimum(distance, 365 - distance) <= half_width].dropna().to_numpy()
+
+
+def test_custom_classes_match_window_samples(client, fake):
+    body = predict(client, date_str="2025-06-10", thresholds={"precipitation": [15, 0.5]},
+                   bins={"temperature": "15,25"})
+    rain = window_samples(fake, "precipitation", "2025-06-10")
+    assert body["custom"]["precipitation"]["samples"] == len(rain)
+    assert body["custom"]["precipitation"]["exceedance"] == [
+        {"threshold": t, "percent": pytest.approx(100.0 * np.mean(rain >= t))} for t in (0.5, 15.0)]
+    heat = window_samples(fake, "temperature", "2025-06-10")
+    bins = body["custom"]["temperature"]["bins"]
+    assert [(b["lo"], b["hi"]) for b in bins] == [(None, 15.0), (15.0, 25.0), (25.0, None)]
+    assert [b["percent"] for b in bins] == pytest.approx([100.0 * np.mean(heat < 15),
+                                                          100.0 * np.mean((heat >= 15) & (heat < 25)),
+                                                          100.0 * np.mean(heat >= 25)])
+    assert sum(b["percent"] for b in bins) == pytest.approx(100.0)
+
+
+def test_custom_classes_get_is_canonical(client):
+    r = client.get("/predict_all", query_string={"lat": LAT, "lon": LON, "date_str": "2025-06-10",
+                                                 "thresholds.precipitation": "15,0.5"})
+    assert r.status_code == 308
+    r = client.get(r.headers["Location"])
+    assert r.status_code == 200
+    assert r.json["custom"] == predict(client, lat=41.5, lon=45.0, date_str="2025-06-10",
+                                       thresholds={"precipitation": [0.5, 15]})["custom"]
+
+
+@pytest.mark.parametrize("body, message", [
+    ({"thresholds": {"precipitation": "1,abc"}}, "thresholds.precipitation must be a number"),
+    ({"thresholds": {"snow": [1]}}, "unknown thresholds variable 'snow'"),
+    ({"thresholds": [1, 2]}, None),
+    ({"bins": {"temperature": [25, 15]}}, "bins.temperature must be strictly increasing"),
+    ({"bins": {"wind": list(range(temp.MAX_CUSTOM_THRESHOLDS + 1))}}, None),
+])
+def test_custom_classes_reject_bad_specs(client, body, message):
+    r = client.post("/predict_all", json={"lat": LAT, "lon": LON, "date_str": "2025-06-10", **body})
+    assert r.status_code == 400
+    if message:
+        assert r.json["error"] == message
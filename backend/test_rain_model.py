@@ -0,0 +1,157 @@
+# test_rain_model.py
+# The vectorized model paths must match the original row-by-row / per-year loop implementations
+# (kept below as references) on synthetic history with missing days and leap years.
+#   cd backend && python -m pytest -q test_rain_model.py
+import os
+import tempfile
+from datetime import timedelta
+
+_scratch = tempfile.mkdtemp(prefix="wir-test-")
+for _var in ("WIR_CACHE_DIR", "WIR_STORE_DIR", "WIR_REGIONS_DIR"):
+    os.environ.setdefault(_var, os.path.join(_scratch, _var.lower()))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import temp
+
+TARGET_DATES = ["2024-01-01", "2024-02-28", "2024-02-29", "2024-03-01", "2024-07-15", "2024-12-31"]
+
+
+@pytest.fixture(scope="module")
+def frame():
+    """Daily PRECTOTCORR / T2M_MAX / WS10M_MAX for 2000..2024 with scattered NaNs and one missing month."""
+    rng = np.random.default_rng(7)
+    days = pd.date_range("2000-01-01", "2024-12-31", freq="D")
+    season = np.cos(2 * np.pi * (days.dayofyear.to_numpy() - 200) / 365.25)
+    precip = rng.gamma(0.5, 8.0, len(days)) * (rng.random(len(days)) < 0.35 + 0.15 * season)
+    df = pd.DataFrame({
+        "PRECTOTCORR": precip,
+        "T2M_MAX": 15.0 + 14.0 * season + rng.normal(0.0, 5.0, len(days)),
+        "WS10M_MAX": rng.gamma(3.0, 1.5, len(days)),
+    }, index=days)
+    for column in df.columns:
+        df.loc[rng.random(len(days)) < 0.02, column] = np.nan
+    df.loc["2012-02-10":"2012-03-10"] = np.nan
+    return df
+
+
+@pytest.fixture(scope="module")
+def window(frame):
+    """The 20-year history window of 2024 targets (2004..2023)."""
+    return frame.loc["2004-01-01":"2023-12-31"]
+
+
+# ---- references: the original loop implementations ----
+def legacy_monthly_markov(df):
+    x = df.sort_values("date").copy()
+    x["wet_prev"] = x["wet"].shift(1)
+    valid = x.dropna(subset=["wet_prev"]).copy()
+    out = {}
+    for m in range(1, 13):
+        vm = valid[valid["month"] == m]
+        den_w = int((vm["wet_prev"] == 1).sum())
+        den_d = int((vm["wet_prev"] == 0).sum())
+        num_ww = int(((vm["wet_prev"] == 1) & (vm["wet"] == 1)).sum())
+        num_dw = int(((vm["wet_prev"] == 0) & (vm["wet"] == 1)).sum())
+        out[m] = {"P_W_given_W": num_ww / den_w if den_w > 0 else np.nan,
+                  "P_W_given_D": num_dw / den_d if den_d > 0 else np.nan,
+                  "den_Wprev": den_w, "den_Dprev": den_d}
+    return out
+
+
+def legacy_category_probabilities(df, target_date, column, categories, categorizer,
+                                  last_n_years=temp.ROLLING_YEARS, half_window_days=temp.TW_HALF_WINDOW_DAYS):
+    anchor = pd.to_datetime(target_date)
+    year_distributions, year_weights = [], []
+    for i, y in enumerate(range(anchor.year - 1, anchor.year - last_n_years - 1, -1)):
+        year_weights.append(last_n_years - i)
+        try:
+            anchor_y = anchor.replace(year=y)
+        except ValueError:
+            anchor_y = anchor.replace(year=y, day=28)
+        start_y = max(pd.Timestamp(y, 1, 1), anchor_y - timedelta(days=half_window_days))
+        end_y = min(pd.Timestamp(y, 12, 31), anchor_y + timedelta(days=half_window_days))
+        sub = df.loc[start_y:end_y, [column]].copy()
+        if sub.empty:
+            year_weights[-1] = 0
+            continue
+        day_diff = ((sub.index - anchor_y) / pd.Timedelta(days=1)).astype(float)
+        sub["Day_Weight"] = np.clip(half_window_days - np.abs(day_diff) + 1, 0, None)
+        sub["Category"] = sub[column].apply(categorizer)
+        valid = sub.dropna(subset=["Category", column])
+        if valid.empty:
+            year_weights[-1] = 0
+            continue
+        weighted_counts = valid.groupby("Category")["Day_Weight"].sum().reindex(categories, fill_value=0.0)
+        total = weighted_counts.sum()
+        if total <= 0:
+            year_weights[-1] = 0
+            continue
+        year_distributions.append(100.0 * weighted_counts / total)
+    if not year_distributions:
+        return None
+    df_years = pd.concat(year_distributions, axis=1)
+    year_weights = np.array(year_weights[:df_years.shape[1]])
+    return ((df_years * year_weights).sum(axis=1) / year_weights.sum()).to_numpy()
+
+
+# ---- tests ----
+def test_calendar_and_flags_match_rowwise(frame):
+    df = temp.add_calendar_and_flags(pd.DataFrame({"date": frame.index, "precip_mm": frame["PRECTOTCORR"].to_numpy()}))
+    assert list(df["class"].astype(str)) == [temp.classify_intensity(x) for x in frame["PRECTOTCORR"]]
+    np.testing.assert_array_equal(df["doy"], np.where(frame.index.dayofyear == 366, 365, frame.index.dayofyear))
+    np.testing.assert_array_equal(df["wet"], (frame["PRECTOTCORR"] >= temp.NO_RAIN_THRESHOLD).astype(int))
+    np.testing.assert_array_equal(temp.rain_frame(frame)["class"].astype(str), df["class"].astype(str))
+
+
+def test_monthly_markov_matches_loop(frame):
+    df = pd.DataFrame({"date": frame.index, "month": frame.index.month,
+                       "wet": (frame["PRECTOTCORR"] >= temp.NO_RAIN_THRESHOLD).astype(int).to_numpy()})
+    expected = legacy_monthly_markov(df)
+    got = temp.markov_probs(temp.monthly_markov(df.sample(frac=1.0, random_state=1)))   # unsorted input
+    for m in range(1, 13):
+        for k, v in expected[m].items():
+            np.testing.assert_equal(got[k][m - 1], v)
+
+
+@pytest.mark.parametrize("variable", ["temperature", "wind"])
+def test_category_probabilities_match_loop(frame, variable):
+    column, categories, categorizer = temp.CATEGORY_VARIABLES[variable]
+    for date in TARGET_DATES:
+        expected = legacy_category_probabilities(frame, date, column, categories, categorizer)
+        _, got = temp.category_probabilities_weighted_days(frame, date.replace("-", ""), column, categories,
+                                                           categorizer=categorizer)
+        np.testing.assert_allclose(np.asarray(got, dtype=float), expected, rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize("y_infer_mode", ["yday_climo", "prev_year_yesterday"])
+def test_climatology_table_matches_level2_rain(window, y_infer_mode):
+    clim = temp.build_climatology(window, 2023)
+    got = temp.rain_from_climatology_many(clim, pd.to_datetime(TARGET_DATES), y_infer_mode=y_infer_mode)
+    for i, date in enumerate(TARGET_DATES):
+        expected = temp.level2_rain(0.0, 0.0, date, window, y_infer_mode=y_infer_mode)
+        for k, v in expected.items():
+            np.testing.assert_allclose(got[k][i], np.nan if v is None else v, rtol=1e-12, atol=1e-15)
+
+
+def test_climatology_table_matches_seasonal_probs(window):
+    clim = temp.build_climatology(window, 2023)
+    df = temp.rain_frame(window)
+    for date in TARGET_DATES:
+        season = temp.seasonal_probs(df, date)
+        row = clim["rain"].loc[season["target_doy"]]
+        assert row["n_climo"] == season["n_climo"]
+        np.testing.assert_allclose(row["p_climo"], season["p_climo"], rtol=1e-12)
+        np.testing.assert_allclose(row["f_heavy_given_wet"], season["cond_wet_split"]["f_heavy_given_wet"], rtol=1e-12)
+
+
+@pytest.mark.parametrize("variable", ["temperature", "wind"])
+def test_climatology_table_matches_category_loop(window, variable):
+    column, categories, categorizer = temp.CATEGORY_VARIABLES[variable]
+    clim = temp.build_climatology(window, 2023)
+    _, probs = temp.categories_from_climatology_many(clim, pd.to_datetime(TARGET_DATES), variable)
+    for i, date in enumerate(TARGET_DATES):
+        expected = legacy_category_probabilities(window, date, column, categories, categorizer)
+        np.testing.assert_allclose(probs[i], expected, rtol=1e-12, atol=1e-12)
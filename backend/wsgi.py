@@ -0,0 +1,5 @@
+# wsgi.py
+# Production entry point (one app instance per worker process):
+#   cd backend && gunicorn -c gunicorn.conf.py wsgi:app
+# History (power_cache.py) and model tables (shared_store.py) live on disk, so workers share them.
+from temp import app  # noqa: F401